@@ -1,6 +1,6 @@
 from ._version import __version__
 from .mesh import CatalogMesh, ArrayMesh, ParticleMesh
-from .fft_power import CatalogFFTPower, MeshFFTPower, PowerSpectrumWedges, PowerSpectrumMultipoles, PowerSpectrumStatistics
+from .fft_power import CatalogFFTPower, MeshFFTPower, PowerSpectrumWedges, PowerSpectrumMultipoles, PowerSpectrumStatistics, clear_cache
 from .fft_residual import CatalogFFTResidual
 from .direct_power import DirectPower
 from .wide_angle import Projection, BaseMatrix, CorrelationFunctionOddWideAngleMatrix, PowerSpectrumOddWideAngleMatrix
@@ -5,11 +5,12 @@ This should be mostly used to sum over pairs at small separations, otherwise the
 
 import os
 import time
+import functools
 
 import numpy as np
 from scipy import special
 
-from .utils import BaseClass
+from .utils import BaseClass, _numba_min_size
 from . import mpi, utils
 
 
@@ -29,6 +30,38 @@ def _vlogical_and(*arrays):
     return toret
 
 
+@functools.lru_cache(maxsize=1)
+def _get_inverse_probability_weight_kernel():
+    # numba kernel accumulating noffset + popcount(weight1 & weight2) for one bitwise weight (column) into denom,
+    # with the hardware popcount (llvm.ctpop); for the last bitwise weight, nrealizations / denom
+    # (default_value if the denominator is 0) is directly written to out, such that no other temporary is needed;
+    # None if numba is not available
+    try: import numba
+    except ImportError: return None
+    from numba.extending import intrinsic
+
+    @intrinsic
+    def popcount(typingctx, value):
+        if not isinstance(value, numba.types.Integer): return None
+
+        def codegen(context, builder, signature, args):
+            return builder.ctpop(args[0])
+
+        return value(value), codegen
+
+    @numba.njit(parallel=True)
+    def kernel(weight1, weight2, noffset, nrealizations, default_value, denom, out, first, last):
+        for i in numba.prange(weight1.size):
+            tmp = np.int64(popcount(weight1[i] & weight2[i]))
+            if first: tmp += noffset
+            else: tmp += denom[i]
+            if not last: denom[i] = tmp
+            elif tmp == 0: out[i] = default_value
+            else: out[i] = nrealizations / tmp
+
+    return kernel
+
+
 def get_inverse_probability_weight(*weights, noffset=1, nrealizations=None, default_value=0., dtype='f8'):
     r"""
     Return inverse probability weight given input bitwise weights.
@@ -59,19 +92,33 @@ def get_inverse_probability_weight(*weights, noffset=1, nrealizations=None, defa
     """
     if nrealizations is None:
         nrealizations = get_default_nrealizations(weights[0])
+    arrays = [array for weight in weights for array in weight]
+    if arrays[0].size >= _numba_min_size and all(array.ndim == 1 and array.dtype.kind in 'iu' and array.size == arrays[0].size for array in arrays):
+        kernel = _get_inverse_probability_weight_kernel()
+        if kernel is not None:
+            toret = np.empty(arrays[0].shape, dtype=dtype)
+            columns = list(zip(*weights))
+            denom = np.empty(arrays[0].shape if len(columns) > 1 else 0, dtype='i8')
+            for icolumn, column in enumerate(columns):
+                # Viewed as unsigned, such that bitwise operations in numba do not extend the sign bit
+                column = [array.view('u{:d}'.format(array.dtype.itemsize)) for array in column]
+                if len(column) > 2: column = [_vlogical_and(*column[:-1]), column[-1]]
+                kernel(column[0], column[-1], noffset, nrealizations, default_value, denom, toret, icolumn == 0, icolumn == len(columns) - 1)
+            return toret
     # denom = noffset + sum(utils.popcount(w1 & w2) for w1, w2 in zip(*weights))
-    denom = noffset + sum(utils.popcount(_vlogical_and(*weight)) for weight in zip(*weights))
+    # Bit counts are accumulated in place; no & (hence no copy) needed for a single set of weights
+    denom = utils.popcount(*[_vlogical_and(*weight) if len(weight) > 1 else weight[0] for weight in zip(*weights)])
+    denom += noffset
     mask = denom == 0
-    denom[mask] = 1
-    toret = np.empty_like(denom, dtype=dtype)
-    toret[...] = nrealizations / denom
-    toret[mask] = default_value
+    toret = np.full_like(denom, default_value, dtype=dtype)
+    np.divide(nrealizations, denom, out=toret, where=~mask)
     return toret
 
 
-def _format_positions(positions, position_type='xyz', dtype=None, copy=True, mpicomm=None, mpiroot=None):
-    # Format input array of positions
+def _format_all_positions(all_positions, position_type='xyz', dtype=None, copy=True, mpicomm=None, mpiroot=None):
+    # Format list of input arrays of positions (or None)
     # position_type in ["xyz", "rdd", "pos"]
+    # Errors are gathered and, if mpiroot is not None, positions are scattered, for all arrays at once
 
     def __format_positions(positions):
         if position_type == 'pos':  # array of shape (N, 3)
@@ -103,10 +150,15 @@ def _format_positions(positions, position_type='xyz', dtype=None, copy=True, mpi
             return None, 'Position type should be one of ["pos", "xyz", "rdd"]'
         return np.asarray(positions).T, None
 
-    error = None
+    all_positions, error = list(all_positions), None
     if mpiroot is None or (mpicomm.rank == mpiroot):
-        if positions is not None and (position_type == 'pos' or not all(position is None for position in positions)):
-            positions, error = __format_positions(positions)  # return error separately to raise on all processes
+        for ipositions, positions in enumerate(all_positions):
+            if positions is not None and (position_type == 'pos' or not all(position is None for position in positions)):
+                positions, error = __format_positions(positions)  # return error separately to raise on all processes
+                if error is not None: break
+            else:
+                positions = None
+            all_positions[ipositions] = positions
     if mpicomm is not None:
         error = mpicomm.allgather(error)
     else:
@@ -114,9 +166,29 @@ def _format_positions(positions, position_type='xyz', dtype=None, copy=True, mpi
     errors = [err for err in error if err is not None]
     if errors:
         raise ValueError(errors[0])
-    if mpiroot is not None and mpicomm.bcast(positions is not None if mpicomm.rank == mpiroot else None, root=mpiroot):
-        positions = mpi.scatter_array(positions, mpicomm=mpicomm, root=mpiroot)
-    return positions
+    if mpiroot is not None:
+        # Sizes and dtypes of all arrays (None if no array)
+        attrs = [(len(positions), positions.dtype) if positions is not None else None for positions in all_positions] if mpicomm.rank == mpiroot else None
+        attrs = mpicomm.bcast(attrs, root=mpiroot)
+        indices = [ii for ii, attr in enumerate(attrs) if attr is not None]
+        if len(indices) == 1 or len(set(attrs[ii][1] for ii in indices)) > 1:
+            # Single array or different dtypes, scatter arrays one by one
+            for ii in indices:
+                all_positions[ii] = mpi.scatter_array(all_positions[ii], mpicomm=mpicomm, root=mpiroot)
+        elif indices:
+            # Single scatter: the chunks of all arrays that go to each rank are contiguous
+            bounds = [[rank * attrs[ii][0] // mpicomm.size for rank in range(mpicomm.size + 1)] for ii in indices]
+            counts = [sum(bound[rank + 1] - bound[rank] for bound in bounds) for rank in range(mpicomm.size)]
+            data = None
+            if mpicomm.rank == mpiroot:
+                data = np.concatenate([all_positions[ii][bound[rank]:bound[rank + 1]] for rank in range(mpicomm.size) for ii, bound in zip(indices, bounds)], axis=0)
+            data = mpi.scatter_array(data, counts=counts, mpicomm=mpicomm, root=mpiroot)
+            rank = mpicomm.rank
+            data = np.split(data, np.cumsum([bound[rank + 1] - bound[rank] for bound in bounds])[:-1], axis=0)
+            for ii, positions in zip(indices, data): all_positions[ii] = positions
+        for ii, attr in enumerate(attrs):
+            if attr is None: all_positions[ii] = None
+    return all_positions
 
 
 def _format_weights(weights, weight_type='auto', size=None, dtype=None, copy=True, mpicomm=None, mpiroot=None):
@@ -405,12 +477,11 @@ class BaseDirectPowerEngine(BaseClass, metaclass=RegisteredDirectPowerEngine):
         if position_type is not None: position_type = position_type.lower()
         self.position_type = position_type
 
-        self.positions1 = _format_positions(positions1, position_type=self.position_type, dtype=self.dtype, copy=False, mpicomm=self.mpicomm, mpiroot=mpiroot)
-        self.positions2 = _format_positions(positions2, position_type=self.position_type, dtype=self.dtype, copy=False, mpicomm=self.mpicomm, mpiroot=mpiroot)
+        self.positions1, self.positions2 = _format_all_positions([positions1, positions2], position_type=self.position_type, dtype=self.dtype, copy=False, mpicomm=self.mpicomm, mpiroot=mpiroot)
         self.autocorr = self.positions2 is None
-        self.size1 = self.size2 = self.mpicomm.allreduce(len(self.positions1))
+        self.size1 = self.size2 = mpi._allreduce_int(len(self.positions1), mpicomm=self.mpicomm)
         if not self.autocorr:
-            self.size2 = self.mpicomm.allreduce(len(self.positions2))
+            self.size2 = mpi._allreduce_int(len(self.positions2), mpicomm=self.mpicomm)
 
     def _set_weights(self, weights1, weights2=None, weight_type='auto', twopoint_weights=None, weight_attrs=None, mpiroot=None):
 
@@ -493,7 +564,11 @@ class BaseDirectPowerEngine(BaseClass, metaclass=RegisteredDirectPowerEngine):
                     sep, weight = twopoint_weights
             # just to make sure we use the correct dtype
             sep = np.cos(np.radians(np.array(sep, dtype=self.dtype)))
-            argsort = np.argsort(sep)
+            # Angular separations are usually provided in increasing order, i.e. decreasing cos: reverse instead of sorting
+            diff = np.diff(sep)
+            if np.all(diff >= 0): argsort = slice(None)
+            elif np.all(diff <= 0): argsort = slice(None, None, -1)
+            else: argsort = np.argsort(sep)
             self.cos_twopoint_weights = TwoPointWeight(sep=np.array(sep[argsort], dtype=self.dtype), weight=np.array(weight[argsort], dtype=self.dtype))
 
     def _get_inverse_probability_weight(self, *weights):
@@ -5,14 +5,13 @@ import os
 import time
 
 import numpy as np
-from scipy.interpolate import UnivariateSpline, RectBivariateSpline
 from scipy import special
 from pmesh.pm import RealField, ComplexField
 
 from .utils import BaseClass
 from . import mpi, utils
-from .mesh import CatalogMesh, _get_real_dtype, _get_mesh_attrs, _wrap_positions
-from .fft_power import MeshFFTBase, get_real_Ylm, _transform_rslab, _format_positions, _format_all_weights, project_to_basis, _nan_to_zero, find_unique_edges
+from .mesh import CatalogMesh, _get_real_dtype, _get_mesh_attrs, _wrap_positions, _positions_in_box
+from .fft_power import MeshFFTBase, get_real_Ylm, _transform_rslab, _format_all_positions, _format_all_weights, _CATALOGS, project_to_basis, _nan_to_zero, find_unique_edges, _deepcopy_statistics, _format_array, _interp_linear, _select_parts, _get_ell_indices, _get_formatter, _conj_mul_inplace, _apply_Ylm, _normalize_vectors
 
 
 class BaseCorrelationFunctionStatistics(BaseClass):
@@ -183,7 +182,7 @@ class BaseCorrelationFunctionStatistics(BaseClass):
         if method is None:
             axes_to_sum_over = tuple(ii for ii in range(self.ndim) if ii != axis)
             with np.errstate(divide='ignore', invalid='ignore'):
-                toret = np.sum(_nan_to_zero(self.modes[axis]) * self.nmodes, axis=axes_to_sum_over) / np.sum(self.nmodes, axis=axes_to_sum_over)
+                toret = np.sum(_nan_to_zero(self.modes[axis], weights=self.nmodes), axis=axes_to_sum_over) / np.sum(self.nmodes, axis=axes_to_sum_over)
         elif isinstance(method, str):
             allowed_methods = ['mid']
             method = method.lower()
@@ -294,11 +293,11 @@ class BaseCorrelationFunctionStatistics(BaseClass):
             if array is None: continue
             if isinstance(array, list):
                 with np.errstate(divide='ignore', invalid='ignore'):
-                    array = [utils.rebin(_nan_to_zero(arr) * nmodes, new_shape, statistic=np.sum) / self.nmodes for arr in array]
+                    array = [utils.rebin(_nan_to_zero(arr, weights=nmodes), new_shape, statistic=np.sum) / self.nmodes for arr in array]
             else:
                 extradim = array.ndim > self.ndim
                 with np.errstate(divide='ignore', invalid='ignore'):
-                    array = np.asarray([utils.rebin(_nan_to_zero(arr) * nmodes, new_shape, statistic=np.sum) / self.nmodes for arr in array.reshape((-1,) + self.shape)])
+                    array = np.asarray([utils.rebin(_nan_to_zero(arr, weights=nmodes), new_shape, statistic=np.sum) / self.nmodes for arr in array.reshape((-1,) + self.shape)])
                     array.shape = (-1,) * extradim + new_shape
             setattr(self, name, array)
         self.edges = [edges[::f] for edges, f in zip(self.edges, factor)]
@@ -323,11 +322,7 @@ class BaseCorrelationFunctionStatistics(BaseClass):
         return new
 
     def deepcopy(self):
-        import copy
-        new = copy.deepcopy(self)
-        if hasattr(self, 'mpicomm'):
-            new.mpicomm = self.mpicomm
-        return new
+        return _deepcopy_statistics(self)
 
     @classmethod
     def sum(cls, *others):
@@ -389,14 +384,7 @@ class BaseCorrelationFunctionStatistics(BaseClass):
         if not self.with_mpi or self.mpicomm.rank == 0:
             self.log_info('Saving {}.'.format(filename))
             utils.mkdir(os.path.dirname(filename))
-            formatter = {'int_sind': lambda x: '%d' % x, 'float_sind': lambda x: fmt % x}
-
-            def complex_sind(x):
-                imag = fmt % x.imag
-                if imag[0] not in ['+', '-']: imag = '+' + imag
-                return '{}{}j'.format(fmt % x.real, imag)
-
-            formatter['complex_sind'] = complex_sind
+            formatter = _get_formatter(fmt=fmt)
             if header is None: header = []
             elif isinstance(header, str): header = [header]
             else: header = list(header)
@@ -409,6 +397,9 @@ class BaseCorrelationFunctionStatistics(BaseClass):
                     value = 'None'
                 elif any(name.startswith(key) for key in ['los_type', 'resampler']):
                     value = str(value)
+                elif np.ndim(value) == 0 and np.asarray(value).dtype.kind in 'iufc':
+                    # Numerical scalars do not need the numpy formatter machinery
+                    value = str(_format_array(value, fmt=fmt))
                 else:
                     value = np.array2string(np.array(value), separator=delimiter, formatter=formatter).replace('\n', '')
                 header.append('{} = {}'.format(name, value))
@@ -421,22 +412,24 @@ class BaseCorrelationFunctionStatistics(BaseClass):
                 labels += ['{}mid'.format(name), '{}avg'.format(name)]
             labels += self._corr_names
             corr = self.get_corr(**kwargs)
-            columns = [self.nmodes.flat]
-            mids = np.meshgrid(*(self.modeavg(idim, method='mid') for idim in range(self.ndim)), indexing='ij')
+            columns = [self.nmodes.ravel()]
+            mids = np.meshgrid(*(self.modeavg(idim, method='mid') for idim in range(self.ndim)), indexing='ij', sparse=True)
             for idim in range(self.ndim):
-                columns += [mids[idim].flat, self.modes[idim].flat]
+                columns += [np.broadcast_to(mids[idim], self.shape).ravel(), self.modes[idim].ravel()]
             for column in corr.reshape((-1,) * (corr.ndim == self.ndim) + corr.shape):
-                columns += [column.flat]
-            columns = [[np.array2string(value, formatter=formatter) for value in column] for column in columns]
-            widths = [max(max(map(len, column)) - len(comments) * (icol == 0), len(label)) for icol, (column, label) in enumerate(zip(columns, labels))]
+                columns += [column.ravel()]
+            # Format whole columns at once, rather than each value with np.array2string
+            columns = [_format_array(column, fmt=fmt) for column in columns]
+            widths = [max(int(np.char.str_len(column).max()) - len(comments) * (icol == 0), len(label)) for icol, (column, label) in enumerate(zip(columns, labels))]
             widths[-1] = 0  # no need to leave a space
             header.append((' ' * len(delimiter)).join(['{:<{width}}'.format(label, width=width) for label, width in zip(labels, widths)]))
             widths[0] += len(comments)
-            with open(filename, 'w') as file:
-                for line in header:
-                    file.write(comments + line + '\n')
-                for irow in range(len(columns[0])):
-                    file.write(delimiter.join(['{:<{width}}'.format(column[irow], width=width) for column, width in zip(columns, widths)]) + '\n')
+            row_fmt = delimiter.join(['{{:<{:d}}}'.format(width) for width in widths])
+            lines = [comments + line for line in header]
+            lines += [row_fmt.format(*row) for row in zip(*columns)]
+            # Single write of the encoded output; binary mode skips the text layer (newline translation, per-write encoding)
+            with open(filename, 'wb') as file:
+                file.write(''.join(line + '\n' for line in lines).encode('utf-8'))
 
         # if self.with_mpi:
         #     self.mpicomm.Barrier()
@@ -561,26 +554,19 @@ class CorrelationFunctionWedges(BaseCorrelationFunctionStatistics):
         s, mu = np.asarray(s), np.asarray(mu)
         toret_shape = s.shape + mu.shape
         s, mu = s.ravel(), mu.ravel()
-        toret = np.nan * np.zeros((s.size, mu.size), dtype=corr.dtype)
         mask_s = (s >= self.edges[0][0]) & (s <= self.edges[0][-1])
         mask_mu = (mu >= self.edges[1][0]) & (mu <= self.edges[1][-1])
         s_masked, mu_masked = s[mask_s], mu[mask_mu]
         if s_masked.size and mu_masked.size:
-            if muavg.size == 1:
-
-                def interp(array):
-                    return UnivariateSpline(savg, array, s=0, k=1, ext='const')(s_masked)[:, None]
-
-            else:
-                i_s = np.argsort(s_masked); ii_s = np.argsort(i_s)
-                i_mu = np.argsort(mu_masked); ii_mu = np.argsort(i_mu)
-
-                def interp(array):
-                    return RectBivariateSpline(savg, muavg, array, kx=1, ky=1, s=0)(s_masked[i_s], mu_masked[i_mu], grid=True)[np.ix_(ii_s, ii_mu)]
-
-            toret[np.ix_(mask_s, mask_mu)] = interp(corr.real)
-            if complex and np.iscomplexobj(corr):
-                toret[np.ix_(mask_s, mask_mu)] += 1j * interp(corr.imag)
+            # Bilinear interpolation, performed on real and imaginary parts at once
+            interp = _interp_linear(mu_masked, muavg, _interp_linear(s_masked, savg, corr).T).T
+        if s_masked.size == s.size and mu_masked.size == mu.size and s.size and mu.size:
+            # All points within edges: no nan-filled output to allocate
+            toret = np.asarray(interp, dtype=corr.dtype, order='C')
+        else:
+            toret = np.full((s.size, mu.size), np.nan, dtype=corr.dtype)
+            if s_masked.size and mu_masked.size:
+                toret[np.ix_(mask_s, mask_mu)] = interp
 
         toret.shape = toret_shape
         if return_s:
@@ -616,9 +602,15 @@ class CorrelationFunctionWedges(BaseCorrelationFunctionStatistics):
         if ax is None: fig, ax = plt.subplots()
         s, corr = self.s, self(complex=False)
         wedges = self.edges[1]
-        for iwedge, wedge in enumerate(zip(wedges[:-1], wedges[1:])):
-            ax.plot(s[:, iwedge], s[:, iwedge]**2 * corr[:, iwedge], label=r'${:.2f} < \mu < {:.2f}$'.format(*wedge))
-        ax.legend()
+        # All wedges in a single artist; proxy lines for the legend
+        from matplotlib.collections import LineCollection
+        from matplotlib.lines import Line2D
+        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        colors = [colors[iwedge % len(colors)] for iwedge in range(len(wedges) - 1)]
+        segments = np.stack([s, s**2 * corr], axis=-1).transpose(1, 0, 2)
+        ax.add_collection(LineCollection(segments, colors=colors))
+        ax.autoscale_view()
+        ax.legend(handles=[Line2D([], [], color=color, label=r'${:.2f} < \mu < {:.2f}$'.format(*wedge)) for color, wedge in zip(colors, zip(wedges[:-1], wedges[1:]))])
         ax.grid(True)
         ax.set_xlabel(r'$s$ [$\mathrm{Mpc}/h$]')
         ax.set_ylabel(r'$s^{2} \xi(s, \mu)$ [$(\mathrm{Mpc}/h)^{2}$]')
@@ -698,11 +690,11 @@ class CorrelationFunctionMultipoles(BaseCorrelationFunctionStatistics):
         mu = (muedges[:-1] + muedges[1:]) / 2.
         dmu = np.diff(muedges)
         edges = (self.sedges.copy(), muedges)
-        modes = (np.repeat(self.modes[0][:, None], len(dmu), axis=-1), np.repeat(mu[None, :], len(self.s), axis=0))
+        shape = (len(self.s), len(dmu))
+        modes = (np.broadcast_to(self.modes[0][:, None], shape), np.broadcast_to(mu[None, :], shape))  # read-only views, no copy
         corr_nonorm, corr_zero_nonorm, corr_direct_nonorm = 0, 0, 0
-        for ell in ells:
+        for ell, ill in zip(ells, _get_ell_indices(ells, self.ells)):
             poly = np.diff(special.legendre(ell).integ()(muedges)) / dmu
-            ill = self.ells.index(ell)
             corr_nonorm += self.corr_nonorm[ill, ..., None] * poly
             corr_zero_nonorm += self.corr_zero_nonorm[ill, ..., None] * poly
             corr_direct_nonorm += self.corr_direct_nonorm[ill, ..., None] * poly
@@ -749,7 +741,7 @@ class CorrelationFunctionMultipoles(BaseCorrelationFunctionStatistics):
         if divide_wnorm:
             toret /= self.wnorm
         if not complex and np.iscomplexobj(toret):
-            toret = np.array([toret[ill].real if ell % 2 == 0 else toret[ill].imag for ill, ell in enumerate(self.ells)], dtype=toret.real.dtype)
+            toret = _select_parts(toret, ['real' if ell % 2 == 0 else 'imag' for ell in self.ells])
         return toret
 
     def __call__(self, ell=None, s=None, return_s=False, complex=True, **kwargs):
@@ -794,7 +786,7 @@ class CorrelationFunctionMultipoles(BaseCorrelationFunctionStatistics):
             if isscalar: ell = [ell]
         ells = ell
         corr = self.get_corr(complex=complex, **kwargs)
-        corr = corr[[self.ells.index(ell) for ell in ells]]
+        corr = corr[_get_ell_indices(ells, self.ells)]
         savg = self.s.copy()
         if return_s is None:
             return_s = s is None
@@ -808,17 +800,15 @@ class CorrelationFunctionMultipoles(BaseCorrelationFunctionStatistics):
         mask_finite_s = ~np.isnan(savg) & ~np.isnan(corr).any(axis=0)
         savg, corr = savg[mask_finite_s], corr[:, mask_finite_s]
         s = np.asarray(s)
-        toret = np.nan * np.zeros((len(ells),) + s.shape, dtype=corr.dtype)
         mask_s = (s >= self.edges[0][0]) & (s <= self.edges[0][-1])
-        s_masked = s[mask_s]
-        if s_masked.size:
-
-            def interp(array):
-                return np.array([UnivariateSpline(savg, arr, k=1, s=0, ext='const')(s_masked) for arr in array], dtype=array.dtype)
-
-            toret[..., mask_s] = interp(corr.real)
-            if complex and np.iscomplexobj(corr):
-                toret[..., mask_s] = toret[..., mask_s] + 1j * interp(corr.imag)
+        if mask_s.all() and s.size:
+            # All points within edges: no nan-filled output to allocate
+            toret = np.moveaxis(_interp_linear(s, savg, corr.T), -1, 0).astype(corr.dtype, copy=False)
+        else:
+            toret = np.full((len(ells),) + s.shape, np.nan, dtype=corr.dtype)
+            s_masked = s[mask_s]
+            if s_masked.size:
+                toret[..., mask_s] = _interp_linear(s_masked, savg, corr.T).T
         if isscalar:
             toret = toret[0]
         if return_s:
@@ -1024,8 +1014,7 @@ class MeshFFTCorr(MeshFFTBase):
             cfield2 = self._to_complex(self.mesh2, copy=False)
         del self.mesh2
         # cfield1.conj() * cfield2
-        for c1, c2 in zip(cfield1.slabs, cfield2.slabs):
-            c1[...] = c1.conj() * c2
+        _conj_mul_inplace(cfield1.value, cfield2.value)
 
         # for i, c1 in zip(cfield1.slabs.i, cfield1.slabs):
         #     mask_zero = True
@@ -1145,36 +1134,20 @@ class MeshFFTCorr(MeshFFTBase):
                     toret.append(rr)
                 return toret
 
-            def _safe_divide(num, denom):
-                with np.errstate(divide='ignore', invalid='ignore'):
-                    toret = num / denom
-                toret[denom == 0.] = 0.
-                return toret
-
             # The real-space grid
-            xhat = [xx.real.astype('f8') + offset[ii] for ii, xx in enumerate(_transform_rslab(rfield1.slabs.optx, self.boxsize))]
-            xnorm = np.sqrt(sum(xx**2 for xx in xhat))
-            xhat = [_safe_divide(xx, xnorm) for xx in xhat]
-            del xnorm
+            xhat = _normalize_vectors([xx.real.astype('f8') + offset[ii] for ii, xx in enumerate(_transform_rslab(rfield1.slabs.optx, self.boxsize))], dtype=rfield1.dtype)[0]
 
             # The separation-space grid
-            shat = [ss.real.astype('f8') for ss in _wrap_rslab(_transform_rslab(rfield1.slabs.optx, self.boxsize))]
-            snorm = np.sqrt(sum(ss**2 for ss in shat))
-            shat = [_safe_divide(ss, snorm) for ss in shat]
-            del snorm
+            shat = _normalize_vectors([ss.real.astype('f8') for ss in _wrap_rslab(_transform_rslab(rfield1.slabs.optx, self.boxsize))], dtype=rfield1.dtype)[0]
 
         for ill, ell in enumerate(nonzeroells):
 
-            Aell_zero[:] = Aell[:] = 0.
             # Iterate from m=-ell to m=ell and apply Ylm
             t0 = time.time()
-            for Ylm in Ylms[ill]:
-                # Reset the real-space mesh to the original density #1
-                rfield[:] = rfield1[:]
-
-                # Apply the config-space Ylm
-                for islab, slab in enumerate(rfield.slabs):
-                    slab[:] *= Ylm(xhat[0][islab], xhat[1][islab], xhat[2][islab])
+            for im, Ylm in enumerate(Ylms[ill]):
+                # Apply the config-space Ylm to the original density #1, in a single pass
+                for islab, (slab, slab1) in enumerate(zip(rfield.slabs, rfield1.slabs)):
+                    _apply_Ylm(Ylm, slab, xhat[0][islab], xhat[1][islab], xhat[2][islab], value=slab1)
 
                 # Real to complex of field #2
                 rfield.r2c(out=cfield)
@@ -1187,15 +1160,14 @@ class MeshFFTCorr(MeshFFTBase):
                 cfield.c2r(out=rfield)
                 zero = rfield.cmean()
 
-                # Apply the separation-space Ylm
-                for islab, slab in enumerate(rfield.slabs):
-                    slab[:] *= Ylm(shat[0][islab], shat[1][islab], shat[2][islab])
-                Aell[:] += rfield[:]
+                # Apply the separation-space Ylm and add to the total sum (first m initializes it), in a single pass
+                for islab, (slab, rslab) in enumerate(zip(Aell.slabs, rfield.slabs)):
+                    _apply_Ylm(Ylm, slab, shat[0][islab], shat[1][islab], shat[2][islab], value=rslab, add=im > 0)
 
-                # Apply the separation-space Ylm
-                for islab, slab in enumerate(rfield.slabs):
-                    slab[:] = zero * Ylm(shat[0][islab], shat[1][islab], shat[2][islab])
-                Aell_zero[:] += rfield[:]
+                # Apply the separation-space Ylm to the zero-lag term and add to the total sum
+                for islab, slab in enumerate(Aell_zero.slabs):
+                    if im > 0: slab[:] += zero * Ylm(shat[0][islab], shat[1][islab], shat[2][islab])
+                    else: slab[:] = zero * Ylm(shat[0][islab], shat[1][islab], shat[2][islab])
 
                 # And this contribution to the total sum
                 t1 = time.time()
@@ -1393,12 +1365,10 @@ class CatalogFFTCorr(MeshFFTCorr):
         """
         rdtype = _get_real_dtype(dtype)
         loc = locals()
-        bpositions, positions = [], {}
-        for name in ['data_positions1', 'data_positions2', 'randoms_positions1', 'randoms_positions2', 'shifted_positions1', 'shifted_positions2']:
-            tmp = _format_positions(loc[name], position_type=position_type, dtype=rdtype, mpicomm=mpicomm, mpiroot=mpiroot)
-            if tmp is not None: bpositions.append(tmp)
-            label = name.replace('data_positions', 'D').replace('randoms_positions', 'R').replace('shifted_positions', 'S')
-            positions[label] = tmp
+        # Format (and scatter, if mpiroot is not None) all positions at once
+        all_positions = _format_all_positions([loc[name] for _, name, _ in _CATALOGS], position_type=position_type, dtype=rdtype, mpicomm=mpicomm, mpiroot=mpiroot)
+        positions = {label: position for (label, _, _), position in zip(_CATALOGS, all_positions)}
+        bpositions = [position for position in all_positions if position is not None]
 
         with_shifted = positions['S1'] is not None
         with_randoms = positions['R1'] is not None
@@ -1406,8 +1376,8 @@ class CatalogFFTCorr(MeshFFTCorr):
         if autocorr and (positions['R2'] is not None or positions['S2'] is not None):
             raise ValueError('randoms_positions2 or shifted_positions2 are provided, but not data_positions2')
 
-        weights = {name: loc[name] for name in ['data_weights1', 'data_weights2', 'randoms_weights1', 'randoms_weights2', 'shifted_weights1', 'shifted_weights2']}
-        weights, bweights, n_bitwise_weights, weight_attrs = _format_all_weights(dtype=rdtype, weight_type=weight_type, weight_attrs=weight_attrs, mpicomm=mpicomm, mpiroot=mpiroot, **weights)
+        weights = {label: loc[name] for label, _, name in _CATALOGS}
+        weights, bweights, n_bitwise_weights, weight_attrs = _format_all_weights(weights, dtype=rdtype, weight_type=weight_type, weight_attrs=weight_attrs, mpicomm=mpicomm, mpiroot=mpiroot)
 
         # Get box encompassing all catalogs
         nmesh, boxsize, boxcenter = _get_mesh_attrs(boxsize=boxsize, cellsize=cellsize, nmesh=nmesh, boxcenter=boxcenter, positions=bpositions, boxpad=boxpad, check=not wrap, mpicomm=mpicomm)
@@ -1416,10 +1386,10 @@ class CatalogFFTCorr(MeshFFTCorr):
         if not isinstance(interlacing, tuple):
             interlacing = (interlacing,) * 2
 
-        if wrap:
+        if wrap and not _positions_in_box([position for position in positions.values() if position is not None], boxsize, boxcenter, mpicomm=mpicomm):
             for name, position in positions.items():
                 if position is not None:
-                    positions[name] = _wrap_positions(position, boxsize, boxcenter - boxsize / 2.)
+                    positions[name] = _wrap_positions(position, boxsize, boxcenter - boxsize / 2., out=position)  # position is a copy
 
         # Get catalog meshes
         def get_mesh(data_positions, data_weights=None, randoms_positions=None, randoms_weights=None, shifted_positions=None, shifted_weights=None, **kwargs):
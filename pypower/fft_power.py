@@ -10,26 +10,84 @@ https://github.com/bccp/nbodykit/blob/master/nbodykit/algorithms/convpower/fkp.p
 
 import os
 import time
+import functools
+import contextlib
+import concurrent.futures
 
 import numpy as np
-from scipy.interpolate import UnivariateSpline, RectBivariateSpline
 from scipy import special
+from mpi4py import MPI
 from pmesh.pm import RealField, BaseComplexField, UntransposedComplexField, TransposedComplexField, ComplexField
 
-from .utils import BaseClass, _make_array
+from .utils import BaseClass, _make_array, _numba_min_size
 from . import mpi, utils
-from .mesh import CatalogMesh, _get_real_dtype, _get_compensation_window, _get_mesh_attrs, _wrap_positions
-from .direct_power import _format_positions, _format_weights, get_default_nrealizations, get_inverse_probability_weight, get_direct_power_engine
+from .mesh import CatalogMesh, _get_real_dtype, _compensate_field, _get_mesh_attrs, _wrap_positions, _positions_in_box, _pm_templates
+from .direct_power import _format_all_positions, _format_weights, get_default_nrealizations, get_inverse_probability_weight, get_direct_power_engine
 
 
-def _nan_to_zero(array):
-    # Replace nans with 0s
-    array = array.copy()
-    mask = np.isnan(array)
-    array[mask] = 0.
+def _nan_to_zero(array, weights=None):
+    # Replace nans with 0s; if weights are provided, return weights * array (with nans replaced by 0s),
+    # in a single temporary array, instead of two with _nan_to_zero(array) * weights
+    if weights is None: array = array.copy()
+    else: array = np.multiply(array, weights)
+    np.copyto(array, 0., where=np.isnan(array))
     return array
 
 
+# Real spherical harmonics up to ell = 6, as explicit polynomials of unit-normalized Cartesian coordinates (xhat, yhat, zhat)
+_hardcoded_real_Ylm = {
+    (0, 0): lambda x, y, z: np.full_like(x, 0.28209479177387814),
+    (1, -1): lambda x, y, z: 0.4886025119029199 * y,
+    (1, 0): lambda x, y, z: 0.4886025119029199 * z,
+    (1, 1): lambda x, y, z: 0.4886025119029199 * x,
+    (2, -2): lambda x, y, z: 1.0925484305920792 * x * y,
+    (2, -1): lambda x, y, z: 1.0925484305920792 * z * y,
+    (2, 0): lambda x, y, z: 0.31539156525252 * (2 * z**2 - x**2 - y**2),
+    (2, 1): lambda x, y, z: 1.0925484305920792 * z * x,
+    (2, 2): lambda x, y, z: 0.5462742152960396 * (x**2 - y**2),
+    (3, -3): lambda x, y, z: 0.5900435899266435 * y * (3 * x**2 - y**2),
+    (3, -2): lambda x, y, z: 2.8906114426405543 * z * x * y,
+    (3, -1): lambda x, y, z: 0.4570457994644657 * (5 * z**2 - 1) * y,
+    (3, 0): lambda x, y, z: 0.3731763325901154 * z * (5 * z**2 - 3),
+    (3, 1): lambda x, y, z: 0.4570457994644657 * (5 * z**2 - 1) * x,
+    (3, 2): lambda x, y, z: 1.4453057213202771 * z * (x**2 - y**2),
+    (3, 3): lambda x, y, z: 0.5900435899266435 * x * (x**2 - 3 * y**2),
+    (4, -4): lambda x, y, z: 2.5033429417967046 * x * y * (x**2 - y**2),
+    (4, -3): lambda x, y, z: 1.7701307697799304 * z * y * (3 * x**2 - y**2),
+    (4, -2): lambda x, y, z: 0.94617469575756 * (7 * z**2 - 1) * x * y,
+    (4, -1): lambda x, y, z: 0.6690465435572892 * z * (7 * z**2 - 3) * y,
+    (4, 0): lambda x, y, z: 0.10578554691520431 * (z**2 * (35 * z**2 - 30) + 3),
+    (4, 1): lambda x, y, z: 0.6690465435572892 * z * (7 * z**2 - 3) * x,
+    (4, 2): lambda x, y, z: 0.47308734787878 * (7 * z**2 - 1) * (x**2 - y**2),
+    (4, 3): lambda x, y, z: 1.7701307697799304 * z * x * (x**2 - 3 * y**2),
+    (4, 4): lambda x, y, z: 0.6258357354491761 * (x**2 * (x**2 - 6 * y**2) + y**2 * y**2),
+    (5, -5): lambda x, y, z: 0.6563820568401701 * y * (x**2 * (5 * x**2 - 10 * y**2) + y**2 * y**2),
+    (5, -4): lambda x, y, z: 8.302649259524165 * z * x * y * (x**2 - y**2),
+    (5, -3): lambda x, y, z: 0.4892382994352504 * (9 * z**2 - 1) * y * (3 * x**2 - y**2),
+    (5, -2): lambda x, y, z: 4.793536784973324 * z * (3 * z**2 - 1) * x * y,
+    (5, -1): lambda x, y, z: 0.45294665119569694 * (z**2 * (21 * z**2 - 14) + 1) * y,
+    (5, 0): lambda x, y, z: 0.1169503224534236 * z * (z**2 * (63 * z**2 - 70) + 15),
+    (5, 1): lambda x, y, z: 0.45294665119569694 * (z**2 * (21 * z**2 - 14) + 1) * x,
+    (5, 2): lambda x, y, z: 2.396768392486662 * z * (3 * z**2 - 1) * (x**2 - y**2),
+    (5, 3): lambda x, y, z: 0.4892382994352504 * (9 * z**2 - 1) * x * (x**2 - 3 * y**2),
+    (5, 4): lambda x, y, z: 2.075662314881041 * z * (x**2 * (x**2 - 6 * y**2) + y**2 * y**2),
+    (5, 5): lambda x, y, z: 0.6563820568401701 * x * (x**2 * (x**2 - 10 * y**2) + 5 * y**2 * y**2),
+    (6, -6): lambda x, y, z: 1.3663682103838286 * x * y * (x**2 * (3 * x**2 - 10 * y**2) + 3 * y**2 * y**2),
+    (6, -5): lambda x, y, z: 2.366619162231752 * z * y * (x**2 * (5 * x**2 - 10 * y**2) + y**2 * y**2),
+    (6, -4): lambda x, y, z: 2.0182596029148967 * (11 * z**2 - 1) * x * y * (x**2 - y**2),
+    (6, -3): lambda x, y, z: 0.9212052595149235 * z * (11 * z**2 - 3) * y * (3 * x**2 - y**2),
+    (6, -2): lambda x, y, z: 0.9212052595149235 * (z**2 * (33 * z**2 - 18) + 1) * x * y,
+    (6, -1): lambda x, y, z: 0.5826213625187314 * z * (z**2 * (33 * z**2 - 30) + 5) * y,
+    (6, 0): lambda x, y, z: 0.06356920226762842 * (z**2 * (z**2 * (231 * z**2 - 315) + 105) - 5),
+    (6, 1): lambda x, y, z: 0.5826213625187314 * z * (z**2 * (33 * z**2 - 30) + 5) * x,
+    (6, 2): lambda x, y, z: 0.46060262975746175 * (z**2 * (33 * z**2 - 18) + 1) * (x**2 - y**2),
+    (6, 3): lambda x, y, z: 0.9212052595149235 * z * (11 * z**2 - 3) * x * (x**2 - 3 * y**2),
+    (6, 4): lambda x, y, z: 0.5045649007287242 * (11 * z**2 - 1) * (x**2 * (x**2 - 6 * y**2) + y**2 * y**2),
+    (6, 5): lambda x, y, z: 2.366619162231752 * z * x * (x**2 * (x**2 - 10 * y**2) + 5 * y**2 * y**2),
+    (6, 6): lambda x, y, z: 0.6831841051919143 * (x**2 * (x**2 * (x**2 - 15 * y**2) + 15 * y**2 * y**2) - y**2 * y**2 * y**2),
+}
+
+
 def get_real_Ylm(ell, m, modules=None):
     """
     Return a function that computes the real spherical harmonic of order (ell, m).
@@ -37,7 +95,8 @@ def get_real_Ylm(ell, m, modules=None):
 
     Note
     ----
-    Faster evaluation will be achieved if sympy and numexpr are available.
+    For ell <= 6, explicit Cartesian polynomials are used (unless ``modules`` is 'scipy').
+    Else, faster evaluation will be achieved if sympy and numba (or numexpr) are available.
     Else, fallback to numpy and scipy's functions.
 
     Parameters
@@ -49,9 +108,9 @@ def get_real_Ylm(ell, m, modules=None):
         The order of the harmonic; abs(m) <= ell.
 
     modules : str, default=None
-        If 'sympy', use sympy + numexpr to speed up calculation.
+        If 'sympy', use hardcoded polynomials if ell <= 6, else sympy + numba (or numexpr) to speed up calculation.
         If 'scipy', use scipy.
-        If ``None``, defaults to sympy if installed, else scipy.
+        If ``None``, defaults to hardcoded polynomials if ell <= 6, else sympy if installed, else scipy.
 
     Returns
     -------
@@ -68,13 +127,6 @@ def get_real_Ylm(ell, m, modules=None):
     ell = int(ell)
     m = int(m)
 
-    # Normalization of Ylms
-    amp = np.sqrt((2 * ell + 1) / (4 * np.pi))
-    if m != 0:
-        fac = 1
-        for n in range(ell - abs(m) + 1, ell + abs(m) + 1): fac *= n  # (ell + |m|)!/(ell - |m|)!
-        amp *= np.sqrt(2. / fac)
-
     sp = None
 
     if modules is None:
@@ -87,25 +139,59 @@ def get_real_Ylm(ell, m, modules=None):
     elif 'scipy' not in modules:
         raise ValueError('modules must be either ["sympy", "scipy", None]')
 
+    return _get_real_Ylm(ell, m, use_sympy=sp is not None, use_hardcoded=modules is None or 'sympy' in modules)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_real_Ylm(ell, m, use_sympy=True, use_hardcoded=True):
+    # Build (real) Ylm function, cached as symbolic computation is slow
+
+    if use_hardcoded and (ell, m) in _hardcoded_real_Ylm:
+        Ylm = _hardcoded_real_Ylm[ell, m]
+        # Attach some meta-data
+        Ylm.l = ell
+        Ylm.m = m
+        # Polynomial expressions also apply to scalars (except constant (0, 0)), see _apply_Ylm
+        Ylm._scalar = Ylm if ell > 0 else None
+        return Ylm
+
+    # Normalization of Ylms
+    amp = np.sqrt((2 * ell + 1) / (4 * np.pi))
+    if m != 0:
+        fac = 1
+        for n in range(ell - abs(m) + 1, ell + abs(m) + 1): fac *= n  # (ell + |m|)!/(ell - |m|)!
+        amp *= np.sqrt(2. / fac)
+
     # sympy is not installed, fallback to scipy
-    if sp is None:
+    if not use_sympy:
 
         def Ylm(xhat, yhat, zhat):
             # The cos(theta) dependence encoded by the associated Legendre polynomial
             toret = amp * (-1)**m * special.lpmv(abs(m), ell, zhat)
-            # The phi dependence
-            phi = np.arctan2(yhat, xhat)
+            if m == 0:
+                return toret
+            # The phi dependence: cos(|m| phi) and sin(|m| phi) are obtained with the Chebyshev recursion
+            # f_k = 2 cos(phi) f_{k-1} - f_{k-2}, without computing phi = arctan2(yhat, xhat) explicitly
+            rho = np.sqrt(xhat**2 + yhat**2)
+            nonzero = rho != 0.
+            cosphi = np.divide(xhat, rho, out=np.ones_like(rho), where=nonzero)  # phi = 0 at the poles, as np.arctan2(0, 0)
             if m < 0:
-                toret *= np.sin(abs(m) * phi)
+                prev, cur = np.zeros_like(rho), np.divide(yhat, rho, out=np.zeros_like(rho), where=nonzero)
             else:
-                toret *= np.cos(abs(m) * phi)
+                prev, cur = np.ones_like(rho), cosphi
+            for k in range(2, abs(m) + 1):
+                prev, cur = cur, 2. * cosphi * cur - prev
+            toret *= cur
             return toret
 
         # Attach some meta-data
         Ylm.l = ell
         Ylm.m = m
+        Ylm._scalar = None
         return Ylm
 
+    import sympy as sp
+
     # The relevant cartesian and spherical symbols
     # Using intermediate variable r helps sympy simplify expressions
     x, y, z, r = sp.symbols('x y z r', real=True, positive=True)
@@ -128,17 +214,322 @@ def get_real_Ylm(ell, m, modules=None):
     expr = sp.together(expr.subs(defs)).subs(x**2 + y**2 + z**2, r**2)
     expr = amp * expr.expand().subs([(x / r, xhat), (y / r, yhat), (z / r, zhat)])
 
-    try: import numexpr
-    except ImportError: numexpr = None
-    Ylm = sp.lambdify((xhat, yhat, zhat), expr, modules='numexpr' if numexpr is not None else ['scipy', 'numpy'])
+    try: import numba
+    except ImportError: numba = None
+
+    scalar = None
+    if numba is not None:
+        # Compile expression into a single parallel ufunc, which avoids intermediate arrays
+        scalar = sp.lambdify((xhat, yhat, zhat), expr, modules='math')
+        func = numba.njit(scalar)
+        ufunc = numba.vectorize(['f4(f4, f4, f4)', 'f8(f8, f8, f8)'], target='parallel')(lambda xhat, yhat, zhat: func(xhat, yhat, zhat))
+
+        def Ylm(xhat, yhat, zhat):
+            return ufunc(xhat, yhat, zhat)
+
+    else:
+        try: import numexpr
+        except ImportError: numexpr = None
+        Ylm = sp.lambdify((xhat, yhat, zhat), expr, modules='numexpr' if numexpr is not None else ['scipy', 'numpy'])
 
     # Attach some meta-data
     Ylm.expr = expr
     Ylm.l = ell
     Ylm.m = m
+    Ylm._scalar = scalar
     return Ylm
 
 
+@functools.lru_cache(maxsize=None)
+def _get_Ylm_kernel(scalar):
+    # numba kernel setting (or adding to) a 2D slab value * Ylm(xhat, yhat, zhat), given the scalar expression of Ylm,
+    # in a single pass over memory (no temporaries); None if numba is not available
+    try: import numba
+    except ImportError: return None
+
+    func = numba.njit(scalar)
+
+    # Release the GIL, such that the kernel can run concurrently with FFTs, see MeshFFTPower._run_local_los
+    @numba.njit(parallel=True, nogil=True)
+    def kernel(out, value, xhat, yhat, zhat, add):
+        for i in numba.prange(out.shape[0]):
+            for j in range(out.shape[1]):
+                tmp = value[i, j] * func(xhat[i, j], yhat[i, j], zhat[i, j])
+                if add: out[i, j] += tmp
+                else: out[i, j] = tmp
+
+    return kernel
+
+
+def _apply_Ylm(Ylm, out, xhat, yhat, zhat, value=None, add=False):
+    # Set out (slab) to value * Ylm(xhat, yhat, zhat) (value defaults to out, i.e. multiplication in place),
+    # or add it to out if add is True; all arrays are of the same shape
+    if value is None: value = out
+    scalar = getattr(Ylm, '_scalar', None)
+    if scalar is not None and out.ndim == 2 and out.size >= _numba_min_size and xhat.shape == yhat.shape == zhat.shape == value.shape == out.shape:
+        kernel = _get_Ylm_kernel(scalar)
+        if kernel is not None:
+            kernel(out, value, xhat, yhat, zhat, bool(add))
+            return
+    # numpy evaluation, in tiles of rows such that temporaries stay in cache
+    tiles = _get_tiles(out.shape) if out.ndim and xhat.shape == yhat.shape == zhat.shape == value.shape == out.shape else [Ellipsis]
+    for tile in tiles:
+        tmp = Ylm(xhat[tile], yhat[tile], zhat[tile])
+        if add: out[tile] += value[tile] * tmp
+        else: np.multiply(value[tile], tmp, out=out[tile])
+
+
+def _get_digitize(edges):
+    # Return function equivalent to np.digitize(np.ravel(x), edges, right=False) for finite x.
+    # If edges are uniformly spaced, bin indices are obtained with arithmetic (O(N)) instead of a binary search (O(N log B)),
+    # and corrected by comparison to the neighbouring edges, which is exact whatever rounding errors
+    edges = np.asarray(edges)
+    nbins = len(edges) - 1
+    if nbins < 1 or not edges[-1] > edges[0] or not np.allclose(np.diff(edges), (edges[-1] - edges[0]) / nbins, rtol=1e-5, atol=0.):
+        return lambda x: np.digitize(np.ravel(x), edges, right=False)
+    edge0, inv_width = edges[0], nbins / (edges[-1] - edges[0])
+    padded_edges = np.concatenate([[-np.inf], edges, [np.inf]], axis=0)
+
+    def digitize(x):
+        x = np.ravel(x)
+        ind = np.clip((x - edge0) * inv_width, -1., nbins).astype(np.intp) + 1
+        ind -= x < padded_edges[ind]
+        ind += x >= padded_edges[ind + 1]
+        return ind
+
+    return digitize
+
+
+@functools.lru_cache(maxsize=32)
+def _get_legendre(ell):
+    # Legendre polynomial of order ell; scipy.special.legendre builds a new numpy.poly1d at each call
+    return special.legendre(ell)
+
+
+@functools.lru_cache(maxsize=32)
+def _get_legendre_wedge_matrix(muedges, ells):
+    # Matrix (ell, mu-wedge) of Legendre polynomials averaged over mu-wedges, for tuples muedges and ells
+    muedges = np.array(muedges)
+    dmu = np.diff(muedges)
+    toret = np.array([np.diff(_get_legendre(ell).integ()(muedges)) / dmu for ell in ells]).reshape(len(ells), len(dmu))
+    toret.flags.writeable = False
+    return toret
+
+
+# Caches of the last mesh geometry used by project_to_basis and unit vector grids, see _get_project_geometry and _get_unit_grids;
+# their total size is capped by _cache_max_bytes (in bytes, per rank), and they can be released with :func:`clear_cache`
+_caches = {}
+_cache_max_bytes = 2**30
+
+
+def _get_cache(name, key):
+    # Return value of cache name if stored with key, else release it (before a new value is allocated) and return None
+    cache = _caches.get(name, None)
+    if cache is not None and cache[0] == key:
+        return cache[1]
+    _caches.pop(name, None)
+    return None
+
+
+def _set_cache(name, key, value, nbytes):
+    # Store value in cache name if nbytes fits in _cache_max_bytes, releasing other caches if total size would exceed it
+    if nbytes > _cache_max_bytes:
+        return
+    if nbytes + sum(cache[2] for cache in _caches.values()) > _cache_max_bytes:
+        _caches.clear()
+    _caches[name] = (key, value, nbytes)
+
+
+def clear_cache():
+    """
+    Release memory held by caches of FFT plans (through :class:`ParticleMesh` instances), mesh geometries and unit vector grids,
+    which speed up repeated computations with the same meshes (e.g. over a series of mocks).
+    Caches are per process (MPI rank).
+    """
+    _caches.clear()
+    del _pm_templates[:]
+
+
+# Approximate number of mesh cells processed at once by project_to_basis, in blocks of y-z slabs
+_project_block_size = 2**16
+
+
+def _get_project_geometry(y3d, xedges, muedges, los=(0, 0, 1), ells=(0,)):
+    # Return the geometry of the coordinate mesh of y3d used by project_to_basis, which does not depend on y3d values:
+    # for each block of y-z slabs, bin indices and Legendre polynomials (times 2 ell + 1) of mu for positive
+    # and (if hermitian symmetric) negative frequencies; and local x, mu sums and mode counts in each bin.
+    # If small enough, the last geometry is cached, keyed by the template of y3d.pm (shared by all :class:`ParticleMesh` instances
+    # with same mesh size, dtype and communicator, hence local slab layout), such that repeated projections of fields of the same
+    # mesh (e.g. for each multipole, window matrix column, or in a series of mocks) skip this computation.
+    # Else, 'slabs' is an iterator computing the geometry of each block on the fly, and x, mu sums and mode counts
+    # are complete only once it is exhausted
+    holder = getattr(y3d.pm, 'template', None) or y3d.pm
+    key = (holder, type(y3d), tuple(y3d.Nmesh), tuple(y3d.BoxSize), np.dtype(y3d.pm.dtype).str, xedges.dtype, xedges.tobytes(), muedges.dtype, muedges.tobytes(), tuple(np.ravel(los)), tuple(ells))
+    toret = _get_cache('project_geometry', key)
+    if toret is not None:
+        return toret
+
+    # x and mu are summed in each bin with a single bincount, offset by the number of bins
+    nsum = np.zeros((len(xedges) + 2) * (len(muedges) + 2), dtype='i8')
+    xmusum = np.zeros((2, nsum.size), dtype='f8')
+    toret = {'slabs': _iter_project_geometry(y3d, xedges, muedges, nsum, xmusum, los=los, ells=ells), 'xmusum': xmusum, 'nsum': nsum}
+    # Upper bound on the geometry size: bin indices (i8) and Legendre polynomials (f8) for each cell,
+    # twice for hermitian symmetric fields (negative frequencies); known before any allocation
+    nbytes = 8 * (1 + len(ells)) * (1 + bool(y3d.compressed)) * np.prod(y3d.shape, dtype='i8')
+    # Do not keep too large geometries in memory: these are streamed
+    if nbytes <= _cache_max_bytes:
+        toret['slabs'] = list(toret['slabs'])
+        _set_cache('project_geometry', key, toret, nbytes)
+    return toret
+
+
+def _iter_project_geometry(y3d, xedges, muedges, nsum, xmusum, los=(0, 0, 1), ells=(0,)):
+    # Yield the geometry of each block of y-z slabs of the coordinate mesh of y3d, see :func:`_get_project_geometry`,
+    # adding local x, mu sums and mode counts to xmusum and nsum
+    x3d = y3d.x
+    nx = len(xedges) - 1
+    nmu = len(muedges) - 1
+    xdtype = max(xedges.dtype, muedges.dtype)
+    legpoly = [_get_legendre(ell) for ell in ells]
+    nell = len(ells)
+    legsign = (-1)**np.array(ells)
+
+    # Bin indices; fast path for uniform edges
+    digitize_x, digitize_mu = _get_digitize(xedges), _get_digitize(muedges)
+
+    channel_offsets = nsum.size * np.arange(2)[:, None]
+
+    cellsize = y3d.BoxSize / y3d.Nmesh if isinstance(y3d, RealField) else 2. * np.pi / y3d.BoxSize
+    mincell = np.min(cellsize)
+
+    # If coordinates are integer multiples of the same cell size along all axes,
+    # norm and bin indices for x only depend on the integer squared norm (in cell units): use lookup tables
+    i2vec = None
+    if np.allclose(cellsize, mincell, rtol=1e-12, atol=0.):
+        ivec = [np.rint(xx.real / mincell).astype('i8') for xx in x3d]
+        if all(np.allclose(ii * mincell, xx.real, rtol=1e-9, atol=0.) for ii, xx in zip(ivec, x3d)):
+            i2vec = [ii**2 for ii in ivec]
+            i2max = sum(np.max(ii2, initial=0) for ii2 in i2vec)
+            i2_to_xnorm = (mincell * np.sqrt(np.arange(i2max + 1))).astype(xdtype)
+            i2_to_dig_x = digitize_x(i2_to_xnorm)
+            i2_to_dig_x[0] = nx + 2  # zero mode
+
+    # With a single mu-bin containing all mu (e.g. local line-of-sight), mu and -mu fall in the same bin
+    fold = y3d.compressed and nmu == 1 and muedges[0] <= -1. and muedges[-1] >= 1.
+
+    # Iterate over blocks of y-z planes of the coordinate mesh; large enough to limit Python overheads,
+    # small enough to limit memory footprint of temporary arrays
+    nslabs = x3d[0].shape[0]
+    blocksize = max(_project_block_size // max(int(np.prod(y3d.shape[1:])), 1), 1)
+    for start in range(0, nslabs, blocksize):
+        islab = slice(start, start + blocksize)
+        # The square of coordinate mesh norm
+        # (either Fourier space k or configuraton space x)
+        xvec = (x3d[0][islab].real.astype(xdtype),) + tuple(x3d[i].real.astype(xdtype) for i in range(1, 3))
+        if i2vec is not None:
+            i2 = i2vec[0][islab] + i2vec[1] + i2vec[2]
+            xnorm = i2_to_xnorm[i2]
+        else:
+            # Coordinates are broadcastable 1D arrays, hence only the last sum and the square root involve the full slab
+            xnorm = sum(xx**2 for xx in xvec)
+            np.sqrt(xnorm, out=xnorm)
+
+        # If empty, do nothing
+        if xnorm.size == 0: continue
+
+        # Get the bin indices for x on the slab
+        if i2vec is not None:
+            dig_x = i2_to_dig_x[i2.ravel()]
+            mask_zero = i2 == 0
+        else:
+            dig_x = digitize_x(xnorm)
+            mask_zero = xnorm < mincell / 2.
+            # y3d[islab, mask_zero[0]] = 0.
+            dig_x[mask_zero.ravel()] = nx + 2
+
+        # Get the bin indices for mu on the slab
+        mu = sum(xx * ll for xx, ll in zip(xvec, los))
+        # In place division, skipping the zero mode, without the temporaries of masked indexing
+        np.divide(mu, xnorm, out=mu, where=~mask_zero)
+        # Protect against |mu| > 1 by rounding errors, which would push modes along the line-of-sight out of the last mu-bin
+        np.clip(mu, -1., 1., out=mu)
+
+        if y3d.compressed:
+            # Get the indices that have positive freq along symmetry axis = -1
+            nonsingular = np.broadcast_to(x3d[-1] > 0., xnorm.shape).copy()
+            mus = [mu, -mu]
+        else:
+            mus = [mu]
+
+        # Legendre polynomials (times 2 ell + 1), to be evaluated only once as L_ell(-mu) = (-1)^ell L_ell(mu)
+        legmu = np.array([(2. * ell + 1.) * leg(mu.ravel()) for ell, leg in zip(ells, legpoly)]).reshape(nell, -1)
+
+        # Accounting for negative frequencies
+        slabgeometry = []
+        for imu, mu in enumerate(mus):
+            # Make the multi-index
+            dig_mu = digitize_mu(mu)  # this is bins[i-1] <= x < bins[i]
+            dig_mu[mu.ravel() == muedges[-1]] = nmu  # last mu inclusive
+            dig_mu[mask_zero.ravel()] = nmu + 2
+
+            # Bin indices are within bounds by construction, no need for np.ravel_multi_index checks
+            multi_index = dig_x * (nmu + 3) + dig_mu
+
+            if imu:
+                multi_index = multi_index[nonsingular.ravel()]
+                xnorm = xnorm[nonsingular]
+                mu = mu[nonsingular]
+                legslab = legmu[:, nonsingular.ravel()]
+                legslab[legsign < 0] *= -1
+                slabgeometry.append((multi_index, legslab, nonsingular))
+            else:
+                slabgeometry.append((multi_index, legmu, None))
+
+            # Count number of modes in each bin
+            nsum += np.bincount(multi_index, minlength=nsum.size)
+            # Sum up x and mu in each bin at once
+            xmusum += np.bincount((channel_offsets + multi_index).ravel(), weights=np.concatenate([xnorm.ravel(), mu.ravel()]), minlength=xmusum.size).reshape(xmusum.shape)
+
+        if fold:
+            # Negative frequencies of non-singular modes contribute hermitian_symmetric * conj(y) * (-1)^ell * L_ell(mu)
+            # to the same bin as positive ones: fold them in Legendre weights for real and imaginary parts of y,
+            # i.e. L_ell(mu) * (1 +/- (-1)^ell), to sum positive and negative frequencies in a single pass
+            (multi_index, legslab, _), _ = slabgeometry
+            legfold = np.array([legslab, legslab])
+            legfold[0][:, nonsingular.ravel()] *= (1 + legsign)[:, None]
+            legfold[1][:, nonsingular.ravel()] *= (1 - legsign)[:, None]
+            slabgeometry = [(multi_index, legfold, None)]
+
+        yield islab, slabgeometry
+
+
+@functools.lru_cache(maxsize=1)
+def _get_bin_sum_kernel():
+    # numba kernel for project_to_basis, summing Legendre-weighted y (real, and imaginary part if complex,
+    # with their own Legendre weights) in each bin;
+    # chunks of the input are binned in parallel in per-thread histograms local (no atomics), of shape (nthreads, nchannels, nbins),
+    # to be summed by the caller once all blocks have been binned; None if numba is not available
+    try: import numba
+    except ImportError: return None
+
+    @numba.njit(parallel=True)
+    def kernel(multi_index, legreal, legimag, yreal, yimag, iscomplex, local):
+        nell, size = legreal.shape
+        nthreads = local.shape[0]
+        chunksize = (size + nthreads - 1) // nthreads
+        for ithread in numba.prange(nthreads):
+            for i in range(ithread * chunksize, min((ithread + 1) * chunksize, size)):
+                ibin = multi_index[i]
+                for ill in range(nell):
+                    if iscomplex:
+                        local[ithread, 2 * ill, ibin] += legreal[ill, i] * yreal[i]
+                        local[ithread, 2 * ill + 1, ibin] += legimag[ill, i] * yimag[i]
+                    else:
+                        local[ithread, ill, ibin] += legreal[ill, i] * yreal[i]
+
+    return kernel
+
+
 def project_to_basis(y3d, edges, los=(0, 0, 1), ells=None, antisymmetric=False, exclude_zero=False):
     r"""
     Project a 3D statistic on to the specified basis. The basis will be one of:
@@ -227,22 +618,17 @@ def project_to_basis(y3d, edges, los=(0, 0, 1), ells=None, antisymmetric=False,
                 Value of the power spectrum at k = 0
     """
     comm = y3d.pm.comm
-    x3d = y3d.x
     hermitian_symmetric = y3d.compressed
     if antisymmetric: hermitian_symmetric *= -1
 
-    from scipy.special import legendre
-
     # Setup the bin edges and number of bins
     xedges, muedges = (np.asarray(edge) for edge in edges)
     nx = len(xedges) - 1
     nmu = len(muedges) - 1
-    xdtype = max(xedges.dtype, muedges.dtype)
     # Always make sure first ell value is monopole, which is just (x, mu) projection since legendre of ell = 0 is 1
     return_poles = ells is not None
     ells = ells or []
     unique_ells = sorted(set([0]) | set(ells))
-    legpoly = [legendre(ell) for ell in unique_ells]
     nell = len(unique_ells)
 
     # valid ell values
@@ -250,91 +636,88 @@ def project_to_basis(y3d, edges, los=(0, 0, 1), ells=None, antisymmetric=False,
         raise ValueError('Multipole numbers must be non-negative integers')
 
     # Initialize the binning arrays
-    musum = np.zeros((nx + 3, nmu + 3))
-    xsum = np.zeros((nx + 3, nmu + 3))
-    ysum = np.zeros((nell, nx + 3, nmu + 3), dtype=y3d.dtype)  # extra dimension for multipoles
-    nsum = np.zeros((nx + 3, nmu + 3), dtype='i8')
-    # If input array is Hermitian symmetric, only half of the last axis is stored in `y3d`
-
-    cellsize = y3d.BoxSize / y3d.Nmesh if isinstance(y3d, RealField) else 2. * np.pi / y3d.BoxSize
-    mincell = np.min(cellsize)
-
-    # Iterate over y-z planes of the coordinate mesh
-    for islab in range(x3d[0].shape[0]):
-        # The square of coordinate mesh norm
-        # (either Fourier space k or configuraton space x)
-        xvec = (x3d[0][islab].real.astype(xdtype),) + tuple(x3d[i].real.astype(xdtype) for i in range(1, 3))
-        xnorm = sum(xx**2 for xx in xvec)**0.5
-
-        # If empty, do nothing
-        if len(xnorm.flat) == 0: continue
-
-        # Get the bin indices for x on the slab
-        dig_x = np.digitize(xnorm.flat, xedges, right=False)
-        mask_zero = xnorm < mincell / 2.
-        # y3d[islab, mask_zero[0]] = 0.
-        dig_x[mask_zero.flat] = nx + 2
-
-        # Get the bin indices for mu on the slab
-        mu = sum(xx * ll for xx, ll in zip(xvec, los))
-        mu[~mask_zero] /= xnorm[~mask_zero]
-
-        if hermitian_symmetric == 0:
-            mus = [mu]
-        else:
-            nonsingular = np.ones(xnorm.shape, dtype='?')
-            # Get the indices that have positive freq along symmetry axis = -1
-            nonsingular[...] = x3d[-1][0] > 0.
-            mus = [mu, -mu]
-
+    # Legendre-weighted y (real, and imaginary part if complex) are summed in each bin with a single bincount,
+    # each of these quantities (channels) being offset by the number of bins
+    # x, mu sums and mode counts do not depend on y, and come with the mesh geometry
+    geometry = _get_project_geometry(y3d, xedges, muedges, los=los, ells=unique_ells)
+    iscomplex = np.issubdtype(y3d.dtype, np.complexfloating)
+    nchannels = 2 + nell * (1 + iscomplex)
+    # Accumulators are flat in the inner loop, and reshaped to (nx + 3, nmu + 3) at the end
+    nbins = (nx + 3) * (nmu + 3)
+    csum = np.zeros((nchannels, nbins), dtype='f8')
+    ycsum = csum[2:]
+    channel_offsets = nbins * np.arange(nchannels - 2)[:, None]
+
+    # numba kernel, if available, for large enough meshes, with per-thread histograms allocated once for all blocks;
+    # skipped if these histograms are not small compared to the mesh
+    size = np.prod(y3d.shape, dtype='i8')
+    kernel = _get_bin_sum_kernel() if size >= _numba_min_size else None
+    if kernel is not None:
+        import numba
+        nthreads = numba.get_num_threads()
+        if nthreads * ycsum.size > size: kernel = None
+        else: local = np.zeros((nthreads,) + ycsum.shape, dtype=ycsum.dtype)
+
+    # Iterate over blocks of y-z planes of the coordinate mesh
+    for islab, slabgeometry in geometry['slabs']:
         # Accounting for negative frequencies
-        for imu, mu in enumerate(mus):
-            # Make the multi-index
-            dig_mu = np.digitize(mu.flat, muedges, right=False)  # this is bins[i-1] <= x < bins[i]
-            dig_mu[mu.real.flat == muedges[-1]] = nmu  # last mu inclusive
-            dig_mu[mask_zero.flat] = nmu + 2
-
-            multi_index = np.ravel_multi_index([dig_x, dig_mu], (nx + 3, nmu + 3))
-
-            if hermitian_symmetric and imu:
-                multi_index = multi_index[nonsingular.flat]
-                xnorm = xnorm[nonsingular]  # it will be recomputed
-                mu = mu[nonsingular]
+        for multi_index, legslab, nonsingular in slabgeometry:
+            if nonsingular is None:
+                yslab = y3d[islab, ...]
+            else:
+                # If input array is Hermitian symmetric, only half of the last axis is stored in `y3d`
+                yslab = hermitian_symmetric * y3d[islab][nonsingular].conj()  # hermitian_symmetric is 1 or -1
 
-            # Count number of modes in each bin
-            nsum.flat += np.bincount(multi_index, minlength=nsum.size)
-            # Sum up x in each bin
-            xsum.flat += np.bincount(multi_index, weights=xnorm.flat, minlength=nsum.size)
-            # Sum up mu in each bin
-            musum.flat += np.bincount(multi_index, weights=mu.flat, minlength=nsum.size)
+            yslab = yslab.ravel()
+            if legslab.ndim == 3:
+                # Negative frequencies are folded in Legendre weights of real and imaginary parts (swapped if antisymmetric)
+                legreal, legimag = legslab if hermitian_symmetric > 0 else legslab[::-1]
+            else:
+                legreal = legimag = legslab
+            if kernel is not None:
+                kernel(multi_index, legreal, legimag, yslab.real, yslab.imag if iscomplex else yslab, iscomplex, local)
+                continue
+
+            # Fill in quantities to be summed in each bin: y weighted by Legendre(ell, mu),
+            # for all multipoles at once, as a (nell, N) matrix of Legendre weights times y
+            channels = np.empty((nchannels - 2, multi_index.size), dtype='f8')
+            if iscomplex:
+                np.multiply(legreal, yslab.real, out=channels[::2])
+                np.multiply(legimag, yslab.imag, out=channels[1::2])
+            else:
+                np.multiply(legreal, yslab, out=channels)
 
-            # Compute multipoles by weighting by Legendre(ell, mu)
-            for ill, ell in enumerate(unique_ells):
+            # Sum up all channels in each bin at once
+            ycsum += np.bincount((channel_offsets + multi_index).ravel(), weights=channels.ravel(), minlength=ycsum.size).reshape(ycsum.shape)
 
-                weightedy3d = (2. * ell + 1.) * legpoly[ill](mu)
+    if kernel is not None:
+        local.sum(axis=0, out=ycsum)
+        del local
 
-                if hermitian_symmetric and imu:
-                    # Weight the input 3D array by the appropriate Legendre polynomial
-                    weightedy3d = hermitian_symmetric * weightedy3d * y3d[islab][nonsingular[0]].conj()  # hermitian_symmetric is 1 or -1
-                else:
-                    weightedy3d = weightedy3d * y3d[islab, ...]
+    # x, mu sums and mode counts are complete once all blocks have been iterated over
+    nsum = geometry['nsum'].copy()
+    csum[:2] = geometry['xmusum']
 
-                # Sum up the weighted y in each bin
-                ysum[ill, ...].real.flat += np.bincount(multi_index, weights=weightedy3d.real.flat, minlength=nsum.size)
-                if np.iscomplexobj(ysum):
-                    ysum[ill, ...].imag.flat += np.bincount(multi_index, weights=weightedy3d.imag.flat, minlength=nsum.size)
+    # Sum binning arrays across all ranks, in place; uppercase Allreduce avoids pickling arrays
+    # All channels are reduced at once, in double precision, then mode counts
+    for array in [csum, nsum]:
+        comm.Allreduce(MPI.IN_PLACE, array, op=MPI.SUM)
 
-    # Sum binning arrays across all ranks
-    xsum = comm.allreduce(xsum)
-    musum = comm.allreduce(musum)
-    ysum = comm.allreduce(ysum)
-    nsum = comm.allreduce(nsum)
+    nsum.shape = (nx + 3, nmu + 3)
+    csum.shape = (nchannels, nx + 3, nmu + 3)
+    xsum, musum = csum[:2]
+    if iscomplex:
+        ysum = csum[2::2] + 1j * csum[3::2]
+    else:
+        ysum = csum[2:]
+    ysum = ysum.astype(y3d.dtype, copy=False)
 
     # It is not clear how to proceed with beyond Nyquist frequencies
     # At Nyquist, kN = - pi * N / L (appears once in y3d.x) is the same as pi * N / L, so corresponds to mu and -mu
     # Our treatment of hermitian symmetric field would sum this frequency twice (mu and -mu)
     # But this would appear only once in uncompressed field
     # As a default, set frequencies beyond to NaN
+    cellsize = y3d.BoxSize / y3d.Nmesh if isinstance(y3d, RealField) else 2. * np.pi / y3d.BoxSize
     xmax = y3d.Nmesh // 2 * cellsize
     mask_beyond_nyq = np.flatnonzero(xedges >= np.min(xmax))
     xsum[mask_beyond_nyq] = np.nan
@@ -366,7 +749,7 @@ def project_to_basis(y3d, edges, los=(0, 0, 1), ells=None, antisymmetric=False,
             xmean1d = xsum[sl, sl].sum(axis=-1) / n1d
             poles = ysum[:, sl, sl].sum(axis=-1) / n1d
             poles_zero = ysum[:, nx + 2, nmu + 2]
-            poles, poles_zero = (tmp[[unique_ells.index(ell) for ell in ells], ...] for tmp in (poles, poles_zero))
+            poles, poles_zero = (tmp[_get_ell_indices(ells, unique_ells), ...] for tmp in (poles, poles_zero))
 
     # Return y(x,mu) + (possibly empty) multipoles
     toret = [(xmean2d, mumean2d, y2d, n2d, zero2d)]
@@ -401,19 +784,47 @@ def find_unique_edges(x, x0, xmin=0., xmax=np.inf, mpicomm=mpi.COMM_WORLD):
     edges : array
         Edges, starting at 0, such that each bin contains a unique value of Cartesian distances.
     """
-    def unique_index(x2):
-        return np.unique(np.int64(x2 / (0.5 * x0)**2 + 0.5), return_index=True)[1]
+    # Squared distances are binned in units of (x0 / 2)^2; each bin (key) is represented by the actual squared distance
+    # of its first mode (in flattened order, then rank order), as with np.unique(..., return_index=True)
+    unit2 = (0.5 * x0)**2
+
+    def get_key(fx2):
+        return np.int64(fx2 / unit2 + 0.5)
+
+    def unique_first(fx2):
+        # Squared distances take much fewer unique keys than the number of cells,
+        # so find the first mode of each key with a scatter over key values (O(N + K)) rather than sorting them all (O(N log N))
+        key = get_key(fx2)
+        if key.size and key.max() <= key.size:
+            first = np.full(key.max() + 1, key.size, dtype='i8')
+            np.minimum.at(first, key, np.arange(key.size))
+            return fx2[first[first < key.size]]
+        return fx2[np.unique(key, return_index=True)[1]]
 
     def unique_local(x):
-        fx2 = sum(xi**2 for xi in x).ravel()
-        fx2 = fx2[unique_index(fx2)]
+        fx2 = unique_first(np.ravel(sum(xi**2 for xi in x)))
         return fx2[(fx2 >= xmin**2) & (fx2 <= xmax**2)]
 
     fx2 = unique_local(x)
     if mpicomm is not None:
-        fx2 = np.concatenate(mpicomm.allgather(fx2), axis=0)
-    # may have duplicates after allgather
-    fx = fx2[unique_index(fx2)]**0.5
+        # Each rank holds most unique keys: rather than gathering them on all ranks (O(nranks * nkeys) communication),
+        # reduce arrays over key values (O(max key)), unless keys are too sparse
+        key = get_key(fx2)
+        maxkey = mpicomm.allreduce(key.max(initial=-1), op=MPI.MAX)
+        if maxkey + 1 <= 8 * mpicomm.allreduce(key.size):
+            # First rank holding each key, then its squared distances (zero on other ranks)
+            owner = np.full(maxkey + 1, mpicomm.size, dtype='i4')
+            owner[key] = mpicomm.rank
+            mpicomm.Allreduce(MPI.IN_PLACE, owner, op=MPI.MIN)
+            values = np.zeros(maxkey + 1, dtype=fx2.dtype)
+            values[key] = np.where(owner[key] == mpicomm.rank, fx2, 0.)
+            mpicomm.Allreduce(MPI.IN_PLACE, values, op=MPI.SUM)
+            fx2 = values[owner < mpicomm.size]
+        else:
+            # may have duplicates after allgather
+            fx2 = np.concatenate(mpicomm.allgather(fx2), axis=0)
+            fx2 = fx2[np.unique(get_key(fx2), return_index=True)[1]]
+    fx = fx2**0.5
 
     # now make edges around unique coordinates
     width = np.diff(fx)
@@ -421,17 +832,246 @@ def find_unique_edges(x, x0, xmin=0., xmax=np.inf, mpicomm=mpi.COMM_WORLD):
     return edges
 
 
+def _get_ell_indices(ells, reference):
+    # Indices of multipoles ells in reference multipoles, through a dictionary rather than repeated reference.index(ell)
+    index = {ell: ill for ill, ell in enumerate(reference)}
+    try:
+        return np.array([index[ell] for ell in ells], dtype='i8')
+    except KeyError as exc:
+        raise ValueError('Multipole {} is not in {}'.format(exc.args[0], tuple(reference))) from exc
+
+
+def _select_parts(array, parts=None):
+    # Return real or imaginary part of array (if parts is 'real' or 'imag'), or of each of its rows (if parts is a list of these)
+    if parts is None:
+        return array
+    if isinstance(parts, str):
+        return getattr(np.asarray(array), parts)
+    array = np.asarray(array)
+    if np.iscomplexobj(array) and len(parts) == len(array):
+        # Single copy of the real part, then imaginary part of selected rows
+        isimag = np.array([part == 'imag' for part in parts], dtype='?')
+        toret = array.real.copy()
+        toret[isimag] = array.imag[isimag]
+        return toret
+    return np.array([getattr(np.asarray(arr), part) for arr, part in zip(array, parts)])
+
+
+def _deepcopy_value(value):
+    # Return deep copy of value: numpy arrays (alone or in lists) are copied directly,
+    # without going through copy.deepcopy's introspection; other values go through copy.deepcopy
+    import copy
+
+    def copy_array(value):
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            return value.copy(order='K')
+        return copy.deepcopy(value)
+
+    if isinstance(value, list):
+        return [copy_array(v) for v in value]
+    return copy_array(value)
+
+
+def _deepcopy_statistics(self):
+    # Return deep copy of statistics self, see _deepcopy_value; the MPI communicator is shared
+    new = self.__class__.__new__(self.__class__)
+    for name, value in self.__dict__.items():
+        if name != 'mpicomm':
+            value = _deepcopy_value(value)
+        new.__dict__[name] = value
+    return new
+
+
+def _format_array(array, fmt='%.12e'):
+    # Format input array as an array of strings: integers with '%d', floats with fmt,
+    # complex numbers as real and (signed) imaginary parts with fmt followed by 'j', e.g. 1.0e+00-2.0e+00j
+    array = np.asarray(array)
+    if np.issubdtype(array.dtype, np.integer):
+        return np.char.mod('%d', array)
+    if np.iscomplexobj(array):
+        real, imag = np.char.mod(fmt, array.real), np.char.mod(fmt, array.imag)
+        sign = np.where(np.char.startswith(imag, '+') | np.char.startswith(imag, '-'), '', '+')
+        return np.char.add(np.char.add(real, sign), np.char.add(imag, 'j'))
+    return np.char.mod(fmt, array)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_formatter(fmt='%.12e'):
+    # np.array2string formatter, consistent with _format_array; built once per fmt
+
+    def complex_kind(x):
+        imag = fmt % x.imag
+        if imag[0] not in ('+', '-'): imag = '+' + imag
+        return '{}{}j'.format(fmt % x.real, imag)
+
+    return {'int_kind': lambda x: '%d' % x, 'float_kind': lambda x: fmt % x, 'complex_kind': complex_kind}
+
+
+def _interp_linear(x, xp, fp):
+    # Linear interpolation of (possibly complex) fp, sampled at increasing xp along its first axis, at x;
+    # fp is constant outside of xp range, as scipy.interpolate.UnivariateSpline(xp, fp, k=1, s=0, ext='const')
+    # Output shape is x.shape + fp.shape[1:]; the bin search is shared by all trailing dimensions of fp
+    x, xp, fp = np.asarray(x), np.asarray(xp), np.asarray(fp)
+    if np.iscomplexobj(fp) and not np.any(fp.imag):
+        # Zero imaginary part (e.g. even multipoles): real arithmetic only
+        return _interp_linear(x, xp, fp.real).astype(fp.dtype)
+    if xp.size == 1:
+        return np.broadcast_to(fp[0], x.shape + fp.shape[1:]).copy()
+    if x.size * np.prod(fp.shape[1:], dtype='i8') >= _numba_min_size:
+        kernel = _get_interp_linear_kernel()
+        if kernel is not None:
+            dtype = np.result_type(x, xp, fp, 'f8')
+            toret = np.empty((x.size, np.prod(fp.shape[1:], dtype='i8')), dtype=dtype)
+            kernel(x.ravel().astype('f8'), xp.astype('f8'), fp.reshape(xp.size, -1).astype(dtype), toret)
+            return toret.reshape(x.shape + fp.shape[1:])
+    x = np.clip(x, xp[0], xp[-1])
+    index = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, xp.size - 2)
+    frac = ((x - xp[index]) / (xp[index + 1] - xp[index])).reshape(x.shape + (1,) * (fp.ndim - 1))
+    return (1. - frac) * fp[index] + frac * fp[index + 1]
+
+
+# Approximate number of elements processed at once by the numpy evaluation of Ylm on mesh slabs,
+# such that its (many) temporaries fit in (L2) cache
+_tile_size = 2**15
+
+
+def _get_tiles(shape):
+    # Return slices along the first (slowest) axis of an array of input shape, each holding about _tile_size elements
+    step = max(_tile_size // max(int(np.prod(shape[1:], dtype='i8')), 1), 1)
+    return [slice(start, start + step) for start in range(0, shape[0], step)]
+
+
+@functools.lru_cache(maxsize=1)
+def _get_interp_linear_kernel():
+    # numba kernel for _interp_linear, fusing bin search and interpolation, parallelized over evaluation points;
+    # None if numba is not available
+    try: import numba
+    except ImportError: return None
+
+    @numba.njit(parallel=True)
+    def kernel(x, xp, fp, out):
+        nxp = xp.size
+        for ix in numba.prange(x.size):
+            xx = min(max(x[ix], xp[0]), xp[nxp - 1])
+            index = min(max(np.searchsorted(xp, xx, side='right') - 1, 0), nxp - 2)
+            frac = (xx - xp[index]) / (xp[index + 1] - xp[index])
+            for iy in range(fp.shape[1]):
+                out[ix, iy] = (1. - frac) * fp[index, iy] + frac * fp[index + 1, iy]
+
+    return kernel
+
+
+@functools.lru_cache(maxsize=1)
+def _get_conj_mul_kernel():
+    # numba kernel for _conj_mul_inplace, single pass over memory; None if numba is not available
+    try: import numba
+    except ImportError: return None
+
+    @numba.njit(parallel=True)
+    def kernel(a, b):
+        for i in numba.prange(a.size):
+            a[i] = a[i].conjugate() * b[i]
+
+    return kernel
+
+
+def _conj_mul_inplace(a, b):
+    # Compute a.conj() * b in place in a (complex arrays of same shape), without temporary;
+    # b may be a itself (autocorrelation), giving |a|^2
+    if a.size >= _numba_min_size and a.flags.c_contiguous and b.flags.c_contiguous and a.dtype == b.dtype:
+        kernel = _get_conj_mul_kernel()
+        if kernel is not None:
+            kernel(a.reshape(-1), b.reshape(-1))
+            return
+    same = np.shares_memory(a, b)
+    # Slab-by-slab to limit memory footprint
+    for islab in range(a.shape[0]):
+        if same:
+            np.multiply(a[islab].conj(), b[islab], out=a[islab])
+        else:
+            np.conjugate(a[islab], out=a[islab])
+            np.multiply(a[islab], b[islab], out=a[islab])
+
+
 def _transform_rslab(rslab, boxsize):
     # We do not use the same conventions as pmesh:
     # rslab < 0 is sent back to [boxsize/2, boxsize]
+    # Coordinates are broadcastable 1D arrays (one per axis): update them in place, in a single pass
     toret = []
     for ii, rr in enumerate(rslab):
-        mask = rr < 0.
-        rr[mask] += boxsize[ii]
+        np.add(rr, boxsize[ii], out=rr, where=rr < 0.)
         toret.append(rr)
     return toret
 
 
+@functools.lru_cache(maxsize=1)
+def _get_normalize_vectors_kernel():
+    # numba kernel for _normalize_vectors, computing norm and unit vectors of a 3D mesh from 1D coordinates
+    # along each axis, in a single pass; None if numba is not available
+    try: import numba
+    except ImportError: return None
+
+    @numba.njit(parallel=True)
+    def kernel(x, y, z, norm, xhat, yhat, zhat):
+        for i in numba.prange(x.size):
+            for j in range(y.size):
+                for k in range(z.size):
+                    tmp = np.sqrt(x[i]**2 + y[j]**2 + z[k]**2)
+                    norm[i, j, k] = tmp
+                    if tmp != 0.:
+                        xhat[i, j, k] = x[i] / tmp
+                        yhat[i, j, k] = y[j] / tmp
+                        zhat[i, j, k] = z[k] / tmp
+                    else:
+                        xhat[i, j, k] = yhat[i, j, k] = zhat[i, j, k] = 0.
+
+    return kernel
+
+
+def _normalize_vectors(slab, dtype=None):
+    # Return unit vectors (as a list of full arrays of type dtype, one per axis) and norm of the mesh of vectors
+    # whose coordinates are the broadcastable arrays slab; 0 where the norm is 0.
+    shape = np.broadcast_shapes(*[xx.shape for xx in slab])
+    hdtype = np.result_type(*slab) if dtype is None else dtype
+    if len(slab) == 3 and np.prod(shape, dtype='i8') >= _numba_min_size and all(xx.ndim == 3 and xx.size == xx.shape[ii] for ii, xx in enumerate(slab)):
+        # Coordinates along each axis: norm and unit vectors in a single pass, without temporaries
+        kernel = _get_normalize_vectors_kernel()
+        if kernel is not None:
+            norm = np.empty(shape, dtype=np.result_type(*slab))
+            toret = [np.empty(shape, dtype=hdtype) for xx in slab]
+            kernel(*[xx.ravel() for xx in slab], norm, *toret)
+            return toret, norm
+    norm = sum(xx**2 for xx in slab)
+    np.sqrt(norm, out=norm)
+    nonzero = norm != 0.
+    # Division with a mask in a single pass, instead of dividing then masking the result
+    toret = [np.divide(xx, norm, out=np.zeros(norm.shape, dtype=hdtype), where=nonzero) for xx in slab]
+    return toret, norm
+
+
+def _get_unit_grids(rfield, cfield, boxsize, offset):
+    # Return the unit vector grids xhat (real space, positions x + offset) and khat (Fourier space) of rfield and cfield,
+    # as lists of 3 (read-only) arrays, in the (real) precision of rfield, e.g. float32 for single precision meshes;
+    # coordinates are computed in double precision. These only depend on the geometry (mesh size, box, local slab layout),
+    # which is keyed by the broadcastable 1D coordinate arrays of each axis. The last grids are cached if they fit in
+    # _cache_max_bytes, such that repeated runs with the same geometry (e.g. over mocks) skip this computation.
+    rslab = [xx.real.astype('f8') + offset[ii] for ii, xx in enumerate(_transform_rslab(rfield.slabs.optx, boxsize))]
+    kslab = [kk.real.astype('f8') for kk in cfield.slabs.optx]
+    dtype = rfield.dtype
+    key = (dtype.str,) + tuple((xx.shape, xx.tobytes()) for xx in rslab + kslab)
+    toret = _get_cache('unit_grids', key)
+    if toret is not None:
+        return toret
+
+    toret = []
+    for slab in [rslab, kslab]:
+        hat = _normalize_vectors(slab, dtype=dtype)[0]
+        for xx in hat: xx.flags.writeable = False
+        toret.append(hat)
+    _set_cache('unit_grids', key, toret, sum(xx.nbytes for hat in toret for xx in hat))
+    return toret
+
+
 class BasePowerSpectrumStatistics(BaseClass):
     """
     Base template power statistic class.
@@ -447,7 +1087,7 @@ class BasePowerSpectrumStatistics(BaseClass):
     _coords_names = ['k']
     _power_names = ['P(k)']
 
-    def __init__(self, edges, modes, power_nonorm, nmodes, wnorm=1., shotnoise_nonorm=0., power_zero_nonorm=None, power_direct_nonorm=None, attrs=None, mpicomm=None):
+    def __init__(self, edges, modes, power_nonorm, nmodes, wnorm=1., shotnoise_nonorm=0., power_zero_nonorm=None, power_direct_nonorm=None, attrs=None, mpicomm=None, dtype=None):
         r"""
         Initialize :class:`BasePowerSpectrumStatistics`.
 
@@ -484,28 +1124,53 @@ class BasePowerSpectrumStatistics(BaseClass):
 
         mpicomm : MPI communicator, default=None
             The MPI communicator, only used when saving (:meth:`save` and :meth:`save_txt`) statistics.
+
+        dtype : string, np.dtype, default=None
+            If not ``None``, type to cast :attr:`power_nonorm`, :attr:`power_zero_nonorm` and :attr:`power_direct_nonorm` to,
+            e.g. 'c8' to halve the memory footprint of statistics (and operations on them) obtained with single-precision meshes.
         """
         if np.ndim(edges[0]) == 0: edges = (edges,)
         if np.ndim(modes[0]) == 0: modes = (modes,)
         self.edges = list(np.asarray(edge) for edge in edges)
         self.modes = list(np.asarray(mode) for mode in modes)
-        self.power_nonorm = np.asarray(power_nonorm)
+        self.power_nonorm = np.asarray(power_nonorm, dtype=dtype)
         self.power_zero_nonorm = power_zero_nonorm
         if power_zero_nonorm is None:
             self.power_zero_nonorm = np.zeros(self.power_nonorm.shape[:self.power_nonorm.ndim - self.ndim], dtype=self.power_nonorm.dtype)
         else:
-            self.power_zero_nonorm = np.asarray(power_zero_nonorm)
+            self.power_zero_nonorm = np.asarray(power_zero_nonorm, dtype=dtype)
         self.power_direct_nonorm = power_direct_nonorm
         if power_direct_nonorm is None:
             self.power_direct_nonorm = np.zeros_like(self.power_nonorm)
         else:
-            self.power_direct_nonorm = np.asarray(power_direct_nonorm)
+            self.power_direct_nonorm = np.asarray(power_direct_nonorm, dtype=dtype)
         self.nmodes = np.asarray(nmodes)
         self.wnorm = wnorm
         self.shotnoise_nonorm = shotnoise_nonorm
         self.mpicomm = mpicomm
         self.attrs = attrs or {}
 
+    def _get_power_parts(self, complex=True, parts='real'):
+        # Parts ('real', 'imag', or list of these for each row) of the power spectrum to compute if ``complex`` is ``False``;
+        # None if the full power spectrum must be computed
+        if complex or not np.iscomplexobj(self.power_nonorm) or np.any(np.imag(self.wnorm)):
+            return None
+        return parts
+
+    def _get_power_nonorm(self, add_direct=True, null_zero_mode=True, parts=None):
+        # Return power spectrum, without shot noise subtraction and normalization
+        # If parts is provided, only compute the real or imaginary parts (see _select_parts),
+        # such that the other half of complex arrays is never used
+        toret = np.array(_select_parts(self.power_nonorm, parts))
+        if add_direct:
+            toret += _select_parts(self.power_direct_nonorm, parts)
+        if null_zero_mode:
+            dig_zero = tuple(np.digitize(0., edges, right=False) - 1 for edges in self.edges)
+            if all(0 <= dig_zero[ii] < self.shape[ii] for ii in range(self.ndim)):
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    toret[(Ellipsis,) * (toret.ndim - self.ndim) + dig_zero] -= _select_parts(self.power_zero_nonorm, parts) / self.nmodes[dig_zero]
+        return toret
+
     def get_power(self, add_direct=True, remove_shotnoise=True, null_zero_mode=True, divide_wnorm=True, complex=True):
         """
         Return power spectrum, computed using various options.
@@ -532,18 +1197,12 @@ class BasePowerSpectrumStatistics(BaseClass):
         -------
         power : array
         """
-        toret = self.power_nonorm.copy()
-        if add_direct:
-            toret += self.power_direct_nonorm
+        parts = self._get_power_parts(complex=complex)
+        toret = self._get_power_nonorm(add_direct=add_direct, null_zero_mode=null_zero_mode, parts=parts)
         if remove_shotnoise:
-            toret -= self.shotnoise_nonorm
-        if null_zero_mode:
-            dig_zero = tuple(np.digitize(0., edges, right=False) - 1 for edges in self.edges)
-            if all(0 <= dig_zero[ii] < self.shape[ii] for ii in range(self.ndim)):
-                with np.errstate(divide='ignore', invalid='ignore'):
-                    toret[(Ellipsis,) * (toret.ndim - self.ndim) + dig_zero] -= self.power_zero_nonorm / self.nmodes[dig_zero]
+            toret -= _select_parts(self.shotnoise_nonorm, parts)
         if divide_wnorm:
-            toret /= self.wnorm
+            toret /= self.wnorm if parts is None else np.real(self.wnorm)
         if not complex and np.iscomplexobj(toret):
             toret = toret.real
         return toret
@@ -600,7 +1259,7 @@ class BasePowerSpectrumStatistics(BaseClass):
         if method is None:
             axes_to_sum_over = tuple(ii for ii in range(self.ndim) if ii != axis)
             with np.errstate(divide='ignore', invalid='ignore'):
-                toret = np.sum(_nan_to_zero(self.modes[axis]) * self.nmodes, axis=axes_to_sum_over) / np.sum(self.nmodes, axis=axes_to_sum_over)
+                toret = np.sum(_nan_to_zero(self.modes[axis], weights=self.nmodes), axis=axes_to_sum_over) / np.sum(self.nmodes, axis=axes_to_sum_over)
         elif isinstance(method, str):
             allowed_methods = ['mid']
             method = method.lower()
@@ -711,11 +1370,11 @@ class BasePowerSpectrumStatistics(BaseClass):
             if array is None: continue
             if isinstance(array, list):
                 with np.errstate(divide='ignore', invalid='ignore'):
-                    array = [utils.rebin(_nan_to_zero(arr) * nmodes, new_shape, statistic=np.sum) / self.nmodes for arr in array]
+                    array = [utils.rebin(_nan_to_zero(arr, weights=nmodes), new_shape, statistic=np.sum) / self.nmodes for arr in array]
             else:
                 extradim = array.ndim > self.ndim
                 with np.errstate(divide='ignore', invalid='ignore'):
-                    array = np.asarray([utils.rebin(_nan_to_zero(arr) * nmodes, new_shape, statistic=np.sum) / self.nmodes for arr in array.reshape((-1,) + self.shape)])
+                    array = np.asarray([utils.rebin(_nan_to_zero(arr, weights=nmodes), new_shape, statistic=np.sum) / self.nmodes for arr in array.reshape((-1,) + self.shape)])
                     array.shape = (-1,) * extradim + new_shape
             setattr(self, name, array)
         self.edges = [edges[::f] for edges, f in zip(self.edges, factor)]
@@ -740,11 +1399,7 @@ class BasePowerSpectrumStatistics(BaseClass):
         return new
 
     def deepcopy(self):
-        import copy
-        new = copy.deepcopy(self)
-        if hasattr(self, 'mpicomm'):
-            new.mpicomm = self.mpicomm
-        return new
+        return _deepcopy_statistics(self)
 
     @classmethod
     def sum(cls, *others):
@@ -806,14 +1461,7 @@ class BasePowerSpectrumStatistics(BaseClass):
         if not self.with_mpi or self.mpicomm.rank == 0:
             self.log_info('Saving {}.'.format(filename))
             utils.mkdir(os.path.dirname(filename))
-            formatter = {'int_kind': lambda x: '%d' % x, 'float_kind': lambda x: fmt % x}
-
-            def complex_kind(x):
-                imag = fmt % x.imag
-                if imag[0] not in ['+', '-']: imag = '+' + imag
-                return '{}{}j'.format(fmt % x.real, imag)
-
-            formatter['complex_kind'] = complex_kind
+            formatter = _get_formatter(fmt=fmt)
             if header is None: header = []
             elif isinstance(header, str): header = [header]
             else: header = list(header)
@@ -826,6 +1474,9 @@ class BasePowerSpectrumStatistics(BaseClass):
                     value = 'None'
                 elif any(name.startswith(key) for key in ['los_type', 'resampler']):
                     value = str(value)
+                elif np.ndim(value) == 0 and np.asarray(value).dtype.kind in 'iufc':
+                    # Numerical scalars do not need the numpy formatter machinery
+                    value = str(_format_array(value, fmt=fmt))
                 else:
                     value = np.array2string(np.array(value), separator=delimiter, formatter=formatter).replace('\n', '')
                 header.append('{} = {}'.format(name, value))
@@ -838,22 +1489,24 @@ class BasePowerSpectrumStatistics(BaseClass):
                 labels += ['{}mid'.format(name), '{}avg'.format(name)]
             labels += self._power_names
             power = self.get_power(**kwargs)
-            columns = [self.nmodes.flat]
-            mids = np.meshgrid(*(self.modeavg(idim, method='mid') for idim in range(self.ndim)), indexing='ij')
+            columns = [self.nmodes.ravel()]
+            mids = np.meshgrid(*(self.modeavg(idim, method='mid') for idim in range(self.ndim)), indexing='ij', sparse=True)
             for idim in range(self.ndim):
-                columns += [mids[idim].flat, self.modes[idim].flat]
+                columns += [np.broadcast_to(mids[idim], self.shape).ravel(), self.modes[idim].ravel()]
             for column in power.reshape((-1,) * (power.ndim == self.ndim) + power.shape):
-                columns += [column.flat]
-            columns = [[np.array2string(value, formatter=formatter) for value in column] for column in columns]
-            widths = [max(max(map(len, column)) - len(comments) * (icol == 0), len(label)) for icol, (column, label) in enumerate(zip(columns, labels))]
+                columns += [column.ravel()]
+            # Format whole columns at once, rather than each value with np.array2string
+            columns = [_format_array(column, fmt=fmt) for column in columns]
+            widths = [max(int(np.char.str_len(column).max()) - len(comments) * (icol == 0), len(label)) for icol, (column, label) in enumerate(zip(columns, labels))]
             widths[-1] = 0  # no need to leave a space
             header.append((' ' * len(delimiter)).join(['{:<{width}}'.format(label, width=width) for label, width in zip(labels, widths)]))
             widths[0] += len(comments)
-            with open(filename, 'w') as file:
-                for line in header:
-                    file.write(comments + line + '\n')
-                for irow in range(len(columns[0])):
-                    file.write(delimiter.join(['{:<{width}}'.format(column[irow], width=width) for column, width in zip(columns, widths)]) + '\n')
+            row_fmt = delimiter.join(['{{:<{:d}}}'.format(width) for width in widths])
+            lines = [comments + line for line in header]
+            lines += [row_fmt.format(*row) for row in zip(*columns)]
+            # Single write of the encoded output; binary mode skips the text layer (newline translation, per-write encoding)
+            with open(filename, 'wb') as file:
+                file.write(''.join(line + '\n' for line in lines).encode('utf-8'))
 
         # if self.with_mpi:
         #     self.mpicomm.Barrier()
@@ -978,26 +1631,19 @@ class PowerSpectrumWedges(BasePowerSpectrumStatistics):
         k, mu = np.asarray(k), np.asarray(mu)
         toret_shape = k.shape + mu.shape
         k, mu = k.ravel(), mu.ravel()
-        toret = np.nan * np.zeros((k.size, mu.size), dtype=power.dtype)
         mask_k = (k >= self.edges[0][0]) & (k <= self.edges[0][-1])
         mask_mu = (mu >= self.edges[1][0]) & (mu <= self.edges[1][-1])
         k_masked, mu_masked = k[mask_k], mu[mask_mu]
         if k_masked.size and mu_masked.size:
-            if muavg.size == 1:
-
-                def interp(array):
-                    return UnivariateSpline(kavg, array, k=1, s=0, ext='const')(k_masked)[:, None]
-
-            else:
-                i_k = np.argsort(k_masked); ii_k = np.argsort(i_k)
-                i_mu = np.argsort(mu_masked); ii_mu = np.argsort(i_mu)
-
-                def interp(array):
-                    return RectBivariateSpline(kavg, muavg, array, kx=1, ky=1, s=0)(k_masked[i_k], mu_masked[i_mu], grid=True)[np.ix_(ii_k, ii_mu)]
-
-            toret[np.ix_(mask_k, mask_mu)] = interp(power.real)
-            if complex and np.iscomplexobj(power):
-                toret[np.ix_(mask_k, mask_mu)] += 1j * interp(power.imag)
+            # Bilinear interpolation, performed on real and imaginary parts at once
+            interp = _interp_linear(mu_masked, muavg, _interp_linear(k_masked, kavg, power).T).T
+        if k_masked.size == k.size and mu_masked.size == mu.size and k.size and mu.size:
+            # All points within edges: no nan-filled output to allocate
+            toret = np.asarray(interp, dtype=power.dtype, order='C')
+        else:
+            toret = np.full((k.size, mu.size), np.nan, dtype=power.dtype)
+            if k_masked.size and mu_masked.size:
+                toret[np.ix_(mask_k, mask_mu)] = interp
 
         toret.shape = toret_shape
         if return_k:
@@ -1033,9 +1679,15 @@ class PowerSpectrumWedges(BasePowerSpectrumStatistics):
         if ax is None: fig, ax = plt.subplots()
         k, power = self.k, self(complex=False)
         wedges = self.edges[1]
-        for iwedge, wedge in enumerate(zip(wedges[:-1], wedges[1:])):
-            ax.plot(k[:, iwedge], k[:, iwedge] * power[:, iwedge], label=r'${:.2f} < \mu < {:.2f}$'.format(*wedge))
-        ax.legend()
+        # All wedges in a single artist; proxy lines for the legend
+        from matplotlib.collections import LineCollection
+        from matplotlib.lines import Line2D
+        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        colors = [colors[iwedge % len(colors)] for iwedge in range(len(wedges) - 1)]
+        segments = np.stack([k, k * power], axis=-1).transpose(1, 0, 2)
+        ax.add_collection(LineCollection(segments, colors=colors))
+        ax.autoscale_view()
+        ax.legend(handles=[Line2D([], [], color=color, label=r'${:.2f} < \mu < {:.2f}$'.format(*wedge)) for color, wedge in zip(colors, zip(wedges[:-1], wedges[1:]))])
         ax.grid(True)
         ax.set_xlabel(r'$k$ [$h/\mathrm{Mpc}$]')
         ax.set_ylabel(r'$k P(k, \mu)$ [$(\mathrm{Mpc}/h)^{2}$]')
@@ -1115,12 +1767,13 @@ class PowerSpectrumMultipoles(BasePowerSpectrumStatistics):
         mu = (muedges[:-1] + muedges[1:]) / 2.
         dmu = np.diff(muedges)
         edges = (self.kedges.copy(), muedges)
-        modes = (np.repeat(self.modes[0][:, None], len(dmu), axis=-1), np.repeat(mu[None, :], len(self.k), axis=0))
-        power_nonorm, power_direct_nonorm = 0, 0
-        for ell in ells:
-            poly = np.diff(special.legendre(ell).integ()(muedges)) / dmu
-            power_nonorm += self.power_nonorm[self.ells.index(ell), ..., None] * poly
-            power_direct_nonorm += self.power_direct_nonorm[self.ells.index(ell), ..., None] * poly
+        shape = (len(self.k), len(dmu))
+        modes = (np.broadcast_to(self.modes[0][:, None], shape), np.broadcast_to(mu[None, :], shape))  # read-only views, no copy
+        matrix = _get_legendre_wedge_matrix(tuple(muedges.tolist()), tuple(ells))
+        indices = _get_ell_indices(ells, self.ells)
+        # Keep input (floating-point) precision, as the Legendre matrix is float64
+        power_nonorm, power_direct_nonorm = (np.tensordot(array[indices], matrix, axes=(0, 0)).astype(np.result_type(array, 'f4'), copy=False)
+                                             for array in (self.power_nonorm, self.power_direct_nonorm))
         if 0 in self.ells:
             power_zero_nonorm = self.power_zero_nonorm[self.ells.index(0)]
         else:
@@ -1156,13 +1809,16 @@ class PowerSpectrumMultipoles(BasePowerSpectrumStatistics):
         -------
         power : array
         """
-        toret = super(PowerSpectrumMultipoles, self).get_power(add_direct=add_direct, remove_shotnoise=False, null_zero_mode=null_zero_mode, divide_wnorm=False, complex=True)
+        # If complex is False, only compute real part for even multipoles, imaginary part for odd multipoles
+        ellparts = ['real' if ell % 2 == 0 else 'imag' for ell in self.ells]
+        parts = self._get_power_parts(complex=complex, parts=ellparts)
+        toret = self._get_power_nonorm(add_direct=add_direct, null_zero_mode=null_zero_mode, parts=parts)
         if remove_shotnoise and 0 in self.ells:
-            toret[self.ells.index(0)] -= self.shotnoise_nonorm
+            toret[self.ells.index(0)] -= _select_parts(self.shotnoise_nonorm, parts and 'real')
         if divide_wnorm:
-            toret /= self.wnorm
+            toret /= self.wnorm if parts is None else np.real(self.wnorm)
         if not complex and np.iscomplexobj(toret):
-            toret = np.array([toret[ill].real if ell % 2 == 0 else toret[ill].imag for ill, ell in enumerate(self.ells)], dtype=toret.real.dtype)
+            toret = _select_parts(toret, ellparts)
         return toret
 
     def __call__(self, ell=None, k=None, return_k=False, complex=True, **kwargs):
@@ -1207,7 +1863,7 @@ class PowerSpectrumMultipoles(BasePowerSpectrumStatistics):
             if isscalar: ell = [ell]
         ells = ell
         power = self.get_power(complex=complex, **kwargs)
-        power = power[[self.ells.index(ell) for ell in ells]]
+        power = power[_get_ell_indices(ells, self.ells)]
         kavg = self.k.copy()
         if return_k is None:
             return_k = k is None
@@ -1221,17 +1877,15 @@ class PowerSpectrumMultipoles(BasePowerSpectrumStatistics):
         mask_finite_k = ~np.isnan(kavg) & ~np.isnan(power).any(axis=0)
         kavg, power = kavg[mask_finite_k], power[:, mask_finite_k]
         k = np.asarray(k)
-        toret = np.nan * np.zeros((len(ells),) + k.shape, dtype=power.dtype)
         mask_k = (k >= self.edges[0][0]) & (k <= self.edges[0][-1])
-        k_masked = k[mask_k]
-        if k_masked.size:
-
-            def interp(array):
-                return np.array([UnivariateSpline(kavg, arr, k=1, s=0, ext='const')(k_masked) for arr in array], dtype=array.dtype)
-
-            toret[..., mask_k] = interp(power.real)
-            if complex and np.iscomplexobj(power):
-                toret[..., mask_k] = toret[..., mask_k] + 1j * interp(power.imag)
+        if mask_k.all() and k.size:
+            # All points within edges: no nan-filled output to allocate
+            toret = np.moveaxis(_interp_linear(k, kavg, power.T), -1, 0).astype(power.dtype, copy=False)
+        else:
+            toret = np.full((len(ells),) + k.shape, np.nan, dtype=power.dtype)
+            k_masked = k[mask_k]
+            if k_masked.size:
+                toret[..., mask_k] = _interp_linear(k_masked, kavg, power.T).T
         if isscalar:
             toret = toret[0]
         if return_k:
@@ -1305,17 +1959,25 @@ def normalization_from_nbar(nbar, weights=None, data_weights=None, mpicomm=mpi.C
         Normalization.
     """
     if weights is None:
-        weights = np.ones_like(nbar)
+        sum_nbar_weights, sum_weights = np.sum(nbar), np.size(nbar)
+    else:
+        sum_nbar_weights, sum_weights = np.dot(np.ravel(nbar), np.ravel(weights)), np.sum(weights)
+    # All sums in one collective call
+    sums = np.array([sum_nbar_weights, sum_weights, np.sum(data_weights) if data_weights is not None else 0.], dtype='f8')
+    mpicomm.Allreduce(MPI.IN_PLACE, sums, op=MPI.SUM)
     if data_weights is not None:
-        sum_data_weights = mpicomm.allreduce(np.sum(data_weights))
-        sum_weights = mpicomm.allreduce(np.sum(weights))
-        alpha = sum_data_weights / sum_weights
+        alpha = sums[2] / sums[1]
     else:
         alpha = 1.
-    toret = mpicomm.allreduce(alpha * np.sum(nbar * weights))
+    toret = alpha * sums[0]
     return toret
 
 
+def _csum_product(mesh1, mesh2):
+    # Collective sum of the product of two real meshes, without allocating the product mesh
+    return mesh1.pm.comm.allreduce(np.dot(np.ravel(mesh1.value), np.ravel(mesh2.value)))
+
+
 def normalization(mesh1, mesh2=None, uniform=False, resampler='cic', cellsize=10., fields=None):
     r"""
     Return DESI-like normalization, summing over mesh cells:
@@ -1380,18 +2042,35 @@ def normalization(mesh1, mesh2=None, uniform=False, resampler='cic', cellsize=10
         # boxsize = nmesh * cellsize  # enforce exact cellsize
         cellsize = boxsize / nmesh  # just to get correct shape
 
-        # Assign positions/weights to mesh
-        def get_mesh_nbar(mesh, field='data'):
+        def get_key(mesh, field='data'):
             if field == 'randoms':
                 field = 'data-normalized_randoms'
-            return mesh.clone(data_positions=mesh.data_positions, data_weights=mesh.data_weights, randoms_positions=mesh.randoms_positions, randoms_weights=mesh.randoms_weights,
-                              nmesh=nmesh, boxsize=boxsize, boxcenter=boxcenter, resampler=resampler, interlacing=False, position_type='pos').to_mesh(field=field, compensate=False)
+            return (mesh, field)
+
+        # Assign positions/weights to mesh; each (mesh, field) is painted only once
+        painted = {}
+
+        def get_mesh_nbar(key):
+            if key not in painted:
+                mesh, field = key
+                painted[key] = mesh.clone(data_positions=mesh.data_positions, data_weights=mesh.data_weights, randoms_positions=mesh.randoms_positions, randoms_weights=mesh.randoms_weights,
+                                          nmesh=nmesh, boxsize=boxsize, boxcenter=boxcenter, resampler=resampler, interlacing=False, position_type='pos').to_mesh(field=field, compensate=False)
+            return painted[key]
+
+        keys = [(get_key(mesh1, field=field1), get_key(mesh2, field=field2)) for field1, field2 in fields]
+        # Number of remaining uses of each painted mesh, to release it as soon as possible
+        nuses = {}
+        for key in sum(keys, ()):
+            nuses[key] = nuses.get(key, 0) + 1
 
         # Sum over meshes
         toret = 0.
         nfields = 0
-        for field1, field2 in fields:
-            toret += (get_mesh_nbar(mesh1, field=field1) * get_mesh_nbar(mesh2, field=field2)).csum()
+        for key1, key2 in keys:
+            toret += _csum_product(get_mesh_nbar(key1), get_mesh_nbar(key2))
+            for key in (key1, key2):
+                nuses[key] -= 1
+                if nuses[key] == 0: painted.pop(key, None)
             nfields += 1
         # Meshes are in "weights units" (1/dV missing in each mesh), so multiply by dV * (1/dV)^2
         toret /= nfields * np.prod(cellsize)
@@ -1422,6 +2101,19 @@ def normalization(mesh1, mesh2=None, uniform=False, resampler='cic', cellsize=10
 
 def _get_los(los):
     # Return line-of-sight type (global or local), and line-of-sight vector if global, else None
+    if los is None or isinstance(los, str) or np.ndim(los) == 0:
+        # Hashable input, e.g. 'x', 'firstpoint'; copy to protect the cached vector
+        los_type, los = _get_los_cached(los)
+        return los_type, (los if los is None else los.copy())
+    return _parse_los(los)
+
+
+@functools.lru_cache(maxsize=32)
+def _get_los_cached(los):
+    return _parse_los(los)
+
+
+def _parse_los(los):
     los_type = 'global'
     if los is None:
         los_type = 'firstpoint'
@@ -1608,15 +2300,11 @@ class MeshFFTBase(BaseClass):
         if self.mpicomm.rank == 0:
             self.log_debug('Applying compensations {}.'.format(compensations))
         # Apply compensation window for particle-assignment scheme
-        windows = [_get_compensation_window(**compensation) for compensation in compensations if compensation is not None]
-        if not windows: return
+        compensations = [compensation for compensation in compensations if compensation is not None]
+        if not compensations: return
         # from nbodykit.source.mesh.catalog import CompensateCIC
         # cfield.apply(func=CompensateCIC, kind='circular', out=Ellipsis)
-        cellsize = self.boxsize / self.nmesh
-        for k, slab in zip(cfield.slabs.x, cfield.slabs):
-            kc = tuple(ki * ci for ki, ci in zip(k, cellsize))
-            for window in windows:
-                slab[...] /= window(*kc)
+        _compensate_field(cfield, self.boxsize / self.nmesh, *compensations)
 
     def _get_attrs(self):
         # Return some attributes, to be saved in :attr:`poles` and :attr:`wedges`
@@ -1634,9 +2322,8 @@ class MeshFFTBase(BaseClass):
         return new
 
     def deepcopy(self):
-        import copy
         new = super(MeshFFTBase, self).__copy__()
-        new.attrs = copy.deepcopy(self.attrs)
+        new.attrs = {name: _deepcopy_value(value) for name, value in self.attrs.items()}
         for name in ['wedges', 'poles']:
             if hasattr(new, name):
                 setattr(new, name, getattr(new, name).deepcopy())
@@ -1809,8 +2496,8 @@ class MeshFFTPower(MeshFFTBase):
         del self.mesh2
 
         # cfield1.conj() * cfield2
-        for i, c1, c2 in zip(cfield1.slabs.i, cfield1.slabs, cfield2.slabs):
-            c1[...] = c1.conj() * c2
+        _conj_mul_inplace(cfield1.value, cfield2.value)
+        # for i, c1 in zip(cfield1.slabs.i, cfield1.slabs):
             # mask_zero = True
             # for ii in i: mask_zero = mask_zero & (ii == 0)
             # c1[mask_zero] = 0.
@@ -1848,6 +2535,10 @@ class MeshFFTPower(MeshFFTBase):
 
         # FFT 1st density field and apply the resampler transfer kernel
         A0 = self._to_complex(self.mesh2, copy=True)  # pmesh r2c convention is 1/N^3 e^{-ikr}
+        # Free meshes as soon as they are no longer needed (mesh #1 may still be referenced by rfield1),
+        # before the following allocations, to lower peak memory
+        del self.mesh2
+        if self.autocorr: del self.mesh1
         # Set mean value or real field to 0
         # for i, c in zip(A0.slabs.i, A0.slabs):
         #     mask_zero = True
@@ -1863,25 +2554,30 @@ class MeshFFTPower(MeshFFTBase):
         if self.autocorr:
             if nonzeroells:
                 # Higher-order multipole requested
-                # If monopole requested, copy A0 without window in Aell
-                if 0 in self.ells: Aell = A0.copy()
-                self._compensate(A0, *compensations)
+                # If monopole requested, rather than copying A0 without window, apply a single window to A0,
+                # store |A0|^2 in the buffer that will hold the Aell terms for higher multipoles below, then apply the second window
+                self._compensate(A0, compensations[0])
+                if 0 in self.ells:
+                    Aell = ComplexField(self.pm)
+                    Aell.value[...] = A0.value
+                    _conj_mul_inplace(Aell.value, Aell.value)
+                self._compensate(A0, compensations[1])
             else:
                 # In case of autocorrelation, and only monopole requested, no A0_1 copy need be made
                 # Apply a single window, which will be squared by the autocorrelation
+                # NOTE: without higher multipoles, no Ylm grid is allocated: this path costs as much as the global line-of-sight one
                 if 0 in self.ells: Aell = A0
                 self._compensate(A0, compensations[0])
         else:
             # Cross-correlation, all windows on A0
             if 0 in self.ells: Aell = self._to_complex(self.mesh1, copy=True)  # mesh1 != mesh2!
+            del self.mesh1
             self._compensate(A0, *compensations)
 
-        del self.mesh2, self.mesh1
-
         if 0 in self.ells:
 
-            for islab in range(A0.shape[0]):
-                Aell[islab, ...] = Aell[islab].conj() * A0[islab]
+            if not (self.autocorr and nonzeroells):  # else Aell already holds |A0|^2
+                _conj_mul_inplace(Aell.value, A0.value)
 
             # the 1D monopole
             # from nbodykit.algorithms.fftpower import project_to_basis
@@ -1898,7 +2594,8 @@ class MeshFFTPower(MeshFFTBase):
             # NOTE: this will hold FFTs of density field #1
             rfield = RealField(self.pm)
             cfield = ComplexField(self.pm)
-            Aell = ComplexField(self.pm)
+            # If monopole requested, reuse its buffer: the first m overwrites it
+            if 0 not in self.ells: Aell = ComplexField(self.pm)
 
             # Spherical harmonic kernels (for ell > 0)
             Ylms = [[get_real_Ylm(ell, m) for m in range(-ell, ell + 1)] for ell in nonzeroells]
@@ -1908,65 +2605,65 @@ class MeshFFTPower(MeshFFTBase):
             # offset = self.boxcenter - self.boxsize/2. + 0.5*self.boxsize / self.nmesh # in nbodykit
             # offset = self.boxcenter + 0.5*self.boxsize / self.nmesh # in nbodykit
 
-            def _safe_divide(num, denom):
-                with np.errstate(divide='ignore', invalid='ignore'):
-                    toret = num / denom
-                toret[denom == 0.] = 0.
-                return toret
-
-            # The real-space grid
-            xhat = [xx.real.astype('f8') + offset[ii] for ii, xx in enumerate(_transform_rslab(rfield1.slabs.optx, self.boxsize))]
-            # xhat = [xx.astype('f8') + offset[ii] for ii, xx in enumerate(self.mesh1.slabs.optx)]
-            xnorm = np.sqrt(sum(xx**2 for xx in xhat))
-            xhat = [_safe_divide(xx, xnorm) for xx in xhat]
-            del xnorm
-
-            # The Fourier-space grid
-            khat = [kk.real.astype('f8') for kk in A0.slabs.optx]
-            knorm = np.sqrt(sum(kk**2 for kk in khat))
-            khat = [_safe_divide(kk, knorm) for kk in khat]
-            del knorm
-
-        for ill, ell in enumerate(nonzeroells):
-
-            Aell[:] = 0.
-            # Iterate from m=-ell to m=ell and apply Ylm
-            t0 = time.time()
-            for Ylm in Ylms[ill]:
-                # Reset the real-space mesh to the original density #1
-                rfield[:] = rfield1[:]
-
-                # Apply the config-space Ylm
-                for islab, slab in enumerate(rfield.slabs):
-                    slab[:] *= Ylm(xhat[0][islab], xhat[1][islab], xhat[2][islab])
-
-                # Real to complex of field #2
-                rfield.r2c(out=cfield)
+            # The real-space and Fourier-space unit vector grids, reused across runs with the same geometry
+            xhat, khat = _get_unit_grids(rfield1, A0, self.boxsize, offset)
+
+            # Iterate over ell, and from m=-ell to m=ell, and apply Ylm
+            # NOTE: r2c of all m are not batched in a single (howmany) FFT: pmesh's distributed FFTs do not support it,
+            # and this would require 2 ell + 1 meshes in memory; instead, FFTs are pipelined with Ylm products below
+            terms = [(ill, im, Ylm) for ill in range(len(nonzeroells)) for im, Ylm in enumerate(Ylms[ill])]
+            # With MPI, r2c are dominated by all-to-all communications: each r2c then runs in a worker thread,
+            # while the config-space Ylm of the next term is applied to a second real field.
+            # Only one thread at a time makes MPI calls, which requires MPI.THREAD_SERIALIZED
+            pipeline = self.mpicomm.size > 1 and MPI.Query_thread() >= MPI.THREAD_SERIALIZED
+            rfields = [rfield, RealField(self.pm)] if pipeline else [rfield]
+
+            def apply_config_Ylm(rfield, Ylm):
+                # Apply the config-space Ylm to the original density #1, in a single pass
+                for islab, (slab, slab1) in enumerate(zip(rfield.slabs, rfield1.slabs)):
+                    _apply_Ylm(Ylm, slab, xhat[0][islab], xhat[1][islab], xhat[2][islab], value=slab1)
+
+            with (concurrent.futures.ThreadPoolExecutor(max_workers=1) if pipeline else contextlib.nullcontext()) as executor:
+                apply_config_Ylm(rfields[0], terms[0][2])
+                t0 = time.time()
+                for iterm, (ill, im, Ylm) in enumerate(terms):
+                    ell = nonzeroells[ill]
+                    rfield = rfields[iterm % len(rfields)]
+                    nextterm = terms[iterm + 1] if iterm + 1 < len(terms) else None
+
+                    # Real to complex of field #2
+                    if pipeline:
+                        future = executor.submit(rfield.r2c, out=cfield)
+                        if nextterm is not None: apply_config_Ylm(rfields[(iterm + 1) % 2], nextterm[2])
+                        future.result()
+                    else:
+                        rfield.r2c(out=cfield)
 
-                # Apply the Fourier-space Ylm
-                for islab, slab in enumerate(cfield.slabs):
-                    slab[:] *= Ylm(khat[0][islab], khat[1][islab], khat[2][islab])
+                    # Apply the Fourier-space Ylm and add to the total sum (first m initializes it), in a single pass
+                    for islab, (slab, cslab) in enumerate(zip(Aell.slabs, cfield.slabs)):
+                        _apply_Ylm(Ylm, slab, khat[0][islab], khat[1][islab], khat[2][islab], value=cslab, add=im > 0)
 
-                # Add to the total sum
-                Aell[:] += cfield[:]
+                    # And this contribution to the total sum
+                    t1 = time.time()
+                    if rank == 0:
+                        self.log_debug('Done term for Y(l={:d}, m={:d}) in {:.2f} s.'.format(Ylm.l, Ylm.m, t1 - t0))
 
-                # And this contribution to the total sum
-                t1 = time.time()
-                if rank == 0:
-                    self.log_debug('Done term for Y(l={:d}, m={:d}) in {:.2f} s.'.format(Ylm.l, Ylm.m, t1 - t0))
+                    if im == len(Ylms[ill]) - 1:
+                        if rank == 0:
+                            self.log_info('ell = {:d} done; {:d} r2c completed'.format(ell, len(Ylms[ill])))
 
-            if rank == 0:
-                self.log_info('ell = {:d} done; {:d} r2c completed'.format(ell, len(Ylms[ill])))
+                        # Calculate the power spectrum multipoles, slab-by-slab to save memory
+                        # This computes (Aell of field #1) * (A0 of field #2).conj()
+                        _conj_mul_inplace(Aell.value, A0.value)
 
-            # Calculate the power spectrum multipoles, slab-by-slab to save memory
-            # This computes (Aell of field #1) * (A0 of field #2).conj()
-            for islab in range(A0.shape[0]):
-                Aell[islab, ...] = Aell[islab].conj() * A0[islab]
+                        # Project on to 1d k-basis (averaging over mu=[-1,1])
+                        proj_result = project_to_basis(Aell, self.edges, antisymmetric=bool(ell % 2), exclude_zero=False)[0]
+                        result.append(tuple(4 * np.pi * np.squeeze(proj_result[ii]) for ii in [2, -1]))
+                        k, nmodes = proj_result[0], proj_result[3]
+                        t0 = time.time()
 
-            # Project on to 1d k-basis (averaging over mu=[-1,1])
-            proj_result = project_to_basis(Aell, self.edges, antisymmetric=bool(ell % 2), exclude_zero=False)[0]
-            result.append(tuple(4 * np.pi * np.squeeze(proj_result[ii]) for ii in [2, -1]))
-            k, nmodes = proj_result[0], proj_result[3]
+                    if not pipeline and nextterm is not None:
+                        apply_config_Ylm(rfield, nextterm[2])
 
         # pmesh convention is F(k) = 1/N^3 \sum_{r} e^{-ikr} F(r); let us correct it here
         power, power_zero = (self.nmesh.prod(dtype='f8')**2 * np.array([result[ells.index(ell)][ii] for ell in self.ells]).conj() for ii in range(2))
@@ -1977,7 +2674,14 @@ class MeshFFTPower(MeshFFTBase):
         self.poles = PowerSpectrumMultipoles(modes=k, edges=self.edges[0], power_nonorm=power, power_zero_nonorm=power_zero, nmodes=nmodes, ells=self.ells, **kwargs)
 
 
-def _format_all_weights(dtype=None, weight_type=None, weight_attrs=None, mpicomm=None, mpiroot=None, **kwargs):
+# (label, positions argument name, weights argument name) of input catalogs
+_CATALOGS = (('D1', 'data_positions1', 'data_weights1'), ('D2', 'data_positions2', 'data_weights2'),
+             ('R1', 'randoms_positions1', 'randoms_weights1'), ('R2', 'randoms_positions2', 'randoms_weights2'),
+             ('S1', 'shifted_positions1', 'shifted_weights1'), ('S2', 'shifted_positions2', 'shifted_weights2'))
+
+
+def _format_all_weights(all_weights, dtype=None, weight_type=None, weight_attrs=None, mpicomm=None, mpiroot=None):
+    # all_weights is a dictionary of label: weights, with labels in _CATALOGS
 
     weight_attrs = (weight_attrs or {}).copy()
     noffset = weight_attrs.get('noffset', 1)
@@ -1990,9 +2694,8 @@ def _format_all_weights(dtype=None, weight_type=None, weight_attrs=None, mpicomm
         return nrealizations
 
     bweights, n_bitwise_weights, weights = {}, {}, {}
-    for name in kwargs:
-        label = name.replace('data_weights', 'D').replace('randoms_weights', 'R').replace('shifted_weights', 'S')
-        bweights[label], n_bitwise_weights[label] = _format_weights(kwargs[name], weight_type=weight_type, dtype=dtype, mpicomm=mpicomm, mpiroot=mpiroot)
+    for label, value in all_weights.items():
+        bweights[label], n_bitwise_weights[label] = _format_weights(value, weight_type=weight_type, dtype=dtype, mpicomm=mpicomm, mpiroot=mpiroot)
         if n_bitwise_weights[label]:
             bitwise_weight = bweights[label][:n_bitwise_weights[label]]
             nrealizations = get_nrealizations(bitwise_weight)
@@ -2213,12 +2916,10 @@ class CatalogFFTPower(MeshFFTPower):
         """
         rdtype = _get_real_dtype(dtype)
         loc = locals()
-        bpositions, positions = [], {}
-        for name in ['data_positions1', 'data_positions2', 'randoms_positions1', 'randoms_positions2', 'shifted_positions1', 'shifted_positions2']:
-            tmp = _format_positions(loc[name], position_type=position_type, dtype=rdtype, mpicomm=mpicomm, mpiroot=mpiroot)
-            if tmp is not None: bpositions.append(tmp)
-            label = name.replace('data_positions', 'D').replace('randoms_positions', 'R').replace('shifted_positions', 'S')
-            positions[label] = tmp
+        # Format (and scatter, if mpiroot is not None) all positions at once
+        all_positions = _format_all_positions([loc[name] for _, name, _ in _CATALOGS], position_type=position_type, dtype=rdtype, mpicomm=mpicomm, mpiroot=mpiroot)
+        positions = {label: position for (label, _, _), position in zip(_CATALOGS, all_positions)}
+        bpositions = [position for position in all_positions if position is not None]
 
         with_shifted = positions['S1'] is not None
         with_randoms = positions['R1'] is not None
@@ -2226,8 +2927,8 @@ class CatalogFFTPower(MeshFFTPower):
         if autocorr and (positions['R2'] is not None or positions['S2'] is not None):
             raise ValueError('randoms_positions2 or shifted_positions2 are provided, but not data_positions2')
 
-        weights = {name: loc[name] for name in ['data_weights1', 'data_weights2', 'randoms_weights1', 'randoms_weights2', 'shifted_weights1', 'shifted_weights2']}
-        weights, bweights, n_bitwise_weights, weight_attrs = _format_all_weights(dtype=rdtype, weight_type=weight_type, weight_attrs=weight_attrs, mpicomm=mpicomm, mpiroot=mpiroot, **weights)
+        weights = {label: loc[name] for label, _, name in _CATALOGS}
+        weights, bweights, n_bitwise_weights, weight_attrs = _format_all_weights(weights, dtype=rdtype, weight_type=weight_type, weight_attrs=weight_attrs, mpicomm=mpicomm, mpiroot=mpiroot)
 
         # Get box encompassing all catalogs
         nmesh, boxsize, boxcenter = _get_mesh_attrs(boxsize=boxsize, cellsize=cellsize, nmesh=nmesh, boxcenter=boxcenter, positions=bpositions, boxpad=boxpad, check=not wrap, mpicomm=mpicomm)
@@ -2236,10 +2937,10 @@ class CatalogFFTPower(MeshFFTPower):
         if not isinstance(interlacing, tuple):
             interlacing = (interlacing,) * 2
 
-        if wrap:
+        if wrap and not _positions_in_box([position for position in positions.values() if position is not None], boxsize, boxcenter, mpicomm=mpicomm):
             for name, position in positions.items():
                 if position is not None:
-                    positions[name] = _wrap_positions(position, boxsize, boxcenter - boxsize / 2.)
+                    positions[name] = _wrap_positions(position, boxsize, boxcenter - boxsize / 2., out=position)  # position is a copy
 
         # Get catalog meshes
         def get_mesh(data_positions, data_weights=None, randoms_positions=None, randoms_weights=None, shifted_positions=None, shifted_weights=None, **kwargs):
@@ -2266,12 +2967,17 @@ class CatalogFFTPower(MeshFFTPower):
                 # pairs.append((1, S1, S2))
                 pairs.append((-1, 'D1', '{}2'.format(key)))
                 pairs.append((-1, '{}1'.format(key), 'D2'))
+            if not any(n_bitwise_weights.values()) and all(weight is None for weight in twopoint_weights.values()):
+                # Direct estimation requires bitwise weights or two-point weights: nothing to compute
+                pairs = []
 
             powers = {}
             DirectPowerEngine = get_direct_power_engine(direct_engine)
             for coeff, label1, label2 in pairs:
                 label12 = label1 + label2
                 label21 = label2.replace('2', '1') + label1.replace('1', '2')
+                # In case of autocorrelation, S1D1 (resp. R1D1) is obtained by reversing D1S1 (resp. D1R1), without running the engine again;
+                # this is not possible for firstpoint or endpoint line-of-sight (is_reversible is False), where both must be computed
                 if autocorr and label21 in powers and powers[label21][1].is_reversible:
                     powers[label12] = (powers[label21][0], powers[label21][1].reversed())
                     continue
@@ -11,9 +11,9 @@ from pmesh.pm import ParticleMesh, RealField, ComplexField
 from . import mpi
 from .fftlog import PowerToCorrelation
 from .utils import _make_array
-from .fft_power import MeshFFTPower, get_real_Ylm, _transform_rslab, _get_real_dtype, _format_positions, _format_all_weights, project_to_basis, PowerSpectrumMultipoles, PowerSpectrumWedges, normalization
+from .fft_power import MeshFFTPower, get_real_Ylm, _get_legendre, _transform_rslab, _get_real_dtype, _format_all_positions, _format_all_weights, _CATALOGS, project_to_basis, PowerSpectrumMultipoles, PowerSpectrumWedges, normalization, _conj_mul_inplace, _normalize_vectors, _apply_Ylm
 from .wide_angle import BaseMatrix, Projection, PowerSpectrumOddWideAngleMatrix
-from .mesh import CatalogMesh, _get_mesh_attrs, _wrap_positions
+from .mesh import CatalogMesh, _get_mesh_attrs, _wrap_positions, _positions_in_box, _get_particle_mesh
 
 
 def Si(x):
@@ -365,7 +365,7 @@ class MeshFFTWindow(MeshFFTPower):
             attrs_pm.update(kwargs)
             translate = {'boxsize': 'BoxSize', 'nmesh': 'Nmesh', 'mpicomm': 'comm'}
             attrs_pm = {translate.get(key, key): value for key, value in attrs_pm.items()}
-            mesh1 = ParticleMesh(**attrs_pm)
+            mesh1 = _get_particle_mesh(**attrs_pm)
         self._set_compensations(compensations)
         self._set_mesh(mesh1, mesh2=mesh2, boxcenter=boxcenter)
         self._set_projsin(projsin)
@@ -470,36 +470,37 @@ class MeshFFTWindow(MeshFFTPower):
         rfield = RealField(self.pm)
         cfield = ComplexField(self.pm)
         toret = RealField(self.pm)
-        toret[:] = 0.
 
         remove_shotnoise = ellout == projin.ell == projin.wa_order == 0
         if remove_shotnoise:
             shotnoise = self.shotnoise * self.wnorm / self.nmesh.prod(dtype='f8') / (4 * np.pi)  # normalization of Ylmin * Ylmout
 
-        for Ylmin in Ylmins:
+        for im, Ylmin in enumerate(Ylmins):
 
             for islab, slab in enumerate(rfield.slabs):
-                slab[:] = self.rfield1[islab] * Ylmin(self.xhat[0][islab], self.xhat[1][islab], self.xhat[2][islab]) * Ylmout(self.xhat[0][islab], self.xhat[1][islab], self.xhat[2][islab])
+                # Copy of density #1 times Ylmin, then times Ylmout, without temporaries
+                _apply_Ylm(Ylmin, slab, self.xhat[0][islab], self.xhat[1][islab], self.xhat[2][islab], value=self.rfield1[islab])
+                _apply_Ylm(Ylmout, slab, self.xhat[0][islab], self.xhat[1][islab], self.xhat[2][islab])
                 if projin.wa_order != 0: slab[:] /= self.xnorm[islab]**projin.wa_order
             rfield.r2c(out=cfield)
 
-            for islab in range(cfield.shape[0]):
-                cfield[islab, ...] = cfield[islab].conj() * self.cfield2[islab]
+            _conj_mul_inplace(cfield.value, self.cfield2.value)
 
             cfield.c2r(out=rfield)
-            for islab, slab in enumerate(rfield.slabs):
+            for islab, (slab, tslab) in enumerate(zip(rfield.slabs, toret.slabs)):
                 # No 1/N^6 factor due to pmesh convention
                 if remove_shotnoise:
                     mask_zero = True
                     for ii in slab.i: mask_zero = mask_zero & (ii == 0)
                     slab[mask_zero] -= shotnoise
-                slab[:] *= 4 * np.pi / (2 * projin.ell + 1) * Ylmin(self.xwhat[0][islab], self.xwhat[1][islab], self.xwhat[2][islab])
-            toret[:] += rfield[:]
+                # Apply Ylmin and add to the total sum (first m initializes it), in a single pass
+                _apply_Ylm(Ylmin, tslab, self.xwhat[0][islab], self.xwhat[1][islab], self.xwhat[2][islab], value=slab, add=im > 0)
 
+        toret[:] *= 4 * np.pi / (2 * projin.ell + 1)
         return toret
 
     def _run_periodic(self, projin, deriv):
-        legendre = special.legendre(projin.ell)
+        legendre = _get_legendre(projin.ell)
         for islab, slab in enumerate(self.qfield.slabs):
             tmp = deriv(self.knorm[islab])
             if projin.ell:
@@ -522,13 +523,13 @@ class MeshFFTWindow(MeshFFTPower):
         # projin is \ell^\prime
         # deriv is \xi^{\ell^{\prime},\beta \ell^\prime}(s^w)
 
-        legendre = special.legendre(projin.ell)
+        legendre = _get_legendre(projin.ell)
 
         if self.edgesin_type == 'fourier-grid':
             if projin.ell % 2:
                 # Odd poles, need full mesh
                 dtype = self.dtype if 'complex' in self.dtype.name else 'c{:d}'.format(self.dtype.itemsize * 2)
-                pm = ParticleMesh(BoxSize=self.boxSize, Nmesh=self.nmesh, dtype=dtype, comm=self.mpicomm, np=self.np)
+                pm = _get_particle_mesh(BoxSize=self.boxSize, Nmesh=self.nmesh, dtype=dtype, comm=self.mpicomm, np=self.np)
                 qfield = ComplexField(pm)
             else:
                 qfield = ComplexField(self.pm)
@@ -590,15 +591,15 @@ class MeshFFTWindow(MeshFFTPower):
         for ellout in ells:
 
             wfield = ComplexField(self.pm)
-            wfield[:] = 0.
             for mout in range(-ellout, ellout + 1):
                 Ylm = get_real_Ylm(ellout, mout)
                 qfield = self._get_q(ellout=ellout, mout=mout, projin=projin)
                 qfield[:] *= dfield[:]
                 cfield = qfield.r2c()
-                for islab, slab in enumerate(cfield.slabs):
-                    slab[:] *= 4 * np.pi * Ylm(self.khat[0][islab], self.khat[1][islab], self.khat[2][islab])
-                wfield[:] += cfield[:]
+                # Apply the Fourier-space Ylm and add to the total sum (first m initializes it), in a single pass
+                for islab, (slab, cslab) in enumerate(zip(wfield.slabs, cfield.slabs)):
+                    _apply_Ylm(Ylm, slab, self.khat[0][islab], self.khat[1][islab], self.khat[2][islab], value=cslab, add=mout > -ellout)
+            wfield[:] *= 4 * np.pi
 
             proj_result = project_to_basis(wfield, self.edges, antisymmetric=bool(ellout % 2))[0]
             result.append(tuple(np.squeeze(proj_result[ii]) for ii in [2, -1]))
@@ -624,24 +625,14 @@ class MeshFFTWindow(MeshFFTPower):
                 toret.append(rr)
             return toret
 
-        def _safe_divide(num, denom):
-            with np.errstate(divide='ignore', invalid='ignore'):
-                toret = num / denom
-            toret[denom == 0.] = 0.
-            return toret
-
         if self.periodic:
             self.qfield = ComplexField(self.pm)
 
         if self.periodic or self.edgesin_type == 'fourier-grid':
             # The Fourier-space grid
-            self.khat = [kk.real.astype('f8') for kk in ComplexField(self.pm).slabs.optx]
-            self.knorm = np.sqrt(sum(kk**2 for kk in self.khat))
-            self.khat = [_safe_divide(kk, self.knorm) for kk in self.khat]
+            self.khat, self.knorm = _normalize_vectors([kk.real.astype('f8') for kk in ComplexField(self.pm).slabs.optx])
         else:
-            self.xwhat = [xx.real.astype('f8') for xx in _wrap_rslab(_transform_rslab(RealField(self.pm).slabs.optx, self.boxsize))]  # this should just give self.mesh1.slabs.optx
-            self.xwnorm = np.sqrt(sum(xx**2 for xx in self.xwhat))
-            self.xwhat = [_safe_divide(xx, self.xwnorm) for xx in self.xwhat]
+            self.xwhat, self.xwnorm = _normalize_vectors([xx.real.astype('f8') for xx in _wrap_rslab(_transform_rslab(RealField(self.pm).slabs.optx, self.boxsize))])  # this should just give self.mesh1.slabs.optx
 
         if self.los_type == 'global':  # global (fixed) line-of-sight
 
@@ -659,8 +650,7 @@ class MeshFFTWindow(MeshFFTPower):
                     cfield2 = self._to_complex(self.mesh2, copy=False)
                 del self.mesh2
 
-                for islab in range(cfield1.shape[0]):
-                    cfield1[islab, ...] = cfield1[islab].conj() * cfield2[islab]
+                _conj_mul_inplace(cfield1.value, cfield2.value)
 
                 self.qfield = cfield1.c2r()
                 shotnoise = self.shotnoise * self.wnorm / self.nmesh.prod(dtype='f8')
@@ -695,15 +685,10 @@ class MeshFFTWindow(MeshFFTPower):
             del self.mesh2, self.mesh1
 
             offset = self.boxcenter - self.boxsize / 2.
-            self.xhat = [xx.real.astype('f8') + offset[ii] for ii, xx in enumerate(_transform_rslab(self.rfield1.slabs.optx, self.boxsize))]
-            self.xnorm = np.sqrt(sum(xx**2 for xx in self.xhat))
-            self.xhat = [_safe_divide(xx, self.xnorm) for xx in self.xhat]
+            self.xhat, self.xnorm = _normalize_vectors([xx.real.astype('f8') + offset[ii] for ii, xx in enumerate(_transform_rslab(self.rfield1.slabs.optx, self.boxsize))])
 
             # The Fourier-space grid
-            self.khat = [kk.real.astype('f8') for kk in self.cfield2.slabs.optx]
-            knorm = np.sqrt(sum(kk**2 for kk in self.khat))
-            self.khat = [_safe_divide(kk, knorm) for kk in self.khat]
-            del knorm
+            self.khat = _normalize_vectors([kk.real.astype('f8') for kk in self.cfield2.slabs.optx])[0]
 
             run_projin = self._run_local_los
 
@@ -929,17 +914,16 @@ class CatalogFFTWindow(MeshFFTWindow):
             elif boxsize is None: mesh_attrs.pop('boxsize')
 
         loc = locals()
-        bpositions, positions = [], {}
-        for name in ['randoms_positions1', 'randoms_positions2']:
-            tmp = _format_positions(loc[name], position_type=position_type, dtype=rdtype, mpicomm=mpicomm, mpiroot=mpiroot)
-            if tmp is not None: bpositions.append(tmp)
-            label = name.replace('randoms_positions', 'R')
-            positions[label] = tmp
+        catalogs = [catalog for catalog in _CATALOGS if catalog[0] in ('R1', 'R2')]
+        # Format (and scatter, if mpiroot is not None) all positions at once
+        all_positions = _format_all_positions([loc[name] for _, name, _ in catalogs], position_type=position_type, dtype=rdtype, mpicomm=mpicomm, mpiroot=mpiroot)
+        positions = {label: position for (label, _, _), position in zip(catalogs, all_positions)}
+        bpositions = [position for position in all_positions if position is not None]
 
         autocorr = positions['R2'] is None
 
-        weights = {name: loc[name] for name in ['randoms_weights1', 'randoms_weights2']}
-        weights, bweights, n_bitwise_weights, weight_attrs = _format_all_weights(dtype=rdtype, weight_type=weight_type, weight_attrs=weight_attrs, mpicomm=mpicomm, mpiroot=mpiroot, **weights)
+        weights = {label: loc[name] for label, _, name in catalogs}
+        weights, bweights, n_bitwise_weights, weight_attrs = _format_all_weights(weights, dtype=rdtype, weight_type=weight_type, weight_attrs=weight_attrs, mpicomm=mpicomm, mpiroot=mpiroot)
 
         # Get box encompassing all catalogs
         nmesh, boxsize, boxcenter = _get_mesh_attrs(**mesh_attrs, positions=bpositions, boxpad=boxpad, check=not wrap, mpicomm=mpicomm)
@@ -950,10 +934,10 @@ class CatalogFFTWindow(MeshFFTWindow):
         if not isinstance(interlacing, tuple):
             interlacing = (interlacing,) * 2
 
-        if wrap:
+        if wrap and not _positions_in_box([position for position in positions.values() if position is not None], boxsize, boxcenter, mpicomm=mpicomm):
             for name, position in positions.items():
                 if position is not None:
-                    positions[name] = _wrap_positions(position, boxsize, boxcenter - boxsize / 2.)
+                    positions[name] = _wrap_positions(position, boxsize, boxcenter - boxsize / 2., out=position)  # position is a copy
 
         # if wnorm is None and power_ref is not None:
         #     wsum = [mpicomm.allreduce(sum(weights['R1']) if weights['R1'] is not None else len(positions['R1']))]*2
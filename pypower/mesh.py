@@ -5,8 +5,8 @@ from mpi4py import MPI
 
 from pmesh.pm import ParticleMesh
 from pmesh.window import FindResampler, ResampleWindow
-from .utils import BaseClass, _make_array, _get_box
-from .direct_power import _format_positions, _format_weights
+from .utils import BaseClass, _make_array
+from .direct_power import _format_all_positions, _format_weights
 from . import mpi
 
 
@@ -15,6 +15,27 @@ def _get_real_dtype(dtype):
     return np.empty(0, dtype=dtype).real.dtype
 
 
+# pmesh shares FFTW plans (and MPI communicators) between ParticleMesh instances with same mesh size, dtype and communicator,
+# but only as long as one of these instances is alive. Keep references to the last ones, such that creating a new mesh
+# with same attributes (e.g. for each catalog in a series of mocks, or each test in a pytest session) does not plan FFTs again;
+# pmesh's FFTs go through pfft, which does not expose FFTW wisdom, hence plans cannot be saved across processes.
+# These references are released by :func:`fft_power.clear_cache`
+_pm_templates = []
+_pm_templates_max_size = 4
+
+
+def _get_particle_mesh(**kwargs):
+    # Return new :class:`ParticleMesh` instance, keeping its FFT plans alive for later instances;
+    # pmesh's default FFTW plan method is kept unless ``plan_method`` is provided, such that results are reproducible
+    pm = ParticleMesh(**kwargs)
+    template = getattr(pm, 'template', None)
+    if template is not None:
+        if template in _pm_templates: _pm_templates.remove(template)
+        _pm_templates.append(template)
+        del _pm_templates[:-_pm_templates_max_size]
+    return pm
+
+
 def _get_resampler(resampler):
     # Return :class:`ResampleWindow` from string or :class:`ResampleWindow` instance
     if isinstance(resampler, ResampleWindow):
@@ -58,55 +79,98 @@ def _get_compensation_window(resampler='cic', shotnoise=False):
         where :math:`k_{N}` is the Nyquist wavenumber and :math:`c` is the cell size,
         for each :math:`x`, :math:`y`, :math:`z`, axis.
     """
+    window1d = _get_compensation_window_1d(resampler=resampler, shotnoise=shotnoise)
+
+    def window(*x):
+        toret = 1.
+        for xi in x:
+            toret = toret * window1d(xi)
+        return toret
+
+    return window
+
+
+def _get_compensation_window_1d(resampler='cic', shotnoise=False):
+    # Compensation windows are separable: return the window along one axis (see _get_compensation_window)
     resampler = resampler.lower()
 
     if shotnoise:
 
         if resampler == 'ngp':
 
-            def window(*x):
-                return 1.
+            def window(x):
+                return np.ones_like(x)
 
         elif resampler == 'cic':
 
-            def window(*x):
-                toret = 1.
-                for xi in x:
-                    toret = toret * (1 - 2. / 3 * np.sin(0.5 * xi) ** 2) ** 0.5
-                return toret
+            def window(x):
+                return (1 - 2. / 3 * np.sin(0.5 * x) ** 2) ** 0.5
 
         elif resampler == 'tsc':
 
-            def window(*x):
-                toret = 1.
-                for xi in x:
-                    s = np.sin(0.5 * xi)**2
-                    toret = toret * (1 - s + 2. / 15 * s**2) ** 0.5
-                return toret
+            def window(x):
+                s = np.sin(0.5 * x)**2
+                return (1 - s + 2. / 15 * s**2) ** 0.5
 
         elif resampler == 'pcs':
 
-            def window(*x):
-                toret = 1.
-                for xi in x:
-                    s = np.sin(0.5 * xi)**2
-                    toret = toret * (1 - 4. / 3. * s + 2. / 5. * s**2 - 4. / 315. * s**3) ** 0.5
-                return toret
+            def window(x):
+                s = np.sin(0.5 * x)**2
+                return (1 - 4. / 3. * s + 2. / 5. * s**2 - 4. / 315. * s**3) ** 0.5
 
     else:
         p = {'ngp': 1, 'cic': 2, 'tsc': 3, 'pcs': 4}[resampler]
 
-        def window(*x):
-            toret = 1.
-            for xi in x:
-                toret = toret * np.sinc(0.5 / np.pi * xi) ** p
-            return toret
+        def window(x):
+            return np.sinc(0.5 / np.pi * x) ** p
 
     return window
 
 
-def _wrap_positions(array, boxsize, offset=0.):
-    return (array - offset) % boxsize + offset
+def _compensate_field(cfield, cellsize, *compensations):
+    # Divide complex field cfield by the compensation windows of input compensations (dictionaries of resampler, shotnoise);
+    # windows are separable, so inverse windows are computed once along each axis, then applied with one multiplication per slab
+    windows = [_get_compensation_window_1d(**compensation) for compensation in compensations]
+    # As pmesh slabs, iterate along the axis with largest stride
+    axis = np.argmax(cfield.value.strides)
+    value = np.moveaxis(cfield.value, axis, 0)
+    inv_slab, inv_rows = 1., []
+    for xi, ci in zip(cfield.x, cellsize):
+        inv = np.ones(xi.shape, dtype='f8')
+        for window in windows: inv /= window(xi * ci)
+        inv = np.moveaxis(inv, axis, 0)
+        if inv.shape[0] > 1: inv_rows.append(inv)  # varies along slabs
+        else: inv_slab = inv_slab * inv[0]
+    for islab in range(value.shape[0]):
+        inv = inv_slab
+        for inv_row in inv_rows: inv = inv * inv_row[islab]
+        value[islab] *= inv
+
+
+def _wrap_positions(array, boxsize, offset=0., out=None):
+    # Wrap (N, 3) positions in [offset, offset + boxsize); out can be array itself, to wrap in place.
+    # If all positions are already in the box (common case), the modulo is skipped
+    # (comparisons are much faster than reductions along the first axis of (N, 3) arrays)
+    if np.all(array >= offset) and np.all(array < offset + boxsize):
+        if out is None: return array
+        if out is not array: out[...] = array
+        return out
+    # In-place ufunc calls, to avoid temporaries
+    if out is None: out = np.empty_like(array)
+    np.subtract(array, offset, out=out)
+    np.mod(out, boxsize, out=out)
+    np.add(out, offset, out=out)
+    return out
+
+
+def _positions_in_box(positions, boxsize, boxcenter, mpicomm=mpi.COMM_WORLD):
+    # Whether (list of) (N, 3) positions on all ranks are all in [boxcenter - boxsize / 2, boxcenter + boxsize / 2),
+    # with a single pass over positions and a single Allreduce; if so, wrapping can be skipped altogether
+    if not isinstance(positions, (tuple, list)):
+        positions = [positions]
+    pos_min, pos_max = mpi._get_global_box(*positions, mpicomm=mpicomm)
+    offset = boxcenter - boxsize / 2.
+    return bool(np.all(pos_min >= offset) and np.all(pos_max < offset + boxsize))
 
 
 def _get_mesh_attrs(nmesh=None, boxsize=None, boxcenter=None, cellsize=None, positions=None, boxpad=2., check=True, mpicomm=mpi.COMM_WORLD):
@@ -163,10 +227,9 @@ def _get_mesh_attrs(nmesh=None, boxsize=None, boxcenter=None, cellsize=None, pos
         if not isinstance(positions, (tuple, list)):
             positions = [positions]
         # Find bounding coordinates
-        if mpicomm.allreduce(sum(pos.shape[0] for pos in positions)) <= 1:
+        if mpi._allreduce_int(sum(pos.shape[0] for pos in positions), mpicomm=mpicomm) <= 1:
             raise ValueError('<= 1 particles found; cannot infer boxsize')
-        pos_min, pos_max = _get_box(*positions)
-        pos_min, pos_max = np.min(mpicomm.allgather(pos_min), axis=0), np.max(mpicomm.allgather(pos_max), axis=0)
+        pos_min, pos_max = mpi._get_global_box(*positions, mpicomm=mpicomm)
         delta = np.abs(pos_max - pos_min)
         if boxcenter is None: boxcenter = 0.5 * (pos_min + pos_max)
         if boxsize is None:
@@ -248,7 +311,7 @@ def ArrayMesh(array, boxsize, type='real', nmesh=None, mpiroot=0, mpicomm=MPI.CO
             dtype = np.dtype('c{:d}'.format(itemsize))
 
     boxsize = _make_array(boxsize, 3, dtype='f8')
-    pm = ParticleMesh(BoxSize=boxsize, Nmesh=nmesh, dtype=dtype, comm=mpicomm)
+    pm = _get_particle_mesh(BoxSize=boxsize, Nmesh=nmesh, dtype=dtype, comm=mpicomm)
     mesh = pm.create(type=type)
 
     if mpiroot is None or mpicomm.rank == mpiroot:
@@ -397,28 +460,28 @@ class CatalogMesh(BaseClass):
 
     def _set_box(self, nmesh=None, boxsize=None, cellsize=None, boxcenter=None, boxpad=2., wrap=False):
         # Set :attr:`nmesh`, :attr:`boxsize` and :attr:`boxcenter`
-        positions = [self.data_positions]
-        if self.with_randoms: positions += [self.randoms_positions]
-        if self.with_shifted: positions += [self.shifted_positions]
+        names = ['data'] + ['randoms'] * self.with_randoms + ['shifted'] * self.with_shifted
+        positions = [getattr(self, '{}_positions'.format(name)) for name in names]
         self.nmesh, self.boxsize, self.boxcenter = _get_mesh_attrs(nmesh=nmesh, boxsize=boxsize, cellsize=cellsize, boxcenter=boxcenter,
                                                                    positions=positions, boxpad=boxpad, check=not wrap, mpicomm=self.mpicomm)
-        if wrap:
-            for position in positions:
-                _wrap_positions(position, self.boxsize, self.boxcenter - self.boxsize / 2.)
+        if wrap and not _positions_in_box(positions, self.boxsize, self.boxcenter, mpicomm=self.mpicomm):
+            # Input positions may not be copies: wrap in new arrays
+            for name, position in zip(names, positions):
+                setattr(self, '{}_positions'.format(name), _wrap_positions(position, self.boxsize, self.boxcenter - self.boxsize / 2.))
 
     def _set_positions(self, data_positions, randoms_positions=None, shifted_positions=None, position_type='xyz', copy=False, mpiroot=None):
         # Set data and optionally shifted and randoms positions, scattering on all ranks if not already
         if position_type is not None: position_type = position_type.lower()
         self.position_type = position_type
 
-        for name in ['data', 'randoms', 'shifted']:
+        # Format (and scatter, if mpiroot is not None) all positions at once
+        all_positions = _format_all_positions([data_positions, randoms_positions, shifted_positions], position_type=self.position_type, dtype=self.rdtype, copy=copy, mpicomm=self.mpicomm, mpiroot=mpiroot)
+        for name, positions in zip(['data', 'randoms', 'shifted'], all_positions):
             positions_name = '{}_positions'.format(name)
-            positions = locals()[positions_name]
-            positions = _format_positions(positions, position_type=self.position_type, dtype=self.rdtype, copy=copy, mpicomm=self.mpicomm, mpiroot=mpiroot)
             setattr(self, positions_name, positions)
             if name == 'data' and positions is None:
                 raise ValueError('Provide at least an array of data positions')
-            size = 0 if positions is None else self.mpicomm.allreduce(len(positions))
+            size = 0 if positions is None else mpi._allreduce_int(len(positions), mpicomm=self.mpicomm)
             setattr(self, '{}_size'.format(name), size)
 
     def _set_weights(self, data_weights, randoms_weights=None, shifted_weights=None, copy=False, mpiroot=None):
@@ -523,12 +586,14 @@ class CatalogMesh(BaseClass):
             else:
                 weights += [(self.randoms_weights, None)]
 
-        pm = ParticleMesh(BoxSize=self.boxsize, Nmesh=self.nmesh, dtype=dtype, comm=self.mpicomm)
+        pm = _get_particle_mesh(BoxSize=self.boxsize, Nmesh=self.nmesh, dtype=dtype, comm=self.mpicomm)
         offset = self.boxcenter - self.boxsize / 2.
         # offset = self.boxcenter
         # offset = 0.
 
-        def paint(positions, weights, scaling, out, transform=None):
+        def paint(positions, weights, scaling, outs, transforms):
+            # Paint positions to all meshes outs (one per interlacing shift), each with its transform:
+            # particles are decomposed and exchanged once for all meshes
             positions = positions - offset
             factor = bool(self.interlacing) + 0.5
             scalar_weights = weights is None
@@ -558,7 +623,8 @@ class CatalogMesh(BaseClass):
                 p = layout.exchange(p)
                 w = weights if scalar_weights else layout.exchange(weights[sl])
                 # hold = True means no zeroing of out
-                pm.paint(p, mass=w, resampler=self.resampler, transform=transform, hold=True, out=out)
+                for out, transform in zip(outs, transforms):
+                    pm.paint(p, mass=w, resampler=self.resampler, transform=transform, hold=True, out=out)
                 return size
 
             islab = 0
@@ -594,23 +660,22 @@ class CatalogMesh(BaseClass):
                 islab += slab_npoints
                 slab_npoints = min(self._slab_npoints_max, int(slab_npoints * 1.2))
 
-        out = pm.create(type='real', value=0.)
-        for p, w in zip(positions, weights): paint(p, *w, out)
+        shifts = np.arange(self.interlacing) * 1. / self.interlacing if self.interlacing else np.zeros(1, dtype='f8')
+        if self.interlacing and self.mpicomm.rank == 0:
+            self.log_info('Running interlacing at order {:d}.'.format(self.interlacing))
+        # All shifted meshes are painted in the same pass over particles
+        outs = [pm.create(type='real', value=0.) for shift in shifts]
+        transforms = [None] + [pm.affine.shift(shift) for shift in shifts[1:]]  # this shifts particle positions by ``shift`` before painting to mesh
+        for p, w in zip(positions, weights): paint(p, *w, outs, transforms)
+        out = outs.pop(0)
 
         if self.interlacing:
-            if self.mpicomm.rank == 0:
-                self.log_info('Running interlacing at order {:d}.'.format(self.interlacing))
             cellsize = self.boxsize / self.nmesh
-            shifts = np.arange(self.interlacing) * 1. / self.interlacing
             # remove 0 shift, already computed
             shifts = shifts[1:]
             out = out.r2c()
             for shift in shifts:
-                transform = pm.affine.shift(shift)  # this shifts particle positions by ``shift`` before painting to mesh
-                # paint to two shifted meshes
-                mesh_shifted = pm.create(type='real', value=0.)
-                for p, w in zip(positions, weights): paint(p, *w, mesh_shifted, transform=transform)
-                mesh_shifted = mesh_shifted.r2c()
+                mesh_shifted = outs.pop(0).r2c()
                 for k, s1, s2 in zip(out.slabs.x, out.slabs, mesh_shifted.slabs):
                     kc = sum(k[i] * cellsize[i] for i in range(3))
                     # pmesh convention is F(k) = 1/N^3 \sum_{r} e^{-ikr} F(r)
@@ -632,12 +697,7 @@ class CatalogMesh(BaseClass):
         if self.mpicomm.rank == 0:
             self.log_info('Applying compensation {}.'.format(self.compensation))
         # Apply compensation window for particle-assignment scheme
-        window = _get_compensation_window(**self.compensation)
-
-        cellsize = self.boxsize / self.nmesh
-        for k, slab in zip(cfield.slabs.x, cfield.slabs):
-            kc = tuple(ki * ci for ki, ci in zip(k, cellsize))
-            slab[...] /= window(*kc)
+        _compensate_field(cfield, self.boxsize / self.nmesh, self.compensation)
 
     def unnormalized_shotnoise(self):
         r"""
@@ -651,7 +711,7 @@ class CatalogMesh(BaseClass):
         """
         def sum_weights2(positions, weights=None):
             if weights is None:
-                return self.mpicomm.allreduce(len(positions))
+                return mpi._allreduce_int(len(positions), mpicomm=self.mpicomm)
             return self.mpicomm.allreduce(sum(weights**2))
 
         shotnoise = sum_weights2(self.data_positions, self.data_weights)
@@ -1,7 +1,11 @@
+import math
+import atexit
+import functools
+
 import numpy as np
 
 from mpi4py import MPI
-from pmesh.domain import GridND
+from pmesh.domain import GridND, pack_arrays
 
 from .utils import _get_box
 
@@ -10,6 +14,42 @@ COMM_WORLD = MPI.COMM_WORLD
 COMM_SELF = MPI.COMM_SELF
 
 
+# Committed MPI datatypes, by item size
+_contiguous_datatypes = {}
+
+
+def _get_contiguous_datatype(itemsize):
+    # Committed MPI datatype of itemsize bytes; kept alive until exit, as only a few item sizes are used
+    dt = _contiguous_datatypes.get(itemsize, None)
+    if dt is None:
+        dt = _contiguous_datatypes[itemsize] = MPI.BYTE.Create_contiguous(itemsize)
+        dt.Commit()
+    return dt
+
+
+@atexit.register
+def _free_contiguous_datatypes():
+    # mpi4py finalizes MPI after Python exit handlers are run
+    if not MPI.Is_finalized():
+        for dt in _contiguous_datatypes.values(): dt.Free()
+    _contiguous_datatypes.clear()
+
+
+def _allreduce_int(value, op=MPI.SUM, mpicomm=COMM_WORLD):
+    # Allreduce integer, with a typed (not pickled) collective call
+    buf = np.array([value], dtype='i8')
+    mpicomm.Allreduce(MPI.IN_PLACE, buf, op=op)
+    return int(buf[0])
+
+
+def _get_global_box(*positions, mpicomm=COMM_WORLD):
+    # Return minimal box containing input positions on all ranks, with a single (typed) Allreduce
+    posmin, posmax = _get_box(*positions)
+    box = np.concatenate([posmin, -posmax]).astype('f8')
+    mpicomm.Allreduce(MPI.IN_PLACE, box, op=MPI.MIN)
+    return box[:3], -box[3:]
+
+
 def gather_array(data, root=0, mpicomm=COMM_WORLD):
     """
     Taken from https://github.com/bccp/nbodykit/blob/master/nbodykit/utils.py
@@ -36,24 +76,24 @@ def gather_array(data, root=0, mpicomm=COMM_WORLD):
     """
     if root is None: root = Ellipsis
 
-    if all(mpicomm.allgather(np.isscalar(data))):
-        if root is Ellipsis:
-            return np.array(mpicomm.allgather(data))
-        gathered = mpicomm.gather(data, root=root)
-        if mpicomm.rank == root:
-            return np.array(gathered)
-        return None
-
+    isscalar = np.isscalar(data)
+    value = data if isscalar else None
     data = np.asarray(data)
 
     # need C-contiguous order
     if not data.flags['C_CONTIGUOUS']:
         data = np.ascontiguousarray(data)
-    local_length = data.shape[0]
 
-    # check dtypes and shapes
-    shapes = mpicomm.allgather(data.shape)
-    dtypes = mpicomm.allgather(data.dtype)
+    # gather scalars, shapes and dtypes in a single collective call;
+    # local lengths (hence total length and recv counts) are then known on all ranks
+    metas = mpicomm.allgather((isscalar, value, data.shape, data.dtype))
+    if all(meta[0] for meta in metas):
+        if root is Ellipsis or mpicomm.rank == root:
+            return np.array([meta[1] for meta in metas])
+        return None
+
+    shapes = [meta[2] for meta in metas]
+    dtypes = [meta[3] for meta in metas]
 
     # check for structured data
     if dtypes[0].char == 'V':
@@ -67,37 +107,35 @@ def gather_array(data, root=0, mpicomm=COMM_WORLD):
         if any(dtypes[0][name] == 'O' for name in dtypes[0].names):
             raise ValueError('object data types ("O") not allowed in structured data in gather_array')
 
-        # compute the new shape for each rank
-        newlength = mpicomm.allreduce(local_length)
-        newshape = list(data.shape)
-        newshape[0] = newlength
+        # if dtypes are the same on all ranks, records are gathered at once as raw bytes, as other data types below;
+        # else field by field
+        if any(dt != dtypes[0] for dt in dtypes[1:]):
 
-        # the return array
-        if root is Ellipsis or mpicomm.rank == root:
-            recvbuffer = np.empty(newshape, dtype=dtypes[0], order='C')
-        else:
-            recvbuffer = None
+            # compute the new shape for each rank
+            newlength = sum(shape[0] for shape in shapes)
+            newshape = list(data.shape)
+            newshape[0] = newlength
 
-        for name in dtypes[0].names:
-            d = gather_array(data[name], root=root, mpicomm=mpicomm)
+            # the return array
             if root is Ellipsis or mpicomm.rank == root:
-                recvbuffer[name] = d
+                recvbuffer = np.empty(newshape, dtype=dtypes[0], order='C')
+            else:
+                recvbuffer = None
 
-        return recvbuffer
+            for name in dtypes[0].names:
+                d = gather_array(data[name], root=root, mpicomm=mpicomm)
+                if root is Ellipsis or mpicomm.rank == root:
+                    recvbuffer[name] = d
+
+            return recvbuffer
 
     # check for 'O' data types
     if dtypes[0] == 'O':
         raise ValueError('object data types ("O") not allowed in structured data in gather_array')
 
     # check for bad dtypes and bad shapes
-    if root is Ellipsis or mpicomm.rank == root:
-        bad_shape = any(s[1:] != shapes[0][1:] for s in shapes[1:])
-        bad_dtype = any(dt != dtypes[0] for dt in dtypes[1:])
-    else:
-        bad_shape = None; bad_dtype = None
-
-    if root is not Ellipsis:
-        bad_shape, bad_dtype = mpicomm.bcast((bad_shape, bad_dtype), root=root)
+    bad_shape = any(s[1:] != shapes[0][1:] for s in shapes[1:])
+    bad_dtype = any(dt != dtypes[0] for dt in dtypes[1:])
 
     if bad_shape:
         raise ValueError('mismatch between shape[1:] across ranks in gather_array')
@@ -108,13 +146,12 @@ def gather_array(data, root=0, mpicomm=COMM_WORLD):
     dtype = data.dtype
 
     # setup the custom dtype
-    duplicity = np.product(np.array(shape[1:], 'intp'))
+    duplicity = math.prod(shape[1:])
     itemsize = duplicity * dtype.itemsize
-    dt = MPI.BYTE.Create_contiguous(itemsize)
-    dt.Commit()
+    dt = _get_contiguous_datatype(itemsize)
 
     # compute the new shape for each rank
-    newlength = mpicomm.allreduce(local_length)
+    newlength = sum(shape[0] for shape in shapes)
     newshape = list(shape)
     newshape[0] = newlength
 
@@ -125,12 +162,12 @@ def gather_array(data, root=0, mpicomm=COMM_WORLD):
         recvbuffer = None
 
     # the recv counts
-    counts = mpicomm.allgather(local_length)
-    counts = np.array(counts, order='C')
+    counts = np.array([shape[0] for shape in shapes], dtype=np.intc, order='C')
 
     # the recv offsets
-    offsets = np.zeros_like(counts, order='C')
-    offsets[1:] = counts.cumsum()[:-1]
+    offsets = np.empty_like(counts)
+    offsets[0] = 0
+    np.cumsum(counts[:-1], out=offsets[1:])
 
     # gather to root
     if root is Ellipsis:
@@ -138,7 +175,6 @@ def gather_array(data, root=0, mpicomm=COMM_WORLD):
     else:
         mpicomm.Gatherv([data, dt], [recvbuffer, (counts, offsets), dt], root=root)
 
-    dt.Free()
     return recvbuffer
 
 
@@ -192,29 +228,24 @@ def scatter_array(data, counts=None, root=0, mpicomm=COMM_WORLD):
         The chunk of `data` that each rank gets.
     """
     if counts is not None:
-        counts = np.asarray(counts, order='C')
+        counts = np.asarray(counts, dtype=np.intc, order='C')
         if len(counts) != mpicomm.size:
             raise ValueError('counts array has wrong length!')
 
-    # check for bad input
-    if mpicomm.rank == root:
-        bad_input = not isinstance(data, np.ndarray)
-    else:
-        bad_input = None
-    bad_input = mpicomm.bcast(bad_input, root=root)
-    if bad_input:
-        raise ValueError('`data` must by numpy array on root in scatter_array')
-
-    if mpicomm.rank == root:
+    # each rank needs shape/dtype of input data (None for bad input), in a single collective call
+    # NOTE: packing shape/dtype in a fixed-size buffer for Bcast was found slower than this pickled bcast of a small tuple
+    shape_and_dtype = None
+    if mpicomm.rank == root and isinstance(data, np.ndarray):
         # need C-contiguous order
         if not data.flags['C_CONTIGUOUS']:
             data = np.ascontiguousarray(data)
         shape_and_dtype = (data.shape, data.dtype)
-    else:
-        shape_and_dtype = None
+    shape_and_dtype = mpicomm.bcast(shape_and_dtype, root=root)
 
-    # each rank needs shape/dtype of input data
-    shape, dtype = mpicomm.bcast(shape_and_dtype, root=root)
+    # check for bad input
+    if shape_and_dtype is None:
+        raise ValueError('`data` must by numpy array on root in scatter_array')
+    shape, dtype = shape_and_dtype
 
     # object dtype is not supported
     fail = False
@@ -231,40 +262,56 @@ def scatter_array(data, counts=None, root=0, mpicomm=COMM_WORLD):
         data = np.empty(0, dtype=np_dtype)
 
     # setup the custom dtype
-    duplicity = np.product(np.array(shape[1:], 'intp'))
+    duplicity = math.prod(shape[1:])
     itemsize = duplicity * dtype.itemsize
-    dt = MPI.BYTE.Create_contiguous(itemsize)
-    dt.Commit()
+    dt = _get_contiguous_datatype(itemsize)
 
     # compute the new shape for each rank
     newshape = list(shape)
 
     if counts is None:
-        newshape[0] = newlength = local_size(shape[0], mpicomm=mpicomm)
-    else:
-        if counts.sum() != shape[0]:
-            raise ValueError('the sum of the `counts` array needs to be equal to data length')
-        newshape[0] = counts[mpicomm.rank]
+        # the send counts, if not provided, as given by local_size() on each rank
+        counts = np.array([(rank + 1) * shape[0] // mpicomm.size - rank * shape[0] // mpicomm.size for rank in range(mpicomm.size)], dtype=np.intc, order='C')
+    elif counts.sum() != shape[0]:
+        raise ValueError('the sum of the `counts` array needs to be equal to data length')
+    newshape[0] = counts[mpicomm.rank]
 
     # the return array
     recvbuffer = np.empty(newshape, dtype=dtype, order='C')
 
-    # the send counts, if not provided
-    if counts is None:
-        counts = mpicomm.allgather(newlength)
-        counts = np.array(counts, order='C')
-
     # the send offsets
-    offsets = np.zeros_like(counts, order='C')
-    offsets[1:] = counts.cumsum()[:-1]
+    offsets = np.empty_like(counts)
+    offsets[0] = 0
+    np.cumsum(counts[:-1], out=offsets[1:])
 
     # do the scatter
     mpicomm.Barrier()
     mpicomm.Scatterv([data, (counts, offsets), dt], [recvbuffer, dt], root=root)
-    dt.Free()
     return recvbuffer
 
 
+@functools.lru_cache(maxsize=None)
+def _split_size_3d(s):
+    """
+    Split `s` into three integers, a, b, c, such
+    that a * b * c == s and a <= b <= c,
+    minimizing a * b + b * c + a * c (i.e. the surface of the domains, hence the number of particles to exchange).
+    """
+    toret, surface = None, None
+    a = 1
+    while a**3 <= s:
+        if s % a == 0:
+            b = a
+            while a * b**2 <= s:
+                if (s // a) % b == 0:
+                    c = s // (a * b)
+                    tmp = a * b + b * c + a * c
+                    if surface is None or tmp < surface: toret, surface = (a, b, c), tmp
+                b += 1
+        a += 1
+    return toret
+
+
 def domain_decompose(mpicomm, smoothing, positions1, weights1=None, positions2=None, weights2=None, boxsize=None, domain_factor=None):
     """
     Adapted from https://github.com/bccp/nbodykit/blob/master/nbodykit/algorithms/pair_counters/domain.py.
@@ -309,54 +356,35 @@ def domain_decompose(mpicomm, smoothing, positions1, weights1=None, positions2=N
         positions2 = positions1
         weights2 = weights1
 
-    if mpicomm.size == 1 or mpicomm.allreduce(len(positions1)) == 0 or mpicomm.allreduce(len(positions2)) == 0:
+    if mpicomm.size == 1:
+        return (positions1, weights1), (positions2, weights2)
+    # Global sizes of both catalogs, in a single collective call
+    sizes = np.array([len(positions1), len(positions2)], dtype='i8')
+    mpicomm.Allreduce(MPI.IN_PLACE, sizes, op=MPI.SUM)
+    size1 = sizes[0]
+    if not all(sizes):
         return (positions1, weights1), (positions2, weights2)
-
-    def split_size_3d(s):
-        """
-        Split `s` into three integers, a, b, c, such
-        that a * b * c == s and a <= b <= c.
-        """
-        a = int(s ** (1. / 3.)) + 1
-        while a > 1:
-            if s % a == 0:
-                s = s // a
-                break
-            a = a - 1
-        b = int(s ** 0.5) + 1
-        while b > 1:
-            if s % b == 0:
-                s = s // b
-                break
-            b = b - 1
-        c = s
-        return a, b, c
 
     periodic = boxsize is not None
-    ngrid = split_size_3d(mpicomm.size)
+    ngrid = _split_size_3d(mpicomm.size)
     if domain_factor is None:
         domain_factor = 1 if periodic else 2
     ngrid *= domain_factor
 
-    size1 = mpicomm.allreduce(len(positions1))
+    def wrap(positions):
+        # Positions used for domain decomposition only: wrapped (single allocation) only if some are outside [0, boxsize)
+        if not periodic or (np.all(positions >= 0.) and np.all(positions < boxsize)):
+            return positions
+        return np.mod(positions, boxsize)
 
-    cpositions1 = positions1
-    cpositions2 = positions2
-
-    if periodic:
-        cpositions1 = cpositions1 % boxsize
-    if autocorr:
-        cpositions2 = cpositions1
-    else:
-        if periodic:
-            cpositions2 = cpositions2 % boxsize
+    cpositions1 = wrap(positions1)
+    cpositions2 = cpositions1 if autocorr else wrap(positions2)
 
     if periodic:
         posmin = np.zeros_like(boxsize)
         posmax = np.asarray(boxsize)
     else:
-        posmin, posmax = _get_box(*([cpositions1] if autocorr else [cpositions1, cpositions2]))
-        posmin, posmax = np.min(mpicomm.allgather(posmin), axis=0), np.max(mpicomm.allgather(posmax), axis=0)
+        posmin, posmax = _get_global_box(*([cpositions1] if autocorr else [cpositions1, cpositions2]), mpicomm=mpicomm)
         posmin -= 1e-9  # margin to make sure all positions will be included
         posmax += 1e-9
 
@@ -368,31 +396,39 @@ def domain_decompose(mpicomm, smoothing, positions1, weights1=None, positions2=N
         # balance the load
         domain.loadbalance(domain.load(cpositions1))
 
+    def exchange(positions, weights, layout=None):
+        # Exchange (or gather on all ranks, if layout is None) positions and weights (if any) together:
+        # they are packed in a single structured array, to make a single collective call instead of one per array
+        arrays = [positions] + (list(weights) if weights is not None else [])
+        if layout is None:
+            if len(arrays) > 1:
+                arrays = gather_array(pack_arrays(arrays), root=Ellipsis, mpicomm=mpicomm)
+                arrays = [arrays[name] for name in arrays.dtype.names]
+            else:
+                arrays = [gather_array(*arrays, root=Ellipsis, mpicomm=mpicomm)]
+        elif len(arrays) > 1:
+            arrays = layout.exchange(*arrays, pack=True)
+        else:
+            arrays = [layout.exchange(*arrays, pack=False)]
+        # packed fields are not contiguous
+        arrays = [np.ascontiguousarray(array) for array in arrays]
+        return arrays[0], (arrays[1:] if weights is not None and len(weights) else weights)
+
     # exchange first particles
     layout = domain.decompose(cpositions1, smoothing=0)
-    positions1 = layout.exchange(positions1)  # exchange takes a list of arrays
-    if weights1 is not None and len(weights1):
-        multiple_weights = len(weights1) > 1
-        weights1 = layout.exchange(*weights1, pack=False)
-        if multiple_weights: weights1 = list(weights1)
-        else: weights1 = [weights1]
+    positions1, weights1 = exchange(positions1, weights1, layout=layout)
 
     boxsize = posmax - posmin
 
     # exchange second particles
     if smoothing > boxsize.max() * 0.25:
-        positions2 = gather_array(positions2, root=Ellipsis, mpicomm=mpicomm)
-        if weights2 is not None: weights2 = [gather_array(w, root=Ellipsis, mpicomm=mpicomm) for w in weights2]
+        positions2, weights2 = exchange(positions2, weights2)
     else:
         layout = domain.decompose(cpositions2, smoothing=smoothing)
-        positions2 = layout.exchange(positions2)
-        if weights2 is not None and len(weights2):
-            multiple_weights = len(weights2) > 1
-            weights2 = layout.exchange(*weights2, pack=False)
-            if multiple_weights: weights2 = list(weights2)
-            else: weights2 = [weights2]
-
-    nsize1 = mpicomm.allreduce(len(positions1))
-    assert nsize1 == size1, 'some particles1 disappeared (after: {:d} v.s. before: {:d})...'.format(nsize1, size1)
+        positions2, weights2 = exchange(positions2, weights2, layout=layout)
+
+    if __debug__:  # skip this collective call with python -O
+        nsize1 = _allreduce_int(len(positions1), mpicomm=mpicomm)
+        assert nsize1 == size1, 'some particles1 disappeared (after: {:d} v.s. before: {:d})...'.format(nsize1, size1)
 
     return (positions1, weights1), (positions2, weights2)
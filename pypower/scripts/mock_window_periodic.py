@@ -20,7 +20,6 @@ Results are saved in "_results" (see below to change).
 
 import os
 import logging
-import glob
 import argparse
 
 import numpy as np
@@ -30,7 +29,7 @@ from cosmoprimo.fiducial import DESI
 from mockfactory import EulerianLinearMock
 from mockfactory.make_survey import RandomBoxCatalog
 
-from pypower import MeshFFTPower, CatalogFFTPower, MeshFFTWindow, utils, setup_logging
+from pypower import MeshFFTPower, CatalogFFTPower, MeshFFTWindow, PowerSpectrumStatistics, mpi, utils, setup_logging
 
 
 logger = logging.getLogger('PeriodicWindow')
@@ -65,7 +64,9 @@ def run_mock(imock=0, sample=True):
 
     if sample:
         data = RandomBoxCatalog(nbar=nbar, boxsize=boxsize, boxcenter=boxcenter, seed=seed)
-        data['Weight'] = mock.readout(data['Position'], field='delta', resampler='tsc', compensate=True) + 1.
+        weight = mock.readout(data['Position'], field='delta', resampler='tsc', compensate=True)
+        weight += 1.  # in place, no temporary
+        data['Weight'] = weight
         power = CatalogFFTPower(data_positions1=data['Position'], data_weights1=data['Weight'], ells=ells, los=los, edges=edges,
                                 boxsize=boxsize, boxcenter=boxcenter, nmesh=256, wrap=True, resampler='tsc', interlacing=3, position_type='pos')
 
@@ -75,36 +76,83 @@ def run_mock(imock=0, sample=True):
     power.save(mock_fn.format(imock))
 
 
+def _init_mock_worker(nthreads=1):
+    # Initialize worker processes running mocks: spawned processes do not inherit logging setup;
+    # limit threads (numba; OpenMP and BLAS through environment variables, set before spawning) to share CPUs between workers
+    setup_logging()
+    try: import numba
+    except ImportError: return
+    numba.set_num_threads(min(nthreads, numba.config.NUMBA_NUM_THREADS))
+
+
+def save_atomic(obj, fn):
+    # Save obj (on rank 0) to a temporary file, then rename it to fn at once (atomic on POSIX),
+    # such that runs executed concurrently never load partially written files
+    tmp_fn = '{}.{:d}.tmp.npy'.format(fn, os.getpid())
+    obj.save(tmp_fn)
+    if mpi.COMM_WORLD.rank == 0:
+        os.replace(tmp_fn, fn)
+
+
 def run_window(icut=0, ncuts=1):
     power = CatalogFFTPower.load(mock_fn.format(0))
+    # With periodic=True, each input k-bin costs the same (evaluation and projection over the full mesh, whatever k),
+    # hence the same number of bins in each cut balances the work
     start, stop = icut * (len(edgesin) - 1) // ncuts, (icut + 1) * (len(edgesin) - 1) // ncuts + 1
     window = MeshFFTWindow(edgesin=edgesin[start:stop], power_ref=power, periodic=True)
-    window.save(window_fn.format(icut))
+    save_atomic(window, window_fn.format(icut))
 
 
-def kaiser_model_poles(k, ell=0):
+def kaiser_model_poles(k, ells=(0, 2, 4)):
+    # Return Kaiser multipoles of shape (len(ells), len(k)), evaluating the linear power spectrum only once
     pk = bias**2 * pklin(k)
     beta = f / bias
-    if ell == 0: return (1. + 2. / 3. * beta + 1. / 5. * beta**2) * pk + 1. / nbar
-    if ell == 2: return (4. / 3. * beta + 4. / 7. * beta**2) * pk
-    if ell == 4: return 8. / 35 * beta**2 * pk
+    coeffs = {0: 1. + 2. / 3. * beta + 1. / 5. * beta**2, 2: 4. / 3. * beta + 4. / 7. * beta**2, 4: 8. / 35 * beta**2}
+    toret = np.array([coeffs.get(ell, 0.) for ell in ells])[:, None] * pk
+    if 0 in ells: toret[list(ells).index(0)] += 1. / nbar
+    return toret
 
 
-def kaiser_model_wedges(k, wedge):
+def kaiser_model_wedges(k, wedges):
+    # Return Kaiser wedges of shape (len(wedges), len(k)), as the mu-average of the multipoles in each wedge
     from scipy import special
     ells = (0, 2, 4)
-    pk = 0.
-    for ell in ells:
-        poly = special.legendre(ell).integ()(wedge)
-        pk += kaiser_model_poles(k, ell) * (poly[1] - poly[0]) / (wedge[1] - wedge[0])
-    return pk
+    integs = [special.legendre(ell).integ() for ell in ells]  # built once for all wedges
+    wedges = np.array(wedges, dtype='f8')
+    coeffs = np.array([(integ(wedges[:, 1]) - integ(wedges[:, 0])) / (wedges[:, 1] - wedges[:, 0]) for integ in integs]).T
+    return coeffs.dot(kaiser_model_poles(k, ells=ells))
 
 
 def mock_mean(name='poles'):
-    powers = []
-    for fn in glob.glob(mock_fn.format('*')):
-        powers.append(getattr(CatalogFFTPower.load(fn), name)(complex=False)[-1])
-    return np.mean(powers, axis=0), np.std(powers, axis=0, ddof=1) / len(powers)**0.5
+    # Mean and variance are accumulated one mock at a time (Welford's algorithm), without stacking all mocks in memory;
+    # accumulators are only of the size of one power spectrum, so they are kept in double precision
+    nmocks, mean, m2 = 0, 0., 0.
+    # List mock files in a single directory scan, without shell-style pattern matching
+    prefix, suffix = os.path.basename(mock_fn).split('{}')
+    with os.scandir(os.path.dirname(mock_fn)) as it:
+        fns = sorted(entry.path for entry in it if entry.name.startswith(prefix) and entry.name.endswith(suffix))
+    for fn in fns:
+        # Only instantiate the required power spectrum statistic from the saved state, not the whole CatalogFFTPower
+        state = np.load(fn, allow_pickle=True)[()]
+        power = PowerSpectrumStatistics.from_state(state[name])(complex=False)[-1]
+        nmocks += 1
+        delta = power - mean
+        mean = mean + delta / nmocks
+        m2 = m2 + delta * (power - mean)
+    std = np.sqrt(m2 / (nmocks - 1))
+    return mean, std / nmocks**0.5
+
+
+def plot_comparison(ax, kin, model_theory, kout, mean, std, model_conv):
+    # Plot theory, mock mean +- std and theory * window for each multipole / wedge, with one collection per kind of curve
+    # (instead of one artist per curve); kout is a list of k-arrays, one for each curve
+    from matplotlib.collections import LineCollection, PolyCollection
+    colors = ['C{:d}'.format(i) for i in range(max(len(model_theory), len(mean)))]
+    ax.add_collection(LineCollection([np.column_stack([kin, kin * theory]) for theory in model_theory], colors=colors[:len(model_theory)], linestyles=':', label='theory'))
+    bands = [np.concatenate([np.column_stack([k, k * (m - s)]), np.column_stack([k, k * (m + s)])[::-1]]) for k, m, s in zip(kout, mean, std)]
+    ax.add_collection(PolyCollection(bands, facecolors=colors[:len(bands)], alpha=0.5, linewidths=0, label='mocks'))
+    ax.add_collection(LineCollection([np.column_stack([k, k * conv]) for k, conv in zip(kout, model_conv)], colors=colors[:len(model_conv)], linestyles='-', label='theory * window'))
+    ax.autoscale_view()
 
 
 def plot_poles():
@@ -114,7 +162,7 @@ def plot_poles():
     kout = window.xout[0]
     ellsin = [proj.ell for proj in window.projsin]
     ells = [proj.ell for proj in window.projsout]
-    model_theory = np.array([kaiser_model_poles(kin, ell=ell) for ell in ellsin])
+    model_theory = kaiser_model_poles(kin, ells=ellsin)
     model_conv = window.dot(model_theory, unpack=True)
     model_theory[ellsin.index(0)] -= 1. / nbar
     model_conv[ells.index(0)] -= 1. / nbar
@@ -123,11 +171,7 @@ def plot_poles():
     figsize = (6, 1.5 * sum(height_ratios))
     fig, lax = plt.subplots(len(height_ratios), sharex=True, sharey=False, gridspec_kw={'height_ratios': height_ratios}, figsize=figsize, squeeze=True)
     fig.subplots_adjust(hspace=0)
-    for ill, ell in enumerate(ellsin):
-        lax[0].plot(kin, kin * model_theory[ill], linestyle=':', color='C{:d}'.format(ill), label='theory' if ill == 0 else None)
-    for ill, ell in enumerate(ells):
-        lax[0].fill_between(kout, kout * (mean[ill] - std[ill]), kout * (mean[ill] + std[ill]), alpha=0.5, facecolor='C{:d}'.format(ill), linewidth=0, label='mocks' if ill == 0 else None)
-        lax[0].plot(kout, kout * model_conv[ill], linestyle='-', color='C{:d}'.format(ill), label='theory * window' if ill == 0 else None)
+    plot_comparison(lax[0], kin, model_theory, [kout] * len(ells), mean, std, model_conv)
     for ill, ell in enumerate(ells):
         lax[ill + 1].plot(kout, (model_conv[ill] - mean[ill]) / std[ill], linestyle='-', color='C{:d}'.format(ill))
         lax[ill + 1].set_ylim(-4, 4)
@@ -150,25 +194,22 @@ def plot_wedges():
     mask_positive = muedges >= 0.
     wedges = muedges[mask_positive]
     wedges = list(zip(wedges[:-1], wedges[1:]))
-    masks = [slice(start, len(window.xout[0]), len(muedges) - 1) for start in range(np.sum(~mask_positive), len(muedges) - 1)]
-    kout = [window.xout[0][mask, 0] for mask in masks]
-    muout = [np.nanmean(window.xout[0][mask, 1]) for mask in masks]
+    # Output (k, mu) are flattened with mu varying fastest: reshape to (nk, nmu) and keep positive mu-wedges (views, no copy)
+    nmu, start = len(muedges) - 1, np.sum(~mask_positive)
+    xout = window.xout[0].reshape(-1, nmu, 2)[:, start:]
+    kout = xout[..., 0].T
+    muout = np.nanmean(xout[..., 1], axis=0)
     ellsin = [proj.ell for proj in window.projsin]
-    model_theory = np.array([kaiser_model_poles(kin, ell=ell) for ell in ellsin])
-    model_conv = window.dot(model_theory, unpack=False)
-    model_conv = [model_conv[mask] - 1. / nbar for mask in masks]
-    model_theory = [kaiser_model_wedges(kin, wedge=wedge) - 1. / nbar for wedge in wedges]
+    model_theory = kaiser_model_poles(kin, ells=ellsin)
+    model_conv = window.dot(model_theory, unpack=False).reshape(-1, nmu)[:, start:].T - 1. / nbar
+    model_theory = kaiser_model_wedges(kin, wedges=wedges) - 1. / nbar
     mean, std = mock_mean('wedges')
-    mean, std = mean.T[mask_positive[:-1]], std.T[mask_positive[:-1]]
+    mean, std = mean[:, start:].T, std[:, start:].T
     height_ratios = [max(len(wedges), 3)] + [1] * len(wedges)
     figsize = (6, 1.5 * sum(height_ratios))
     fig, lax = plt.subplots(len(height_ratios), sharex=True, sharey=False, gridspec_kw={'height_ratios': height_ratios}, figsize=figsize, squeeze=True)
     fig.subplots_adjust(hspace=0)
-    for imu, mu in enumerate(muout):
-        lax[0].plot(kin, kin * model_theory[imu], linestyle=':', color='C{:d}'.format(imu), label='theory' if imu == 0 else None)
-    for imu, mu in enumerate(muout):
-        lax[0].fill_between(kout[imu], kout[imu] * (mean[imu] - std[imu]), kout[imu] * (mean[imu] + std[imu]), alpha=0.5, facecolor='C{:d}'.format(imu), linewidth=0, label='mocks' if imu == 0 else None)
-        lax[0].plot(kout[imu], kout[imu] * model_conv[imu], linestyle='-', color='C{:d}'.format(imu), label='theory * window' if imu == 0 else None)
+    plot_comparison(lax[0], kin, model_theory, kout, mean, std, model_conv)
     for imu, mu in enumerate(muout):
         lax[imu + 1].plot(kout[imu], (model_conv[imu] - mean[imu]) / std[imu], linestyle='-', color='C{:d}'.format(imu))
         lax[imu + 1].set_ylim(-4, 4)
@@ -195,13 +236,36 @@ def main(args=None):
     if opt.todo == 'mock':
         if len(opt.irun) == 2:
             opt.irun = range(opt.irun[0], opt.irun[1])
-        for imock in opt.irun:
-            run_mock(imock=imock)
+        # Mocks are independent; without MPI, run them in separate processes (few of them, as FFTs are already threaded)
+        njobs = min(max((os.cpu_count() or 1) // 4, 1), len(opt.irun)) if mpi.COMM_WORLD.size == 1 else 1
+        if njobs > 1:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Threads per worker, not to oversubscribe CPUs; environment variables are inherited by spawned processes
+            # and read when libraries are loaded (this process does not run mocks itself)
+            nthreads = max((os.cpu_count() or 1) // njobs, 1)
+            for name in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']: os.environ[name] = str(nthreads)
+            # spawn rather than fork, not to duplicate the MPI state of this process
+            with ProcessPoolExecutor(max_workers=njobs, mp_context=multiprocessing.get_context('spawn'), initializer=_init_mock_worker, initargs=(nthreads,)) as executor:
+                list(executor.map(run_mock, opt.irun))
+        else:
+            for imock in opt.irun:
+                run_mock(imock=imock)
 
     if opt.todo == 'window':
         run_window(opt.irun[0], ncuts=opt.irun[1])
-        window = MeshFFTWindow.concatenate_x(*(MeshFFTWindow.load(window_fn.format(icut)) for icut in range(opt.irun[0] + 1)))
-        window.save(window_fn.format('all'))
+        # Concatenate cuts only once all of them are computed (by this or other runs), instead of reloading
+        # all previous cuts at each run; windows are saved by rank 0 only, hence only load them there
+        # Runs may be executed concurrently: cuts are saved atomically, hence complete if they exist; if several runs
+        # finish together, they write the same concatenated window, again atomically
+        fns = [window_fn.format(icut) for icut in range(opt.irun[1])]
+        if mpi.COMM_WORLD.rank == 0 and all(os.path.exists(fn) for fn in fns):
+            from concurrent.futures import ThreadPoolExecutor
+            # File reads release the GIL: overlap them
+            with ThreadPoolExecutor(max_workers=min(8, len(fns))) as executor:
+                windows = list(executor.map(MeshFFTWindow.load, fns))
+            window = MeshFFTWindow.concatenate_x(*windows)
+            save_atomic(window, window_fn.format('all'))
 
     if opt.todo == 'plot':
         plot_poles()
@@ -8,13 +8,12 @@ following https://arxiv.org/abs/2106.06324.
 import math
 
 import numpy as np
-from scipy.interpolate import UnivariateSpline
 from scipy import special
 
 from .utils import BaseClass, _make_array
 from .fftlog import CorrelationToPower
 from .fft_power import (BasePowerSpectrumStatistics, MeshFFTPower, CatalogMesh,
-                        _get_real_dtype, _format_positions, _format_all_weights, _get_mesh_attrs, _wrap_positions)
+                        _get_real_dtype, _format_all_positions, _format_all_weights, _CATALOGS, _get_mesh_attrs, _wrap_positions, _positions_in_box, _select_parts, _interp_linear)
 from .wide_angle import Projection, BaseMatrix, CorrelationFunctionOddWideAngleMatrix, PowerSpectrumOddWideAngleMatrix
 from . import mpi, utils
 
@@ -103,13 +102,16 @@ class PowerSpectrumSmoothWindow(BasePowerSpectrumStatistics):
         -------
         power : array
         """
-        toret = super(PowerSpectrumSmoothWindow, self).get_power(add_direct=add_direct, remove_shotnoise=False, null_zero_mode=null_zero_mode, divide_wnorm=False, complex=True)
+        # If complex is False, only compute real part for even multipoles, imaginary part for odd multipoles
+        projparts = ['real' if proj.ell % 2 == 0 else 'imag' for proj in self.projs]
+        parts = self._get_power_parts(complex=complex, parts=projparts)
+        toret = self._get_power_nonorm(add_direct=add_direct, null_zero_mode=null_zero_mode, parts=parts)
         if remove_shotnoise:
-            toret -= self.shotnoise_nonorm[:, None]
+            toret -= _select_parts(self.shotnoise_nonorm, parts)[:, None]
         if divide_wnorm:
-            toret /= self.wnorm[:, None]
+            toret /= (self.wnorm if parts is None else np.real(self.wnorm))[:, None]
         if not complex and np.iscomplexobj(toret):
-            toret = np.array([toret[iproj].real if proj.ell % 2 == 0 else toret[iproj].imag for iproj, proj in enumerate(self.projs)], dtype=toret.real.dtype)
+            toret = _select_parts(toret, projparts)
         return toret
 
     def __call__(self, proj=None, k=None, return_k=False, complex=True, default_zero=False, **kwargs):
@@ -176,12 +178,7 @@ class PowerSpectrumSmoothWindow(BasePowerSpectrumStatistics):
         mask_finite_k = ~np.isnan(kavg) & ~np.isnan(power).any(axis=0)
         kavg, power = kavg[mask_finite_k], power[:, mask_finite_k]
         k = np.asarray(k)
-
-        def interp(array):
-            return np.array([UnivariateSpline(kavg, arr, k=1, s=0, ext='const')(k) for arr in array], dtype=array.dtype)
-
-        toret = interp(power.real)
-        if complex and np.iscomplexobj(power): toret = toret + 1j * interp(power.imag)
+        toret = np.moveaxis(_interp_linear(k, kavg, power.T), -1, 0)
         if isscalar:
             toret = toret[0]
         if return_k:
@@ -422,7 +419,7 @@ class CorrelationFunctionSmoothWindow(BaseClass):
             return toret
         mask_finite_sep = ~np.isnan(sepavg) & ~np.isnan(corr).any(axis=0)
         sepavg, corr = sepavg[mask_finite_sep], corr[:, mask_finite_sep]
-        toret = np.array([UnivariateSpline(sepavg, arr, k=1, s=0, ext='const')(sep) for arr in corr], dtype=corr.dtype)
+        toret = np.moveaxis(_interp_linear(sep, sepavg, corr.T), -1, 0)
         if isscalar:
             toret = toret[0]
         if return_sep:
@@ -695,17 +692,16 @@ class CatalogSmoothWindow(MeshFFTPower):
             elif boxsize is None: mesh_attrs.pop('boxsize')
 
         loc = locals()
-        bpositions, positions = [], {}
-        for name in ['randoms_positions1', 'randoms_positions2']:
-            tmp = _format_positions(loc[name], position_type=position_type, dtype=rdtype, mpicomm=mpicomm, mpiroot=mpiroot)
-            if tmp is not None: bpositions.append(tmp)
-            label = name.replace('randoms_positions', 'R')
-            positions[label] = tmp
+        catalogs = [catalog for catalog in _CATALOGS if catalog[0] in ('R1', 'R2')]
+        # Format (and scatter, if mpiroot is not None) all positions at once
+        all_positions = _format_all_positions([loc[name] for _, name, _ in catalogs], position_type=position_type, dtype=rdtype, mpicomm=mpicomm, mpiroot=mpiroot)
+        positions = {label: position for (label, _, _), position in zip(catalogs, all_positions)}
+        bpositions = [position for position in all_positions if position is not None]
 
         autocorr = positions['R2'] is None
 
-        weights = {name: loc[name] for name in ['randoms_weights1', 'randoms_weights2']}
-        weights, bweights, n_bitwise_weights, weight_attrs = _format_all_weights(dtype=rdtype, weight_type=weight_type, weight_attrs=weight_attrs, mpicomm=mpicomm, mpiroot=mpiroot, **weights)
+        weights = {label: loc[name] for label, _, name in catalogs}
+        weights, bweights, n_bitwise_weights, weight_attrs = _format_all_weights(weights, dtype=rdtype, weight_type=weight_type, weight_attrs=weight_attrs, mpicomm=mpicomm, mpiroot=mpiroot)
 
         # Get box encompassing all catalogs
         nmesh, boxsize, boxcenter = _get_mesh_attrs(**mesh_attrs, positions=bpositions, boxpad=boxpad, check=not wrap, mpicomm=mpicomm)
@@ -716,10 +712,10 @@ class CatalogSmoothWindow(MeshFFTPower):
         if not isinstance(interlacing, tuple):
             interlacing = (interlacing,) * 2
 
-        if wrap:
+        if wrap and not _positions_in_box([position for position in positions.values() if position is not None], boxsize, boxcenter, mpicomm=mpicomm):
             for name, position in positions.items():
                 if position is not None:
-                    positions[name] = _wrap_positions(position, boxsize, boxcenter - boxsize / 2.)
+                    positions[name] = _wrap_positions(position, boxsize, boxcenter - boxsize / 2., out=position)  # position is a copy
 
         if wnorm is None and power_ref is not None:
             wsum = [mpicomm.allreduce(sum(weights['R1']) if weights['R1'] is not None else len(positions['R1']))] * 2
@@ -207,6 +207,17 @@ def test_bitwise_weight():
                        nrealizations=nrealizations, noffset=1, default_value=1.) for ii in range(size)]
     assert np.allclose(wpip, ref)
 
+    # numpy and (if available) numba paths, signed and unsigned weights, 2 or 3 sets of weights
+    for size in [10, utils._numba_min_size]:
+        for dtype in [np.uint64, np.int32]:
+            weights = [utils.pack_bitarrays(*[rng.randint(0, 2, size) for i in range(8 * np.dtype(dtype).itemsize * n_bitwise_weights)], dtype=dtype) for i in range(3)]
+            for nweights in [2, 3]:
+                wpip = get_inverse_probability_weight(*weights[:nweights], noffset=0, nrealizations=nrealizations, default_value=2.)
+                denom = sum(utils.popcount(np.bitwise_and.reduce([weight[ii] for weight in weights[:nweights]])) for ii in range(n_bitwise_weights))
+                ref = np.full(size, 2.)
+                ref[denom > 0] = nrealizations / denom[denom > 0]
+                assert np.allclose(wpip, ref)
+
 
 def test_direct_power():
     ref_funcs = {'theta': ref_theta, 's': ref_s}
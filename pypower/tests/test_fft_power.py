@@ -9,12 +9,22 @@ from mockfactory import LagrangianLinearMock, Catalog
 from mockfactory.make_survey import RandomBoxCatalog
 
 from pypower import MeshFFTPower, CatalogFFTPower, CatalogMesh, ArrayMesh, PowerSpectrumStatistics, mpi, utils, setup_logging
-from pypower.fft_power import normalization, normalization_from_nbar, find_unique_edges, get_real_Ylm, project_to_basis
+from pypower.fft_power import normalization, normalization_from_nbar, find_unique_edges, get_real_Ylm, project_to_basis, _interp_linear
 
 
 base_dir = 'catalog'
 data_fn = os.path.join(base_dir, 'lognormal_data.fits')
 randoms_fn = os.path.join(base_dir, 'lognormal_randoms.fits')
+_catalogs = {}
+
+
+def read_catalog(fn):
+    # Read catalog from disk only once per session; return a copy, as tests modify catalog columns in place
+    if fn not in _catalogs:
+        _catalogs[fn] = Catalog.read(fn)
+    catalog = _catalogs[fn].copy()
+    for name in catalog.columns(): catalog[name] = catalog[name].copy()
+    return catalog
 
 
 def save_lognormal():
@@ -53,6 +63,25 @@ def test_interp():
     assert UnivariateSpline(x, y, k=1, s=0, ext=3)(-1) == 0.
     assert RectBivariateSpline(x, y, y[:, None] * y, kx=1, ky=1, s=0)(12, 8, grid=False) == 80
 
+    rng = np.random.RandomState(seed=42)
+    xp = np.sort(rng.uniform(0., 10., 20))
+    fp = rng.uniform(-1., 1., (xp.size, 3))
+    # numpy and (if available) numba paths, in and out of xp range
+    for size in [100, utils._numba_min_size]:
+        xx = rng.uniform(-2., 12., size)
+        ref = np.column_stack([UnivariateSpline(xp, ff, k=1, s=0, ext=3)(xx) for ff in fp.T])
+        assert np.allclose(_interp_linear(xx, xp, fp), ref)
+        assert np.allclose(_interp_linear(xx, xp, fp[:, 0]), ref[:, 0])
+        fpc = fp + 1j * fp[::-1]
+        assert np.allclose(_interp_linear(xx, xp, fpc), ref + 1j * np.column_stack([UnivariateSpline(xp, ff, k=1, s=0, ext=3)(xx) for ff in fp[::-1].T]))
+        assert np.allclose(_interp_linear(xx, xp, fp + 0j), ref)
+    # 2D (k, mu) case, as in :meth:`PowerSpectrumWedges.__call__`
+    mup = np.linspace(-1., 1., 5)
+    fp = rng.uniform(-1., 1., (xp.size, mup.size))
+    xx, mu = np.sort(rng.uniform(-2., 12., 300)), np.sort(rng.uniform(-1.2, 1.2, 200))
+    ref = RectBivariateSpline(xp, mup, fp, kx=1, ky=1, s=0)(np.clip(xx, xp[0], xp[-1]), np.clip(mu, mup[0], mup[-1]), grid=True)
+    assert np.allclose(_interp_linear(mu, mup, _interp_linear(xx, xp, fp).T).T, ref)
+
 
 class MemoryMonitor(object):
     """
@@ -303,10 +332,39 @@ def test_ylm():
             assert np.allclose(ylm_scipy, ylm)
 
 
+def ref_find_unique_edges(x, x0, xmin=0., xmax=np.inf, mpicomm=mpi.COMM_WORLD):
+    # Reference implementation, sorting all squared distances
+    def unique_index(x2):
+        return np.unique(np.int64(x2 / (0.5 * x0)**2 + 0.5), return_index=True)[1]
+
+    fx2 = sum(xi**2 for xi in x).ravel()
+    fx2 = fx2[unique_index(fx2)]
+    fx2 = fx2[(fx2 >= xmin**2) & (fx2 <= xmax**2)]
+    if mpicomm is not None:
+        fx2 = np.concatenate(mpicomm.allgather(fx2), axis=0)
+    fx = fx2[unique_index(fx2)]**0.5
+    width = np.diff(fx)
+    return np.concatenate([[xmin], fx[1:] - width / 2., [min(fx[-1] + width[-1] / 2., xmax)]], axis=0)
+
+
 def test_find_edges():
     x = np.meshgrid(np.arange(10.), np.arange(10.), indexing='ij')
     find_unique_edges(x, x0=1., xmin=0., xmax=np.inf, mpicomm=mpi.COMM_WORLD)
 
+    mpicomm = mpi.COMM_WORLD
+    # Cubic and non-cubic boxes, for which squared norms are not multiples of (x0 / 2)^2
+    for nmesh, boxsize in [((32,) * 3, (500.,) * 3), ((60, 70, 70), (600., 700., 700.)), ((32, 40, 24), (300., 410., 250.))]:
+        nmesh, boxsize = np.array(nmesh), np.array(boxsize)
+        kfun = 2. * np.pi / boxsize
+        k = [np.fft.fftfreq(n, 1. / n) * kf for n, kf in zip(nmesh, kfun)]
+        k[-1] = np.abs(k[-1][:nmesh[-1] // 2 + 1])
+        # Split first axis across ranks
+        sl = slice(mpicomm.rank * nmesh[0] // mpicomm.size, (mpicomm.rank + 1) * nmesh[0] // mpicomm.size)
+        x = [k[0][sl, None, None], k[1][None, :, None], k[2][None, None, :]]
+        for xmin, xmax in [(0., np.inf), (0., 0.3), (0.0213, 0.1517), (2.5 * kfun.min(), 9. * kfun.min())]:
+            edges = find_unique_edges(x, x0=kfun.min(), xmin=xmin, xmax=xmax, mpicomm=mpicomm)
+            assert np.array_equal(edges, ref_find_unique_edges(x, x0=kfun.min(), xmin=xmin, xmax=xmax, mpicomm=mpicomm))
+
 
 def test_project():
 
@@ -435,13 +493,18 @@ def test_mesh_power():
     resampler = 'cic'
     interlacing = 2
     dtype = 'f8'
-    data = Catalog.read(data_fn)
+    data = read_catalog(data_fn)
+
+    ref_powers = {}  # nbodykit reference only depends on los and boxsize: compute it once for all options
 
     def get_ref_power(data, los, boxsize=boxsize, dtype='c16'):
-        los_array = [1. if ax == los else 0. for ax in 'xyz']
-        from nbodykit.lab import FFTPower
-        mesh = data.to_nbodykit().to_mesh(position='Position', BoxSize=boxsize, Nmesh=nmesh, resampler=resampler, interlaced=bool(interlacing), compensated=True, dtype=dtype)
-        return FFTPower(mesh, mode='2d', poles=ells, Nmu=len(muedges) - 1, los=los_array, dk=dk, kmin=kedges[0], kmax=kedges[-1])
+        key = (id(data), los, tuple(np.ravel(boxsize)), dtype)
+        if key not in ref_powers:
+            los_array = [1. if ax == los else 0. for ax in 'xyz']
+            from nbodykit.lab import FFTPower
+            mesh = data.to_nbodykit().to_mesh(position='Position', BoxSize=boxsize, Nmesh=nmesh, resampler=resampler, interlaced=bool(interlacing), compensated=True, dtype=dtype)
+            ref_powers[key] = FFTPower(mesh, mode='2d', poles=ells, Nmu=len(muedges) - 1, los=los_array, dk=dk, kmin=kedges[0], kmax=kedges[-1])
+        return ref_powers[key]
 
     def get_mesh_power(data, los, edges=(kedges, muedges), boxsize=boxsize, dtype=dtype, as_cross=False, slab_npoints_max=None):
         mesh = CatalogMesh(data_positions=data['Position'], boxsize=boxsize, nmesh=nmesh, resampler=resampler, interlacing=interlacing, position_type='pos', dtype=dtype)
@@ -482,6 +545,7 @@ def test_mesh_power():
         list_options.append({'los': los, 'edges': (ref_kedges, muedges), 'slab_npoints_max': 10000})
         list_options.append({'los': [1. if ax == los else 0. for ax in 'xyz'], 'edges': (ref_kedges, muedges)})
         list_options.append({'los': los, 'edges': ({'min': ref_kedges[0], 'max': ref_kedges[-1], 'step': ref_kedges[1] - ref_kedges[0]}, muedges)})
+        # Default is double precision; single precision (f4, c8) is checked against the same reference and tolerances
         list_options.append({'los': los, 'edges': (ref_kedges, muedges), 'dtype': 'f4'})
         list_options.append({'los': los, 'edges': (ref_kedges, muedges[:-1]), 'dtype': 'f4'})
         list_options.append({'los': los, 'edges': (ref_kedges, muedges[:-1]), 'dtype': 'c8'})
@@ -518,7 +582,7 @@ def test_mesh_power():
     for ell in ells:
         assert np.allclose(power_cross(ell=ell) - (ell == 0) * power.shotnoise, power(ell=ell))
 
-    randoms = Catalog.read(randoms_fn)
+    randoms = read_catalog(randoms_fn)
 
     def get_ref_power(data, randoms, los, dtype='c16'):
         los_array = [1. if ax == los else 0. for ax in 'xyz']
@@ -550,8 +614,8 @@ def test_normalization():
     interlacing = False
     boxcenter = np.array([3000., 0., 0.])[None, :]
     dtype = 'f8'
-    data = Catalog.read(data_fn)
-    randoms = Catalog.read(randoms_fn)
+    data = read_catalog(data_fn)
+    randoms = read_catalog(randoms_fn)
     for catalog in [data, randoms]:
         catalog['Position'] += boxcenter
         catalog['Weight'] = catalog.ones()
@@ -584,8 +648,8 @@ def test_array_mesh():
 
 def test_catalog_mesh():
 
-    data = Catalog.read(data_fn)
-    randoms = Catalog.read(randoms_fn)
+    data = read_catalog(data_fn)
+    randoms = read_catalog(randoms_fn)
     boxsize = 600.
     nmesh = 128
     resampler = 'tsc'
@@ -655,25 +719,34 @@ def test_catalog_power():
     boxcenter = np.array([3000., 0., 0.])[None, :]
     los = None
     dtype = 'f8'
-    data = Catalog.read(data_fn)
-    randoms = Catalog.read(randoms_fn)
+    data = read_catalog(data_fn)
+    randoms = read_catalog(randoms_fn)
     weight_value = 2.
     for catalog in [data, randoms]:
         catalog['Position'] += boxcenter
         catalog['Weight'] = weight_value * catalog.ones()
 
+    # Reference power spectra and sky coordinates are computed once for the same inputs
+    ref_powers, sky_positions = {}, {}
+
     def get_ref_power(data, randoms, boxsize=boxsize, dtype='c16'):
-        from nbodykit.lab import FKPCatalog, ConvolvedFFTPower
-        fkp = FKPCatalog(data.to_nbodykit(), randoms.to_nbodykit(), nbar='NZ')
-        mesh = fkp.to_mesh(position='Position', comp_weight='Weight', nbar='NZ', BoxSize=boxsize, Nmesh=nmesh, resampler=resampler, interlaced=bool(interlacing), compensated=True, dtype=dtype)
-        return ConvolvedFFTPower(mesh, poles=ells, dk=dk, kmin=kedges[0], kmax=kedges[-1] + 1e-9)
+        key = (id(data), id(randoms), tuple(np.ravel(boxsize)), dtype)
+        if key not in ref_powers:
+            from nbodykit.lab import FKPCatalog, ConvolvedFFTPower
+            fkp = FKPCatalog(data.to_nbodykit(), randoms.to_nbodykit(), nbar='NZ')
+            mesh = fkp.to_mesh(position='Position', comp_weight='Weight', nbar='NZ', BoxSize=boxsize, Nmesh=nmesh, resampler=resampler, interlaced=bool(interlacing), compensated=True, dtype=dtype)
+            ref_powers[key] = ConvolvedFFTPower(mesh, poles=ells, dk=dk, kmin=kedges[0], kmax=kedges[-1] + 1e-9)
+        return ref_powers[key]
 
     def get_catalog_power(data, randoms, position_type='pos', edges=kedges, boxsize=boxsize, nmesh=nmesh, dtype=dtype, as_cross=False, **kwargs):
         data_positions, randoms_positions = data['Position'], randoms['Position']
         if position_type == 'xyz':
             data_positions, randoms_positions = data['Position'].T, randoms['Position'].T
         elif position_type == 'rdd':
-            data_positions, randoms_positions = utils.cartesian_to_sky(data['Position'].T), utils.cartesian_to_sky(randoms['Position'].T)
+            key = (id(data), id(randoms))
+            if key not in sky_positions:
+                sky_positions[key] = (utils.cartesian_to_sky(data['Position'].T), utils.cartesian_to_sky(randoms['Position'].T))
+            data_positions, randoms_positions = sky_positions[key]
         if as_cross:
             kwargs.update(data_positions2=data_positions, data_weights2=data['Weight'], randoms_positions2=randoms_positions, randoms_weights2=randoms['Weight'])
         return CatalogFFTPower(data_positions1=data_positions, data_weights1=data['Weight'], randoms_positions1=randoms_positions, randoms_weights1=randoms['Weight'],
@@ -688,10 +761,13 @@ def test_catalog_power():
             mesh._slab_npoints_max = slab_npoints_max
         return MeshFFTPower(mesh, ells=ells, los=los, edges=kedges)
 
+    wnorms = {}  # normalization only depends on input catalogs and mesh attributes: paint it once
+
     def get_mesh_power(data, randoms, dtype=dtype, as_complex=False, as_cross=False):
         mesh = CatalogMesh(data_positions=data['Position'], data_weights=data['Weight'], randoms_positions=randoms['Position'], randoms_weights=randoms['Weight'],
                            boxsize=boxsize, nmesh=nmesh, resampler=resampler, interlacing=interlacing, position_type='pos', dtype=dtype)
-        wnorm = np.real(normalization(mesh))
+        if dtype not in wnorms: wnorms[dtype] = np.real(normalization(mesh))
+        wnorm = wnorms[dtype]
         shotnoise = mesh.unnormalized_shotnoise() / wnorm
         field = mesh.to_mesh()
         if as_complex: field = field.r2c()
@@ -896,7 +972,7 @@ def test_mpi():
 
 def test_plot():
     kedges = {'min': 0., 'step': 0.005}
-    data = Catalog.read(data_fn)
+    data = read_catalog(data_fn)
 
     power = CatalogFFTPower(data_positions1=data['Position'], edges=(kedges, np.linspace(-1., 1., 4)),
                             ells=(0, 2, 4), boxsize=600., nmesh=128, resampler='tsc', interlacing=3, los='x', position_type='pos')
@@ -915,8 +991,8 @@ def test_interlacing():
     resampler = 'ngp'
     boxcenter = np.array([3000., 0., 0.])[None, :]
 
-    data = Catalog.read(data_fn)
-    randoms = Catalog.read(randoms_fn)
+    data = read_catalog(data_fn)
+    randoms = read_catalog(randoms_fn)
     for catalog in [data, randoms]:
         catalog['Position'] += boxcenter
         catalog['Weight'] = catalog.ones()
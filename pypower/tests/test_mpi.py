@@ -0,0 +1,88 @@
+import numpy as np
+
+from pypower import mpi, setup_logging
+
+
+def assert_array_equal(a, b):
+    assert a.shape == b.shape
+    if a.dtype.names is not None:
+        assert set(a.dtype.names) == set(b.dtype.names)
+        for name in a.dtype.names: assert np.array_equal(a[name], b[name])
+    else:
+        assert a.dtype == b.dtype
+        assert np.array_equal(a, b)
+
+
+def test_gather_scatter():
+    mpicomm = mpi.COMM_WORLD
+    rng = np.random.RandomState(seed=42)
+    size = 10 * mpicomm.size + 1
+    data = np.empty(size, dtype=[('Position', 'f8', 3), ('Weight', 'i4')])
+    data['Position'] = rng.uniform(0., 1., (size, 3))
+    data['Weight'] = rng.randint(0, 10, size)
+
+    for array in [data, data[:0], data['Position'], data['Weight'], data['Position'][:0]]:
+        # default counts, and all data on the last rank (empty local arrays elsewhere)
+        for counts in [None, [0] * (mpicomm.size - 1) + [len(array)]]:
+            local = mpi.scatter_array(array if mpicomm.rank == 0 else None, counts=counts, root=0, mpicomm=mpicomm)
+            if counts is not None: assert len(local) == counts[mpicomm.rank]
+            for root in [0, mpicomm.size - 1, None]:
+                gathered = mpi.gather_array(local, root=root, mpicomm=mpicomm)
+                if root is None or mpicomm.rank == root:
+                    assert_array_equal(gathered, array)
+                else:
+                    assert gathered is None
+
+    # structured arrays with same fields, but different dtypes (field order) across ranks, are gathered field by field
+    local = mpi.scatter_array(data if mpicomm.rank == 0 else None, root=0, mpicomm=mpicomm)
+    if mpicomm.rank % 2:
+        tmp = np.empty(local.size, dtype=[('Weight', 'i4'), ('Position', 'f8', 3)])
+        for name in local.dtype.names: tmp[name] = local[name]
+        local = tmp
+    for root in [0, None]:
+        gathered = mpi.gather_array(local, root=root, mpicomm=mpicomm)
+        if root is None or mpicomm.rank == root:
+            assert_array_equal(gathered, data)
+            assert gathered.dtype == data.dtype
+
+    # scalars
+    gathered = mpi.gather_array(mpicomm.rank, root=None, mpicomm=mpicomm)
+    assert np.array_equal(gathered, np.arange(mpicomm.size))
+
+
+def test_domain_decompose():
+    mpicomm = mpi.COMM_WORLD
+    rng = np.random.RandomState(seed=42 + mpicomm.rank)
+    boxsize = np.array([100., 200., 300.])
+
+    def sort(positions, weights):
+        # Gather and sort all positions and weights, by x-coordinate
+        positions = mpi.gather_array(positions, root=None, mpicomm=mpicomm)
+        weights = [mpi.gather_array(weight, root=None, mpicomm=mpicomm) for weight in weights]
+        index = np.argsort(positions[:, 0])
+        return positions[index], [weight[index] for weight in weights]
+
+    for size in [100, 100 * (mpicomm.rank == 0)]:
+        positions1, positions2 = [rng.uniform(0., 1., (size, 3)) * boxsize for i in range(2)]
+        weights1, weights2 = [[rng.randint(0, 2**31, size, dtype='i8'), rng.uniform(0., 1., size)] for i in range(2)]
+        for periodic in [False, True]:
+            for smoothing in [10., 1e4]:
+                (dpositions1, dweights1), (dpositions2, dweights2) = mpi.domain_decompose(mpicomm, smoothing, positions1, weights1=weights1, positions2=positions2, weights2=weights2, boxsize=boxsize if periodic else None)
+                for dpositions, dweights in [(dpositions1, dweights1), (dpositions2, dweights2)]:
+                    assert len(dweights) == 2 and all(weight.dtype == ref.dtype and len(weight) == len(dpositions) for weight, ref in zip(dweights, weights1))
+                positions, weights = sort(dpositions1, dweights1)
+                ref_positions, ref_weights = sort(positions1, weights1)
+                assert np.array_equal(positions, ref_positions)
+                for weight, ref in zip(weights, ref_weights): assert np.array_equal(weight, ref)
+                # all second particles are received, at least once
+                positions, weights = sort(dpositions2, dweights2)
+                ref_positions = sort(positions2, weights2)[0]
+                assert np.isin(ref_positions[:, 0], positions[:, 0]).all()
+
+
+if __name__ == '__main__':
+
+    setup_logging()
+
+    test_gather_scatter()
+    test_domain_decompose()
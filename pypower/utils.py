@@ -11,6 +11,9 @@ import numpy as np
 
 logger = logging.getLogger('Utils')
 
+# Minimum array size to use numba kernels (if numba is available), to amortize compilation
+_numba_min_size = 2**16
+
 
 def exception_handler(exc_type, exc_value, exc_traceback):
     """Print exception with a logger."""
@@ -201,11 +204,26 @@ def _make_array(value, shape, dtype='f8'):
     return toret
 
 
+def _minmax_rows(array, blocksize=256):
+    # Return min and max of (N, k) array along the first axis.
+    # Such reductions are slow on C-contiguous arrays (strided), so first reduce blocks of rows, seen as contiguous (N // blocksize, blocksize * k) arrays
+    nrows = array.shape[0] // blocksize * blocksize
+    if array.ndim != 2 or not array.flags.c_contiguous or not nrows:
+        return array.min(axis=0), array.max(axis=0)
+    block = array[:nrows].reshape(-1, blocksize * array.shape[1])
+    amin, amax = block.min(axis=0).reshape(blocksize, -1).min(axis=0), block.max(axis=0).reshape(blocksize, -1).max(axis=0)
+    if nrows < array.shape[0]:
+        amin, amax = np.minimum(amin, array[nrows:].min(axis=0)), np.maximum(amax, array[nrows:].max(axis=0))
+    return amin, amax
+
+
 def _get_box(*positions):
     """Return minimal box containing input positions."""
     pos_min, pos_max = _make_array(np.inf, 3, dtype='f8'), _make_array(-np.inf, 3, dtype='f8')
     for position in positions:
-        if position.shape[0] > 0: pos_min, pos_max = np.min([pos_min, position.min(axis=0)], axis=0), np.max([pos_max, position.max(axis=0)], axis=0)
+        if position.shape[0] > 0:
+            amin, amax = _minmax_rows(position)
+            pos_min, pos_max = np.minimum(pos_min, amin), np.maximum(pos_max, amax)
     return pos_min, pos_max
 
 
@@ -308,6 +326,8 @@ def rebin(array, new_shape, statistic=np.sum):
 
 # Create a lookup table for set bits per byte
 _popcount_lookuptable = np.array([bin(i).count('1') for i in range(256)], dtype=np.int32)
+# numpy >= 2.0 provides popcount (using the dedicated CPU instruction, if any)
+_bitwise_count = getattr(np, 'bitwise_count', None)
 
 
 def popcount(*arrays):
@@ -317,8 +337,14 @@ def popcount(*arrays):
     """
     # if not np.issubdtype(array.dtype, np.unsignedinteger):
     #     raise ValueError('input array must be an unsigned int dtype')
-    toret = _popcount_lookuptable[arrays[0].view((np.uint8, (arrays[0].dtype.itemsize,)))].sum(axis=-1)
-    for array in arrays[1:]: toret += popcount(array)
+    def _popcount(array):
+        if _bitwise_count is not None and array.dtype.kind in 'iu':
+            # Hardware popcount; viewed as unsigned, as np.bitwise_count counts bits of the absolute value of signed integers
+            return _bitwise_count(array.view('u{:d}'.format(array.dtype.itemsize))).astype(np.int_)
+        return _popcount_lookuptable[array.view((np.uint8, (array.dtype.itemsize,)))].sum(axis=-1)
+
+    toret = _popcount(arrays[0])
+    for array in arrays[1:]: toret += _popcount(array)
     return toret
 
 